@@ -1,10 +1,25 @@
 from ml.model import WasteClassifier
+from ml.cache import CachedClassifier, PerceptualIndex
+from ml.loader import BackgroundClassifier
 from iot.mqtt_client import MQTTClient
+from iot.command_queue import CommandQueue
+import os
 
-# Initialize classifier and MQTT client
-classifier = WasteClassifier()
-mqtt_client = MQTTClient()
+def create_classifier():
+    classifier = WasteClassifier()
+    if os.getenv("PREDICTION_CACHE", "true").lower() == "true":
+        # Retried or resent uploads are answered from the prediction cache
+        perceptual = PerceptualIndex() if os.getenv("PERCEPTUAL_CACHE", "false").lower() == "true" else None
+        classifier = CachedClassifier(classifier, perceptual=perceptual)
+    return classifier
+
+# Initialize classifier and MQTT client; both are started by the app lifespan
+# so importing the app never blocks on TensorFlow or the broker
+classifier = BackgroundClassifier(create_classifier)
+mqtt_client = MQTTClient(connect=False)
+# Queued mode: commands for a busy bin wait for it instead of answering 409
+command_queue = CommandQueue(mqtt_client) if os.getenv("MQTT_COMMAND_QUEUE", "false").lower() == "true" else None
 
 # Class to index mappings
 CLASS_TO_INDEX = {'hazardous': 2, 'organic': 0, 'other': 3, 'recycle': 1}
-INDEX_TO_CLASS = {v: k for k, v in CLASS_TO_INDEX.items()}
\ No newline at end of file
+INDEX_TO_CLASS = {v: k for k, v in CLASS_TO_INDEX.items()}
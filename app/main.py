@@ -1,6 +1,10 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import healthcheck, bin_status, control_bin, predict, predict_iot
+from app.dependencies import classifier, mqtt_client, command_queue
+from app.metrics import MetricsMiddleware
+from app.tracing import TracingMiddleware
+from app.routers import healthcheck, bin_status, control_bin, commands, predict, predict_iot, metrics, admin
 from config.swagger import custom_openapi
 from dotenv import load_dotenv
 import uvicorn
@@ -8,10 +12,25 @@ import os
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Neither call blocks: the model loads on a background thread and the
+    # MQTT network thread connects on its own, so the port binds right away
+    classifier.start()
+    mqtt_client.connect_async()
+    if command_queue is not None:
+        command_queue.start()
+    yield
+    if command_queue is not None:
+        await command_queue.stop()
+    mqtt_client.disconnect()
+    classifier.close()
+
 app = FastAPI(
     title="Waste Classification API",
     summary="API for waste classification using machine learning and IoT integration",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -21,13 +40,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(healthcheck.router)
 app.include_router(bin_status.router)
 app.include_router(control_bin.router)
+app.include_router(commands.router)
 app.include_router(predict.router)
 app.include_router(predict_iot.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 # Set custom OpenAPI schema
 app.openapi = lambda: custom_openapi(app)
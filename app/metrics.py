@@ -0,0 +1,62 @@
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+from ml.model import STAGE_BUCKETS
+import os
+import time
+
+# The decode, preprocess and inference histograms live in ml.model, the
+# queue-depth gauge in ml.executor and the MQTT series in iot.mqtt_client
+
+UPLOAD_READ_SECONDS = Histogram(
+    "waste_classification_upload_read_seconds", "Time to receive and check an upload body", buckets=STAGE_BUCKETS)
+REQUESTS = Counter(
+    "waste_classification_requests_total", "HTTP requests by route and status code", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram(
+    "waste_classification_request_seconds", "HTTP request handling time by route", ["route"], buckets=STAGE_BUCKETS)
+PREDICTIONS = Counter(
+    "waste_classification_predictions_total", "Predictions returned by class", ["class"])
+
+class MetricsMiddleware:
+    """Count requests by route template and status code.
+
+    A plain ASGI middleware rather than BaseHTTPMiddleware: it only wraps
+    `send` to catch the status code, so the cost is a few microseconds per
+    request. The route template (e.g. /predict) is used instead of the raw
+    path so unknown URLs cannot blow up the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(route).observe(time.perf_counter() - start)
+            REQUESTS.labels(scope["method"], route, str(status)).inc()
+
+def render_metrics():
+    """Prometheus text exposition of every registered metric.
+
+    With PROMETHEUS_MULTIPROC_DIR set (python -m app.serve, process executor)
+    each process writes its samples there and they are aggregated at scrape
+    time, otherwise this process's registry is exported.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
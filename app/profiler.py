@@ -0,0 +1,79 @@
+"""Statistical sampling profiler for a live worker.
+
+A background thread snapshots the stack of every other thread with
+sys._current_frames() at a fixed interval and counts identical stacks. The
+result is in the collapsed-stack format read by flamegraph.pl, speedscope
+and similar tools: one line per stack, frames separated by ";" and rooted at
+the thread name, followed by the number of samples.
+
+Sampling only reads frames while holding the GIL for a few microseconds per
+thread; no thread is paused or traced, so requests keep being served while
+a profile runs.
+"""
+from collections import Counter
+import os
+import sys
+import threading
+import time
+
+def _frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    # Function start line rather than the current line, so one function is one frame
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+def _thread_label(name):
+    # uvicorn runs the event loop in the main thread
+    name = "event-loop" if name == "MainThread" else name
+    return name.replace(";", "_").replace(" ", "_")
+
+def sample_stacks(duration, interval=0.01):
+    """Sample every thread for `duration` seconds, return (Counter of collapsed stacks, samples taken)"""
+    own_ident = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + duration
+    next_sample = time.monotonic()
+    while next_sample < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            thread = _thread_label(names.get(ident, f"thread-{ident}"))
+            stacks[f"{thread};{_collapse(frame)}"] += 1
+        samples += 1
+        next_sample += interval
+        time.sleep(max(0.0, next_sample - time.monotonic()))
+    return stacks, samples
+
+def format_collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class SamplingProfiler:
+    """Runs one profile at a time on its own thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def profile(self, duration, interval=0.01):
+        """Block for `duration` seconds and return the collapsed stacks, or None if a profile is already running"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return sample_stacks(duration, interval)
+        finally:
+            self._lock.release()
+
+profiler = SamplingProfiler()
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from dotenv import load_dotenv
+from app.profiler import profiler, format_collapsed
+import asyncio
+import hmac
+import os
+import threading
+import time
+
+load_dotenv()
+
+router = APIRouter()
+
+# Admin routes are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+def check_admin(authorization):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+async def run_profile(seconds, interval):
+    # A dedicated thread, not the inference executor, so profiling never takes an inference worker
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def target():
+        try:
+            result = profiler.profile(seconds, interval)
+        except Exception as e:
+            loop.call_soon_threadsafe(future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(future.set_result, result)
+
+    threading.Thread(target=target, name="profiler", daemon=True).start()
+    return await future
+
+@router.get("/admin/profile")
+async def profile(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    authorization: str = Header(None),
+):
+    check_admin(authorization)
+    if seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {PROFILE_MAX_SECONDS:g}")
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    result = await run_profile(seconds, interval_ms / 1000)
+    if result is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    stacks, samples = result
+    filename = f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return Response(
+        content=format_collapsed(stacks),
+        media_type="text/plain",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(samples),
+            "X-Profile-Pid": str(os.getpid()),
+        },
+    )
@@ -7,4 +7,9 @@ router = APIRouter()
 async def get_bin_status():
     """Get current status of the waste bin system"""
     status = mqtt_client.get_bin_status()
-    return {"bin_status": status}
\ No newline at end of file
+    return {"bin_status": status, **mqtt_client.get_bin_states()}
+
+@router.get("/bin_latency")
+async def get_bin_latency():
+    """Actuation latency of recent bin commands, from publish to the device's acknowledgement"""
+    return mqtt_client.get_command_latencies()
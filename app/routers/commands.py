@@ -0,0 +1,12 @@
+from fastapi import APIRouter, HTTPException
+from app.dependencies import command_queue
+
+router = APIRouter()
+
+@router.get("/commands/{ticket_id}")
+async def get_command(ticket_id: str):
+    """Poll a bin command queued by /control_bin or /predict_iot"""
+    ticket = command_queue.get_ticket(ticket_id) if command_queue is not None else None
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Unknown command ticket")
+    return ticket.to_dict()
@@ -1,42 +1,62 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
 from app.schemas import BinControlRequest
-from app.dependencies import mqtt_client, INDEX_TO_CLASS
+from app.dependencies import mqtt_client, command_queue, INDEX_TO_CLASS
+from iot.command_queue import CommandQueueFull, CommandExpired
+from ml import tracing
 
 router = APIRouter()
 
 @router.post("/control_bin")
-async def control_bin(request: BinControlRequest):
+async def control_bin(request: BinControlRequest, wait: bool = False):
     try:
-        # Check if device is online
-        if not mqtt_client.is_device_online():
-            raise HTTPException(
-                status_code=503,
-                detail="ESP32 device is offline. Cannot control bin."
-            )
-        bin_index = request.bin_index
-        if bin_index < 0 or bin_index > 3:
-            raise HTTPException(status_code=400, detail="bin_index must be 0 to 3")
-            
-        # Check bin status before sending command
-        bin_status = mqtt_client.get_bin_status()
-        if bin_status == "busy":
-            raise HTTPException(
-                status_code=409,  
-                detail="Bin is currently busy. Please wait until it's available."
-            )
-        elif bin_status == "unknown":
-            raise HTTPException(
-                status_code=503, 
-                detail="Bin status is unknown. Please check the connection to the IoT device."
-            )
+        with tracing.stage("mqtt_status"):
+            # Check if device is online
+            if not mqtt_client.is_device_online():
+                raise HTTPException(
+                    status_code=503,
+                    detail="ESP32 device is offline. Cannot control bin."
+                )
+            bin_index = request.bin_index
+            if bin_index < 0 or bin_index > 3:
+                raise HTTPException(status_code=400, detail="bin_index must be 0 to 3")
+                
+            # Check bin status before sending command
+            bin_status = mqtt_client.get_bin_status(bin_index)
+            if bin_status == "busy" and command_queue is None:
+                raise HTTPException(
+                    status_code=409,  
+                    detail="Bin is currently busy. Please wait until it's available."
+                )
+            elif bin_status == "unknown":
+                raise HTTPException(
+                    status_code=503, 
+                    detail="Bin status is unknown. Please check the connection to the IoT device."
+                )
         
         # Get bin name from index
         bin_name = INDEX_TO_CLASS.get(bin_index, "unknown")
             
         # Send command via MQTT
-        mqtt_client.publish(bin_index)
+        if command_queue is None:
+            with tracing.stage("publish"):
+                mqtt_client.publish(bin_index)
+            return {"message": f"Opened bin {bin_name}", "bin_status": bin_status}
+
+        # Queued mode: sent now when the bin is free, else once it becomes free
+        with tracing.stage("publish"):
+            ticket = command_queue.submit(bin_index)
+        if not ticket.sent:
+            if not wait:
+                return JSONResponse(status_code=202, content={"message": f"Queued bin {bin_name}", **ticket.to_dict()})
+            with tracing.stage("queue"):
+                await command_queue.wait(ticket)
         return {"message": f"Opened bin {bin_name}", "bin_status": bin_status}
     except HTTPException:
         raise
+    except CommandQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Bin command queue is full: {e}. Please retry later.")
+    except CommandExpired as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
\ No newline at end of file
@@ -7,6 +7,7 @@ router = APIRouter()
 async def healthcheck():
     return {
         "model_loaded": classifier.model is not None,
+        "model_status": classifier.status,
         "mqtt_connected": mqtt_client.connected,
         "device_status": mqtt_client.esp32_status
     }
\ No newline at end of file
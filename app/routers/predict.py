@@ -1,22 +1,70 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from ml.executor import InferenceQueueFull
+from ml.loader import ModelNotReady
 from app.dependencies import classifier
+from app.metrics import PREDICTIONS
+from ml import tracing
+from app.uploads import read_image_body, read_image_upload, read_image_uploads
+import os
 
 router = APIRouter()
 
+# Maximum number of images accepted by /predict/batch
+MAX_BATCH_FILES = int(os.getenv("PREDICT_BATCH_MAX_FILES", 32))
+
 @router.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request):
+    # Stream the upload: size cap and image check before the body is buffered
+    image_data = await read_image_upload(request, "file")
+    return await classify(image_data)
+
+@router.post("/predict/raw")
+async def predict_raw(request: Request):
+    # The image is the whole body, no multipart envelope to encode or parse
+    image_data = await read_image_body(request)
+    return await classify(image_data)
+
+async def classify(image_data):
     try:
-        # Check if file is an image
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Uploaded file must be image (.png, .jpg)")
-            
-        # Read file data
-        image_data = await file.read()
-            
-        # Predict
-        predicted_class, probabilities = classifier.predict(image_data)
+        # Predict (queue wait, cache lookup, decode and inference)
+        with tracing.stage("predict"):
+            predicted_class, probabilities = await classifier.predict_async(image_data)
+        PREDICTIONS.labels(predicted_class).inc()
         return {
             "class": predicted_class
         }
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="Inference queue is full. Please retry later.")
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        # Malformed upload, e.g. a raw tensor with a broken header
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@router.post("/predict/batch")
+async def predict_batch(request: Request):
+    # Stream the uploads: file count, size cap and image checks before the body is buffered
+    files = await read_image_uploads(request, "files", max_files=MAX_BATCH_FILES)
+    try:
+        # Predict all images with one forward pass
+        with tracing.stage("predict"):
+            results = await classifier.predict_batch_async([file.data() for file in files])
+        for predicted_class, _ in results:
+            PREDICTIONS.labels(predicted_class).inc()
+        return {
+            "predictions": [
+                {"filename": file.filename, "class": predicted_class, "probabilities": probabilities}
+                for file, (predicted_class, probabilities) in zip(files, results)
+            ]
+        }
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="Inference queue is full. Please retry later.")
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        # Malformed upload, e.g. a raw tensor with a broken header
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
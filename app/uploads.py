@@ -0,0 +1,230 @@
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, MultipartState, parse_options_header
+from ml.model import RAW_TENSOR_MAGIC
+from app.metrics import UPLOAD_READ_SECONDS
+from ml import tracing
+from dotenv import load_dotenv
+import os
+import time
+
+load_dotenv()
+
+# Largest accepted image, checked while the body streams in
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+
+# Leading bytes of every accepted format (WebP is RIFF????WEBP, checked separately)
+IMAGE_SIGNATURES = (
+    b"\xff\xd8\xff",          # JPEG
+    b"\x89PNG\r\n\x1a\n",     # PNG
+    b"BM",                    # BMP
+    RAW_TENSOR_MAGIC,         # Pre-decoded uint8 HWC tensor (ml.model.encode_raw_tensor)
+)
+SNIFF_BYTES = 12
+
+# Content types accepted by the raw-body routes, the bytes are sniffed either way
+RAW_CONTENT_TYPES = (b"application/octet-stream", b"image/jpeg", b"image/png", b"image/webp", b"image/bmp")
+
+def is_image(head):
+    """Whether the first bytes of an upload belong to a supported image format"""
+    if head.startswith(IMAGE_SIGNATURES):
+        return True
+    return head[:4] == b"RIFF" and head[8:12] == b"WEBP"
+
+class ImagePart:
+    """One file field of a streamed multipart body"""
+
+    def __init__(self, name, filename):
+        self.name = name
+        self.filename = filename
+        self.chunks = []
+        self.size = 0
+        self.checked = False
+
+    def data(self):
+        # The only copy of the upload: the chunk views are joined once into the decoder's buffer
+        return b"".join(self.chunks)
+
+class MultipartImageReader:
+    """Stream a multipart body and collect the image parts of one field.
+
+    Each part is capped at `max_bytes` while it is read and its magic bytes
+    are checked as soon as the first few arrive, so an oversized or non-image
+    upload is rejected before the rest of the body is received. Other fields
+    are skipped without buffering.
+    """
+
+    def __init__(self, boundary, field, max_bytes=None, max_files=1):
+        self.field = field
+        self.max_bytes = max_bytes or MAX_UPLOAD_BYTES
+        self.max_files = max_files
+        self.parts = []
+        self._part = None
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part = None
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        if options.get(b"name", b"").decode() != self.field:
+            return
+        if len(self.parts) >= self.max_files:
+            raise HTTPException(status_code=400, detail=f"Too many files, at most {self.max_files} images per batch")
+        filename = options.get(b"filename", b"").decode() or None
+        self._part = ImagePart(self.field, filename)
+        self.parts.append(self._part)
+
+    def _on_part_data(self, data, start, end):
+        part = self._part
+        if part is None:
+            return
+        part.size += end - start
+        if part.size > self.max_bytes:
+            raise HTTPException(status_code=413, detail=f"Uploaded file is too large, at most {self.max_bytes} bytes")
+        # A view into the received chunk, nothing is copied until data()
+        part.chunks.append(memoryview(data)[start:end])
+        if not part.checked and part.size >= SNIFF_BYTES:
+            self._check(part)
+
+    def _on_part_end(self):
+        if self._part is not None and not self._part.checked:
+            self._check(self._part)
+        self._part = None
+
+    @staticmethod
+    def _check(part):
+        part.checked = True
+        # An empty part has no chunks and fails the check like any other non-image
+        if part.chunks and len(part.chunks[0]) >= SNIFF_BYTES:
+            head = bytes(part.chunks[0][:SNIFF_BYTES])
+        else:
+            head = part.data()[:SNIFF_BYTES]
+        if not is_image(head):
+            suffix = f": {part.filename}" if part.filename else ""
+            raise HTTPException(status_code=400, detail=f"Uploaded file must be image (.png, .jpg){suffix}")
+
+    def feed(self, chunk):
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+
+    def finish(self):
+        """Check that the body ended with its closing boundary and every part was sniffed"""
+        # finalize() does not validate anything itself
+        self._parser.finalize()
+        # A part whose end was never seen can be shorter than SNIFF_BYTES and still unchecked
+        for part in self.parts:
+            if not part.checked:
+                self._check(part)
+        if self._parser.state != MultipartState.END:
+            raise HTTPException(status_code=400, detail="Malformed multipart body: missing the closing boundary")
+
+async def read_image_uploads(request: Request, field="files", max_files=1, max_bytes=None):
+    """Stream the multipart body of `request` and return the image parts of `field`.
+
+    Raises 413 for a part (or a declared Content-Length) over the size cap,
+    400 for a part that is not a supported image (empty parts included) or a
+    malformed body and the usual 422 when the field is missing.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise _missing(field)
+
+    # Room for the files plus form overhead. Reject from the headers alone when
+    # the client declares more, and stop reading a chunked body that grows past it
+    max_body = max_files * max_bytes + 64 * 1024
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_body:
+        raise HTTPException(status_code=413, detail=f"Uploaded file is too large, at most {max_bytes} bytes")
+
+    reader = MultipartImageReader(boundary, field, max_bytes, max_files)
+    received = 0
+    start = time.perf_counter()
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_body:
+            raise HTTPException(status_code=413, detail=f"Uploaded file is too large, at most {max_bytes} bytes")
+        reader.feed(chunk)
+    reader.finish()
+    if not reader.parts:
+        raise _missing(field)
+    elapsed = time.perf_counter() - start
+    UPLOAD_READ_SECONDS.observe(elapsed)
+    tracing.record("upload", start, elapsed)
+    return reader.parts
+
+async def read_image_upload(request: Request, field="file", max_bytes=None):
+    """Stream a single image upload and return its bytes"""
+    parts = await read_image_uploads(request, field, max_files=1, max_bytes=max_bytes)
+    return parts[0].data()
+
+async def read_image_body(request: Request, max_bytes=None):
+    """Read a raw image request body (no multipart envelope) and return its bytes.
+
+    The chunks are kept as received and joined once, so the body goes straight
+    to the decoder. Same checks as the multipart routes: 413 over the size cap
+    (from Content-Length before reading, or while streaming), 400 when the
+    first bytes are not an image, plus 415 for a form or JSON body.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    content_type, _ = parse_options_header(request.headers.get("content-type"))
+    if content_type and content_type not in RAW_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Send the image as the request body with Content-Type application/octet-stream or image/*")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Uploaded file is too large, at most {max_bytes} bytes")
+
+    chunks = []
+    size = 0
+    start = time.perf_counter()
+    async for chunk in request.stream():
+        if not chunk:
+            continue
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Uploaded file is too large, at most {max_bytes} bytes")
+        chunks.append(chunk)
+        if size >= SNIFF_BYTES and len(chunks) == 1 and not is_image(chunk[:SNIFF_BYTES]):
+            raise HTTPException(status_code=400, detail="Uploaded file must be image (.png, .jpg)")
+    if not chunks:
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    image_data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    if not is_image(image_data[:SNIFF_BYTES]):
+        raise HTTPException(status_code=400, detail="Uploaded file must be image (.png, .jpg)")
+    elapsed = time.perf_counter() - start
+    UPLOAD_READ_SECONDS.observe(elapsed)
+    tracing.record("upload", start, elapsed)
+    return image_data
+
+def _missing(field):
+    # Same error FastAPI reports for a missing File(...) parameter
+    return RequestValidationError([{"type": "missing", "loc": ("body", field), "msg": "Field required", "input": None}])
@@ -0,0 +1,75 @@
+"""Compare cold-start model loading: keras load_model on .keras vs memory-mapped weights (ml.weights).
+
+Every run loads the model in a fresh interpreter, so nothing is reused except
+the OS page cache. Run with a cold page cache (e.g. right after boot or
+`echo 3 > /proc/sys/vm/drop_caches`) to see the disk-bound numbers.
+
+Usage:
+    python -m benchmarks.cold_start --model ml/model/model.keras --mapped ml/model/model.json --runs 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+
+def rss_bytes():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def child(model_path):
+    # Runs in the fresh interpreter: time the TensorFlow import and the model load separately
+    start = time.perf_counter()
+    import tensorflow  # noqa: F401
+    imported = time.perf_counter()
+    from ml.model import KerasBackend
+    backend = KerasBackend(model_path, compiled=False)
+    loaded = time.perf_counter()
+    backend.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+    first_predict = time.perf_counter()
+    print(json.dumps({
+        "import_s": imported - start,
+        "load_s": loaded - imported,
+        "first_predict_s": first_predict - loaded,
+        "rss_mb": rss_bytes() / 2**20,
+    }))
+
+def run_child(model_path):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child", model_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="ml/model/model.keras")
+    parser.add_argument("--mapped", default="ml/model/model.json", help="Manifest written by python -m ml.weights")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    results = {}
+    for name, model_path in (("load_model", args.model), ("mmap", args.mapped)):
+        samples = [run_child(model_path) for _ in range(args.runs)]
+        results[name] = {key: float(np.median([s[key] for s in samples])) for key in samples[0]}
+
+    print(f"{'variant':<12}{'import s':>10}{'load s':>10}{'1st predict s':>15}{'rss MB':>10}  (median of {args.runs})")
+    for name, r in results.items():
+        print(f"{name:<12}{r['import_s']:>10.2f}{r['load_s']:>10.2f}{r['first_predict_s']:>15.2f}{r['rss_mb']:>10.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
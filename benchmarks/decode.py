@@ -0,0 +1,70 @@
+"""Compare full-resolution decode + resize (keras load_img) with each installed decoder backend.
+
+Usage:
+    python -m benchmarks.decode --runs 30
+"""
+import argparse
+import io
+import json
+import time
+import numpy as np
+from PIL import Image
+from ml.model import DECODERS
+
+# (name, width, height, format)
+SAMPLES = [
+    ("small_jpeg", 320, 240, "JPEG"),
+    ("medium_jpeg", 1280, 960, "JPEG"),
+    ("large_jpeg", 4000, 3000, "JPEG"),
+    ("medium_png", 1280, 960, "PNG"),
+]
+
+def make_sample(width, height, format):
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    pixels = np.concatenate([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+    pixels = np.clip(pixels + rng.normal(0, 8, pixels.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, format=format, quality=90)
+    return buffer.getvalue()
+
+def full_decode(image_data, target_size=(224, 224)):
+    # What keras.preprocessing.image.load_img does: decode everything, then resize
+    img = Image.open(io.BytesIO(image_data)).convert("RGB")
+    return np.asarray(img.resize(target_size, Image.NEAREST), dtype=np.uint8)
+
+def time_ms(fn, image_data, runs):
+    fn(image_data)  # warm-up
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(image_data)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples) * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    decoders = {name: decoder() for name, decoder in DECODERS.items() if decoder.available()}
+    results = {}
+    header = "".join(f"{name:>12}" for name in ["full decode", *decoders])
+    print(f"{'sample':<14}{'size':>12}{header}  (median ms)")
+    for name, width, height, format in SAMPLES:
+        image_data = make_sample(width, height, format)
+        timings = {"full_decode": time_ms(full_decode, image_data, args.runs)}
+        for decoder_name, decoder in decoders.items():
+            timings[decoder_name] = time_ms(decoder.decode, image_data, args.runs)
+        results[name] = {"bytes": len(image_data), "median_ms": timings}
+        row = "".join(f"{elapsed:>12.2f}" for elapsed in timings.values())
+        print(f"{name:<14}{f'{width}x{height}':>12}{row}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
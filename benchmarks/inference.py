@@ -0,0 +1,66 @@
+"""Compare keras Model.predict with the compiled and TFLite inference paths of WasteClassifier.
+
+Usage:
+    python -m benchmarks.inference --model ml/model/model.keras --tflite ml/model/model.tflite --runs 100
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from ml.model import WasteClassifier
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+def bench_infer(classifier, batch_size, runs):
+    batch = np.random.uniform(-120, 150, size=(batch_size, 224, 224, 3)).astype(np.float32)
+    # First call separately: this is what the first request pays without warm-up
+    start = time.perf_counter()
+    classifier._predict_batch(batch)
+    first_call = time.perf_counter() - start
+
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        classifier._predict_batch(batch)
+        samples.append(time.perf_counter() - start)
+    return {
+        "first_call_ms": first_call * 1000,
+        "p50_ms": percentile_ms(samples, 50),
+        "p95_ms": percentile_ms(samples, 95),
+        "mean_ms": float(np.mean(samples) * 1000),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="ml/model/model.keras")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--tflite", default="ml/model/model.tflite", help="Also benchmark this .tflite file if it exists")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    variants = {
+        "keras_predict": dict(model_path=args.model, backend="keras", compiled=False),
+        "compiled": dict(model_path=args.model, backend="keras", compiled=True, jit_compile=False),
+        "compiled_xla": dict(model_path=args.model, backend="keras", compiled=True, jit_compile=True),
+    }
+    if os.path.exists(args.tflite):
+        variants["tflite"] = dict(model_path=args.tflite, backend="tflite")
+    results = {}
+    for name, options in variants.items():
+        classifier = WasteClassifier(batching=False, warmup=False, **options)
+        results[name] = bench_infer(classifier, args.batch_size, args.runs)
+        classifier.close()
+
+    print(f"{'variant':<16}{'first call':>12}{'p50':>10}{'p95':>10}{'mean':>10}  (ms, batch={args.batch_size})")
+    for name, r in results.items():
+        print(f"{name:<16}{r['first_call_ms']:>12.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['mean_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"batch_size": args.batch_size, "runs": args.runs, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
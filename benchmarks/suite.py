@@ -0,0 +1,287 @@
+"""Benchmark suite: preprocessing, prediction and endpoint round trips, with baseline comparison.
+
+Stages:
+    preprocess  WasteClassifier.preprocess_image on small/medium/large JPEG and PNG
+    predict     WasteClassifier.predict with a stub model, and with the real model when --model exists
+    endpoints   /predict, /predict_iot and /control_bin through the ASGI app, with an in-process MQTT stand-in
+
+Usage:
+    python -m benchmarks.suite run --json benchmarks/results.json
+    python -m benchmarks.suite run --stages preprocess,endpoints --runs 20 --json current.json
+    python -m benchmarks.suite compare benchmarks/baseline.json current.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+import httpx
+import numpy as np
+import paho.mqtt.client as mqtt
+from benchmarks.decode import make_sample
+from iot.mqtt_client import MQTTClient
+from ml.model import InferenceBackend, WasteClassifier, select_decoder
+
+STAGES = ("preprocess", "predict", "endpoints")
+
+# (name, width, height, format)
+SAMPLES = [
+    ("small_jpeg", 320, 240, "JPEG"),
+    ("medium_jpeg", 1280, 960, "JPEG"),
+    ("large_jpeg", 4000, 3000, "JPEG"),
+    ("small_png", 320, 240, "PNG"),
+    ("medium_png", 1280, 960, "PNG"),
+    ("large_png", 4000, 3000, "PNG"),
+]
+
+class StubBackend(InferenceBackend):
+    """Constant-output model, so predict measures everything except the forward pass"""
+    name = "stub"
+    model = "stub"
+
+    def predict(self, img_batch):
+        return np.tile(np.array([[0.05, 0.1, 0.05, 0.8]], dtype=np.float32), (len(img_batch), 1))
+
+def stub_classifier(decoder):
+    with patch("ml.model.load_backend", return_value=(StubBackend(), "stub")):
+        return WasteClassifier(batching=False, warmup=False, decoder=decoder)
+
+class LoopbackMQTT:
+    """In-process stand-in for the paho client and the broker.
+
+    Publishes are recorded instead of sent, and the ESP32 side is simulated
+    by delivering status messages straight to the MQTTClient callbacks. The
+    simulated device finishes every command at once, so the next request
+    finds its bin idle again.
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.published = []
+
+    def connect(self, host, port=1883, keepalive=60):
+        self.owner.on_connect(self, None, {}, 0)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def subscribe(self, topic):
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+        command_id = json.loads(payload)["id"] if payload.startswith("{") else None
+        self.device_message("servo/status", json.dumps({"status": "closed", "id": command_id}))
+        return SimpleNamespace(rc=mqtt.MQTT_ERR_SUCCESS)
+
+    def device_message(self, topic, payload):
+        self.owner.on_message(self, None, SimpleNamespace(topic=f"{self.owner.base_topic}/{topic}", payload=payload.encode()))
+
+def loopback_mqtt_client():
+    client = MQTTClient(connect=False)
+    client.base_topic = "bench"
+    # The simulated firmware parses JSON commands and echoes their id
+    client.command_format = "json"
+    client.client = LoopbackMQTT(client)
+    client.connect()
+    client.client.device_message("status", "online")
+    client.client.device_message("servo/status", "available")
+    return client
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "mean_ms": float(samples.mean()),
+        "runs": len(samples),
+    }
+
+def time_calls(fn, runs, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def bench_preprocess(runs, images, decoder):
+    classifier = stub_classifier(decoder)
+    results = {}
+    for name, image_data in images.items():
+        results[f"preprocess/{name}"] = time_calls(lambda: classifier.preprocess_image(image_data), runs)
+    classifier.close()
+    return results
+
+def bench_predict(runs, images, decoder, model_path=None):
+    image_data = images["medium_jpeg"]
+    classifier = stub_classifier(decoder)
+    results = {"predict/stub/medium_jpeg": time_calls(lambda: classifier.predict(image_data), runs)}
+    classifier.close()
+    if model_path and os.path.exists(model_path):
+        classifier = WasteClassifier(model_path, batching=False, decoder=decoder)
+        results["predict/model/medium_jpeg"] = time_calls(lambda: classifier.predict(image_data), runs)
+        classifier.close()
+    else:
+        print(f"[INFO] Skipping predict with the real model: {model_path} not found")
+    return results
+
+async def bench_endpoints_async(runs, images, decoder):
+    from app.main import app
+    image_data = images["medium_jpeg"]
+    classifier = stub_classifier(decoder)
+    mqtt_client = loopback_mqtt_client()
+    requests = {
+        "endpoint/predict": lambda client: client.post("/predict", files={"file": ("frame.jpg", image_data, "image/jpeg")}),
+        "endpoint/predict_iot": lambda client: client.post("/predict_iot", files={"file": ("frame.jpg", image_data, "image/jpeg")}),
+        "endpoint/control_bin": lambda client: client.post("/control_bin", json={"bin_index": 1}),
+    }
+    results = {}
+    with patch("app.routers.predict.classifier", classifier), \
+         patch("app.routers.predict_iot.classifier", classifier), \
+         patch("app.routers.predict_iot.mqtt_client", mqtt_client), \
+         patch("app.routers.control_bin.mqtt_client", mqtt_client):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+            for name, send in requests.items():
+                for _ in range(3):  # warm-up
+                    (await send(client)).raise_for_status()
+                samples = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    response = await send(client)
+                    samples.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                results[name] = summarize(samples)
+    classifier.close()
+    return results
+
+def bench_endpoints(runs, images, decoder):
+    return asyncio.run(bench_endpoints_async(runs, images, decoder))
+
+def run(args):
+    stages = args.stages.split(",")
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages {sorted(unknown)}, expected some of {list(STAGES)}")
+
+    print("[INFO] Encoding sample images...")
+    images = {name: make_sample(width, height, format) for name, width, height, format in SAMPLES}
+    # One decoder for every stage: with `auto` the pick could change between stages and runs
+    decoder = select_decoder(args.decoder)
+    results = {}
+    if "preprocess" in stages:
+        results.update(bench_preprocess(args.runs, images, decoder))
+    if "predict" in stages:
+        results.update(bench_predict(args.runs, images, decoder, args.model))
+    if "endpoints" in stages:
+        results.update(bench_endpoints(args.runs, images, decoder))
+
+    print(f"{'benchmark':<32}{'p50':>10}{'p95':>10}{'mean':>10}  (ms)")
+    for name, r in results.items():
+        print(f"{name:<32}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['mean_ms']:>10.2f}")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "runs": args.runs,
+            "decoder": decoder.name,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def compare_results(baseline, current, metric="p50_ms", threshold=0.15, min_delta_ms=0.05):
+    """Compare two result dicts; return rows of (name, baseline, current, change, status).
+
+    A benchmark regresses when `metric` grew by more than `threshold` (relative)
+    and by more than `min_delta_ms`, so sub-millisecond noise is not flagged.
+    """
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        if name not in current:
+            rows.append((name, baseline[name][metric], None, None, "missing"))
+            continue
+        if name not in baseline:
+            rows.append((name, None, current[name][metric], None, "new"))
+            continue
+        before, after = baseline[name][metric], current[name][metric]
+        change = (after - before) / before if before else 0.0
+        if change > threshold and after - before > min_delta_ms:
+            status = "REGRESSION"
+        elif change < -threshold and before - after > min_delta_ms:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((name, before, after, change, status))
+    return rows
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for key in ("decoder", "machine", "cpu_count"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"[WARN] {key} differs: baseline {baseline['meta'].get(key)}, current {current['meta'].get(key)}")
+    baseline, current = baseline["results"], current["results"]
+    rows = compare_results(baseline, current, args.metric, args.threshold, args.min_delta_ms)
+
+    print(f"{'benchmark':<32}{'baseline':>10}{'current':>10}{'change':>9}  {args.metric}")
+    for name, before, after, change, status in rows:
+        before = f"{before:.2f}" if before is not None else "-"
+        after = f"{after:.2f}" if after is not None else "-"
+        change = f"{change:+.0%}" if change is not None else "-"
+        print(f"{name:<32}{before:>10}{after:>10}{change:>9}  {status}")
+
+    regressions = [row[0] for row in rows if row[4] == "REGRESSION"]
+    if regressions:
+        print(f"[ERROR] {len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("[INFO] No regressions")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {','.join(STAGES)}")
+    run_parser.add_argument("--runs", type=int, default=50)
+    run_parser.add_argument("--model", default=os.getenv("MODEL_PATH", "ml/model/model.keras"),
+                            help="Real model for the predict stage, skipped when the file does not exist")
+    run_parser.add_argument("--decoder", default=None, help="Image decoder (default: IMAGE_DECODER or auto); compare runs with the same one")
+    run_parser.add_argument("--json", help="Write results to this JSON file")
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--metric", default="p50_ms", choices=["p50_ms", "p95_ms", "mean_ms"])
+    compare_parser.add_argument("--threshold", type=float, default=0.15, help="Relative slowdown that counts as a regression")
+    compare_parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Ignore absolute changes below this")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+if __name__ == "__main__":
+    main()
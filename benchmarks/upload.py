@@ -0,0 +1,75 @@
+"""Compare the per-request overhead of multipart /predict with raw-body /predict/raw.
+
+The app runs in-process behind httpx's ASGI transport with the classifier
+replaced by a stub, so the timings only cover building the request, the
+upload parsing and the routing, not decoding or inference.
+
+Usage:
+    python -m benchmarks.upload --runs 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from unittest.mock import patch
+import httpx
+import numpy as np
+from benchmarks.decode import SAMPLES, make_sample
+
+class StubClassifier:
+    async def predict_async(self, image_data):
+        return "recycle", {"organic": 5.2, "recycle": 85.1, "hazardous": 4.3, "other": 5.4}
+
+def multipart_request(client, image_data):
+    return client.build_request("POST", "/predict", files={"file": ("frame.jpg", image_data, "image/jpeg")})
+
+def raw_request(client, image_data):
+    return client.build_request("POST", "/predict/raw", content=image_data, headers={"Content-Type": "image/jpeg"})
+
+async def time_us(client, build, image_data, runs):
+    for _ in range(10):  # warm-up
+        (await client.send(build(client, image_data))).raise_for_status()
+    samples = []
+    for _ in range(runs):
+        # Building the request is timed too, encoding the form is part of the overhead
+        start = time.perf_counter()
+        response = await client.send(build(client, image_data))
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return float(np.median(samples) * 1e6)
+
+async def run(runs):
+    from app.main import app
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        with patch("app.routers.predict.classifier", StubClassifier()):
+            print(f"{'sample':<14}{'bytes':>10}{'multipart us':>14}{'raw us':>10}{'saved us':>10}{'overhead B':>12}  (median)")
+            for name, width, height, format in SAMPLES:
+                image_data = make_sample(width, height, format)
+                multipart_us = await time_us(client, multipart_request, image_data, runs)
+                raw_us = await time_us(client, raw_request, image_data, runs)
+                overhead = len(multipart_request(client, image_data).read()) - len(image_data)
+                results[name] = {
+                    "bytes": len(image_data),
+                    "multipart_us": multipart_us,
+                    "raw_us": raw_us,
+                    "multipart_overhead_bytes": overhead,
+                }
+                print(f"{name:<14}{len(image_data):>10}{multipart_us:>14.0f}{raw_us:>10.0f}{multipart_us - raw_us:>10.0f}{overhead:>12}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.runs))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
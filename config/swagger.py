@@ -13,13 +13,17 @@ def custom_openapi(app):
 - **Health Check**: Verify model and MQTT status
 - **Bin Control**: Open/close bins via MQTT
 - **Prediction**: Predict waste type from image and auto-open bins
+- **Batch Prediction**: Classify many images with one request and one forward pass
 
 ### ⚠️ Error Codes
 - 400: Invalid input (e.g., image type, bin index)
 - 409: Bin is busy
+- 413: Uploaded file too large
+- 415: Raw-body route called with a form or JSON body
 - 422: Missing required fields
 - 500: Internal server error (e.g., model or MQTT failure)
-- 503: IoT device unavailable or unknown status
+- 503: IoT device unavailable, unknown status, model still loading, inference queue full, or bin command queue full
+- 504: Queued bin command expired while the caller waited (`?wait=true`)
 """,
         routes=app.routes,
     )
@@ -28,15 +32,67 @@ def custom_openapi(app):
         {"name": "Health", "description": "System and connectivity checks"},
         {"name": "Bin Management", "description": "Control and monitor bin status"},
         {"name": "Prediction", "description": "Classify waste images using ML model"},
+        {"name": "Admin", "description": "Operator tools, enabled by ADMIN_TOKEN"},
     ]
 
     for path, methods in openapi_schema["paths"].items():
         for method, operation in methods.items():
-            if path == "/healthcheck" and method == "get":
+            if path == "/admin/profile" and method == "get":
+                operation.update({
+                    "tags": ["Admin"],
+                    "summary": "Profile this worker",
+                    "description": "Samples the stacks of every thread of the worker that answers (event loop, MQTT network thread, inference threads) for `seconds` and returns them in the collapsed-stack format used by flamegraph.pl and speedscope. Requests keep being served while it runs. Requires `Authorization: Bearer <ADMIN_TOKEN>`.",
+                    "responses": {
+                        "200": {
+                            "description": "Collapsed stacks, one line per stack with its sample count",
+                            "content": {
+                                "text/plain": {
+                                    "example": "inference_0;Thread._bootstrap (threading.py:988);...;WasteClassifier.predict (model.py:812) 412\n"
+                                }
+                            }
+                        },
+                        "401": {
+                            "description": "Missing or invalid admin token",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Invalid admin token"}
+                                }
+                            }
+                        },
+                        "404": {
+                            "description": "Admin routes disabled (ADMIN_TOKEN not set)"
+                        },
+                        "409": {
+                            "description": "Another profile is running",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "A profile is already running"}
+                                }
+                            }
+                        }
+                    }
+                })
+            elif path == "/metrics" and method == "get":
+                operation.update({
+                    "tags": ["Health"],
+                    "summary": "Prometheus metrics",
+                    "description": "Per-stage latency histograms (upload read, decode, preprocess, inference, MQTT publish), request counts by route and status code, predicted-class counters, inference queue depth and MQTT message rate and handling time, in the Prometheus text format.",
+                    "responses": {
+                        "200": {
+                            "description": "Metrics in the Prometheus text exposition format",
+                            "content": {
+                                "text/plain": {
+                                    "example": "waste_classification_requests_total{method=\"POST\",route=\"/predict\",status=\"200\"} 42.0\nwaste_classification_inference_queue_depth 0.0\n"
+                                }
+                            }
+                        }
+                    }
+                })
+            elif path == "/healthcheck" and method == "get":
                 operation.update({
                     "tags": ["Health"],
                     "summary": "Check system health",
-                    "description": "Returns the ML model load status, MQTT connection, and ESP32 device state.",
+                    "description": "Returns the ML model load status (loading, ready or failed), MQTT connection, and ESP32 device state.",
                     "responses": {
                         "200": {
                             "description": "System health status",
@@ -47,14 +103,25 @@ def custom_openapi(app):
                                             "summary": "All systems operational",
                                             "value": {
                                                 "model_loaded": True,
+                                                "model_status": "ready",
+                                                "mqtt_connected": True,
+                                                "device_status": "online"
+                                            }
+                                        },
+                                        "model_loading": {
+                                            "summary": "Model still loading after startup",
+                                            "value": {
+                                                "model_loaded": False,
+                                                "model_status": "loading",
                                                 "mqtt_connected": True,
                                                 "device_status": "online"
                                             }
                                         },
                                         "model_not_loaded": {
-                                            "summary": "Model not loaded",
+                                            "summary": "Model failed to load",
                                             "value": {
                                                 "model_loaded": False,
+                                                "model_status": "failed",
                                                 "mqtt_connected": True,
                                                 "device_status": "online"
                                             }
@@ -63,6 +130,7 @@ def custom_openapi(app):
                                             "summary": "MQTT disconnected",
                                             "value": {
                                                 "model_loaded": True,
+                                                "model_status": "ready",
                                                 "mqtt_connected": False,
                                                 "device_status": "online"
                                             }
@@ -71,6 +139,7 @@ def custom_openapi(app):
                                             "summary": "Device offline",
                                             "value": {
                                                 "model_loaded": True,
+                                                "model_status": "ready",
                                                 "mqtt_connected": True,
                                                 "device_status": "offline"
                                             }
@@ -79,6 +148,7 @@ def custom_openapi(app):
                                             "summary": "All systems down",
                                             "value": {
                                                 "model_loaded": False,
+                                                "model_status": "failed",
                                                 "mqtt_connected": False,
                                                 "device_status": "unknown"
                                             }
@@ -93,7 +163,12 @@ def custom_openapi(app):
                 operation.update({
                     "tags": ["Bin Management"],
                     "summary": "Get bin status",
-                    "description": "Returns current bin status: OK, busy, or unknown.",
+                    "description": (
+                        "Returns current bin status: OK when every bin is idle, busy while one is mid-cycle, "
+                        "or unknown. `bins` has the state of each bin (idle, commanded, opening, open, closing) "
+                        "and the seconds it has been in it; `device_state` is a cycle the device reported "
+                        "without naming a bin."
+                    ),
                     "responses": {
                         "200": {
                             "description": "Bin status retrieved",
@@ -102,15 +177,23 @@ def custom_openapi(app):
                                     "examples": {
                                         "available": {
                                             "summary": "Bin available",
-                                            "value": {"bin_status": "OK"}
+                                            "value": {
+                                                "bin_status": "OK",
+                                                "device_state": "idle",
+                                                "bins": {"1": {"state": "idle", "seconds": None, "command_id": None}}
+                                            }
                                         },
                                         "busy": {
                                             "summary": "Bin busy",
-                                            "value": {"bin_status": "busy"}
+                                            "value": {
+                                                "bin_status": "busy",
+                                                "device_state": "idle",
+                                                "bins": {"1": {"state": "open", "seconds": 0.84, "command_id": "3f2a9c1e7b04"}}
+                                            }
                                         },
                                         "unknown": {
                                             "summary": "Bin status unknown",
-                                            "value": {"bin_status": "unknown"}
+                                            "value": {"bin_status": "unknown", "device_state": "idle", "bins": {}}
                                         }
                                     }
                                 }
@@ -126,11 +209,56 @@ def custom_openapi(app):
                         }
                     }
                 })
+            elif path == "/bin_latency" and method == "get":
+                operation.update({
+                    "tags": ["Bin Management"],
+                    "summary": "Get bin actuation latency",
+                    "description": (
+                        "Recent bin commands with the time from publishing each command to the device's "
+                        "acknowledgement on servo/status. Commands not acknowledged within MQTT_ACK_TIMEOUT "
+                        "are listed as timed out."
+                    ),
+                    "responses": {
+                        "200": {
+                            "description": "Recent command latencies",
+                            "content": {
+                                "application/json": {
+                                    "example": {
+                                        "device": "waste/bin",
+                                        "ack_timeout_s": 5.0,
+                                        "pending": [],
+                                        "recent": [
+                                            {
+                                                "id": "3f2a9c1e7b04",
+                                                "bin_index": 1,
+                                                "published_at": 1760601600.12,
+                                                "status": "busy",
+                                                "latency_ms": 182.4,
+                                                "timed_out": False
+                                            }
+                                        ],
+                                        "summary": {
+                                            "acknowledged": 1,
+                                            "timeouts": 0,
+                                            "p50_ms": 182.4,
+                                            "p95_ms": 182.4,
+                                            "max_ms": 182.4
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                })
             elif path == "/control_bin" and method == "post":
                 operation.update({
                     "tags": ["Bin Management"],
                     "summary": "Control specific bin",
-                    "description": "Opens bin by index (0: organic, 1: recycle, 2: hazardous, 3: other).",
+                    "description": (
+                        "Opens bin by index (0: organic, 1: recycle, 2: hazardous, 3: other). With "
+                        "MQTT_COMMAND_QUEUE=true a command for a busy bin is queued (202 with a ticket for "
+                        "`/commands/{ticket_id}`) instead of answering 409; `wait=true` waits until it is sent."
+                    ),
                     "requestBody": {
                         "required": True,
                         "content": {
@@ -161,6 +289,23 @@ def custom_openapi(app):
                                 }
                             }
                         },
+                        "202": {
+                            "description": "Bin busy, command queued (queued mode)",
+                            "content": {
+                                "application/json": {
+                                    "example": {
+                                        "message": "Queued bin recycle",
+                                        "ticket": "9b1d4c7e2a60",
+                                        "bin_index": 1,
+                                        "status": "queued",
+                                        "created_at": 1760601600.12,
+                                        "expires_in": 10.0,
+                                        "command_id": None,
+                                        "error": None
+                                    }
+                                }
+                            }
+                        },
                         "400": {
                             "description": "Invalid bin index",
                             "content": {
@@ -170,7 +315,7 @@ def custom_openapi(app):
                             }
                         },
                         "409": {
-                            "description": "Bin busy",
+                            "description": "Target bin is mid-cycle",
                             "content": {
                                 "application/json": {
                                     "example": {"detail": "Bin is currently busy. Please wait."}
@@ -189,11 +334,23 @@ def custom_openapi(app):
                                         "unknown_status": {
                                             "summary": "Unknown bin status",
                                             "value": {"detail": "Bin status is unknown. Cannot control bin."}
+                                        },
+                                        "command_queue_full": {
+                                            "summary": "Bin command queue is full (queued mode)",
+                                            "value": {"detail": "Bin command queue is full: 8 bin commands are already waiting. Please retry later."}
                                         }
                                     }
                                 }
                             }
                         },
+                        "504": {
+                            "description": "Queued command expired while waiting (queued mode, wait=true)",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Bin 1 stayed busy past the 10 s queue deadline"}
+                                }
+                            }
+                        },
                         "500": {
                             "description": "Internal server error",
                             "content": {
@@ -204,6 +361,38 @@ def custom_openapi(app):
                         }
                     }
                 })
+            elif path == "/commands/{ticket_id}" and method == "get":
+                operation.update({
+                    "tags": ["Bin Management"],
+                    "summary": "Poll a queued bin command",
+                    "description": "Status of a command queued by `/control_bin` or `/predict_iot` in queued mode: queued, sent, expired, failed or cancelled. Tickets are kept by the worker that queued them.",
+                    "responses": {
+                        "200": {
+                            "description": "Ticket status",
+                            "content": {
+                                "application/json": {
+                                    "example": {
+                                        "ticket": "9b1d4c7e2a60",
+                                        "bin_index": 1,
+                                        "status": "sent",
+                                        "created_at": 1760601600.12,
+                                        "expires_in": None,
+                                        "command_id": "3f2a9c1e7b04",
+                                        "error": None
+                                    }
+                                }
+                            }
+                        },
+                        "404": {
+                            "description": "Unknown ticket, or queued mode disabled",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Unknown command ticket"}
+                                }
+                            }
+                        }
+                    }
+                })
             elif path == "/predict" and method == "post":
                 operation.update({
                     "tags": ["Prediction"],
@@ -243,6 +432,31 @@ def custom_openapi(app):
                                 }
                             }
                         },
+                        "413": {
+                            "description": "File too large",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Uploaded file is too large, at most 10485760 bytes"}
+                                }
+                            }
+                        },
+                        "503": {
+                            "description": "Model still loading or inference queue is full",
+                            "content": {
+                                "application/json": {
+                                    "examples": {
+                                        "model_loading": {
+                                            "summary": "Model still loading",
+                                            "value": {"detail": "Model is still loading. Please retry later."}
+                                        },
+                                        "queue_full": {
+                                            "summary": "Inference queue full",
+                                            "value": {"detail": "Inference queue is full. Please retry later."}
+                                        }
+                                    }
+                                }
+                            }
+                        },
                         "422": {
                             "description": "Missing file",
                             "content": {
@@ -261,11 +475,107 @@ def custom_openapi(app):
                         }
                     }
                 })
+            elif path == "/predict/batch" and method == "post":
+                operation.update({
+                    "tags": ["Prediction"],
+                    "summary": "Classify a batch of waste images",
+                    "description": "Upload several .jpg or .png images in one request. They are classified with a single forward pass.",
+                    "requestBody": {
+                        "required": True,
+                        "content": {
+                            "multipart/form-data": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "files": {
+                                            "type": "array",
+                                            "items": {"type": "string", "format": "binary"}
+                                        }
+                                    },
+                                    "required": ["files"]
+                                }
+                            }
+                        }
+                    },
+                    "responses": {
+                        "200": {
+                            "description": "Batch prediction success",
+                            "content": {
+                                "application/json": {
+                                    "example": {
+                                        "predictions": [
+                                            {
+                                                "filename": "frame_1.jpg",
+                                                "class": "recycle",
+                                                "probabilities": {"hazardous": 4.3, "organic": 5.2, "other": 5.4, "recycle": 85.1}
+                                            },
+                                            {
+                                                "filename": "frame_2.jpg",
+                                                "class": "organic",
+                                                "probabilities": {"hazardous": 5.3, "organic": 78.5, "other": 6.0, "recycle": 10.2}
+                                            }
+                                        ]
+                                    }
+                                }
+                            }
+                        },
+                        "400": {
+                            "description": "Invalid file type or too many files",
+                            "content": {
+                                "application/json": {
+                                    "examples": {
+                                        "invalid_file": {
+                                            "summary": "Invalid file type",
+                                            "value": {"detail": "Uploaded file must be image (.png, .jpg): notes.txt"}
+                                        },
+                                        "too_many_files": {
+                                            "summary": "Too many files",
+                                            "value": {"detail": "Too many files, at most 32 images per batch"}
+                                        }
+                                    }
+                                }
+                            }
+                        },
+                        "413": {
+                            "description": "File too large",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Uploaded file is too large, at most 10485760 bytes"}
+                                }
+                            }
+                        },
+                        "503": {
+                            "description": "Model still loading or inference queue is full",
+                            "content": {
+                                "application/json": {
+                                    "examples": {
+                                        "model_loading": {
+                                            "summary": "Model still loading",
+                                            "value": {"detail": "Model is still loading. Please retry later."}
+                                        },
+                                        "queue_full": {
+                                            "summary": "Inference queue full",
+                                            "value": {"detail": "Inference queue is full. Please retry later."}
+                                        }
+                                    }
+                                }
+                            }
+                        },
+                        "500": {
+                            "description": "Internal server error",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Error: Model prediction error"}
+                                }
+                            }
+                        }
+                    }
+                })
             elif path == "/predict_iot" and method == "post":
                 operation.update({
                     "tags": ["Prediction"],
                     "summary": "Predict & auto-open bin",
-                    "description": "Upload image → predict → open bin via MQTT (if device is ready).",
+                    "description": "Upload image → predict → open bin via MQTT (if device is ready). In queued mode a busy bin answers 202 with a ticket instead of 409, or waits with `wait=true`.",
                     "requestBody": {
                         "required": True,
                         "content": {
@@ -297,6 +607,24 @@ def custom_openapi(app):
                                 }
                             }
                         },
+                        "202": {
+                            "description": "Bin busy, command queued (queued mode)",
+                            "content": {
+                                "application/json": {
+                                    "example": {
+                                        "class": "recycle",
+                                        "bin_index": 1,
+                                        "bin_queued": "recycle",
+                                        "ticket": "9b1d4c7e2a60",
+                                        "status": "queued",
+                                        "created_at": 1760601600.12,
+                                        "expires_in": 10.0,
+                                        "command_id": None,
+                                        "error": None
+                                    }
+                                }
+                            }
+                        },
                         "400": {
                             "description": "Invalid file type",
                             "content": {
@@ -306,13 +634,21 @@ def custom_openapi(app):
                             }
                         },
                         "409": {
-                            "description": "Bin busy",
+                            "description": "Target bin is mid-cycle",
                             "content": {
                                 "application/json": {
                                     "example": {"detail": "Bin is currently busy. Please wait."}
                                 }
                             }
                         },
+                        "413": {
+                            "description": "File too large",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Uploaded file is too large, at most 10485760 bytes"}
+                                }
+                            }
+                        },
                         "503": {
                             "description": "Device offline or unknown status",
                             "content": {
@@ -325,11 +661,31 @@ def custom_openapi(app):
                                         "unknown_status": {
                                             "summary": "Unknown bin status",
                                             "value": {"detail": "Bin status is unknown. Cannot control bin."}
+                                        },
+                                        "model_loading": {
+                                            "summary": "Model still loading",
+                                            "value": {"detail": "Model is still loading. Please retry later."}
+                                        },
+                                        "queue_full": {
+                                            "summary": "Inference queue is full",
+                                            "value": {"detail": "Inference queue is full. Please retry later."}
+                                        },
+                                        "command_queue_full": {
+                                            "summary": "Bin command queue is full (queued mode)",
+                                            "value": {"detail": "Bin command queue is full: 8 bin commands are already waiting. Please retry later."}
                                         }
                                     }
                                 }
                             }
                         },
+                        "504": {
+                            "description": "Queued command expired while waiting (queued mode, wait=true)",
+                            "content": {
+                                "application/json": {
+                                    "example": {"detail": "Bin 1 stayed busy past the 10 s queue deadline"}
+                                }
+                            }
+                        },
                         "500": {
                             "description": "Internal server error",
                             "content": {
@@ -350,5 +706,42 @@ def custom_openapi(app):
                     }
                 })
 
+    # The raw-body routes answer exactly like their multipart counterparts
+    for path, multipart_path in (("/predict/raw", "/predict"), ("/predict_iot/raw", "/predict_iot")):
+        if path not in openapi_schema["paths"] or multipart_path not in openapi_schema["paths"]:
+            continue
+        multipart_operation = openapi_schema["paths"][multipart_path]["post"]
+        openapi_schema["paths"][path]["post"].update({
+            "tags": ["Prediction"],
+            "summary": f"{multipart_operation['summary']} (raw body)",
+            "description": f"Same as `{multipart_path}`, but the image is sent as the whole request body instead of a multipart form, e.g. `curl --data-binary @frame.jpg -H 'Content-Type: image/jpeg'`.",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "image/jpeg": {"schema": {"type": "string", "format": "binary"}},
+                    "application/octet-stream": {"schema": {"type": "string", "format": "binary"}}
+                }
+            },
+            "responses": {
+                **multipart_operation["responses"],
+                "415": {
+                    "description": "Body is not a raw image",
+                    "content": {
+                        "application/json": {
+                            "example": {"detail": "Send the image as the request body with Content-Type application/octet-stream or image/*"}
+                        }
+                    }
+                },
+                "422": {
+                    "description": "Empty body",
+                    "content": {
+                        "application/json": {
+                            "example": {"detail": [{"loc": ["body"], "msg": "Field required", "type": "missing"}]}
+                        }
+                    }
+                }
+            }
+        })
+
     app.openapi_schema = openapi_schema
     return app.openapi_schema
\ No newline at end of file
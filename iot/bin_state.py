@@ -0,0 +1,165 @@
+import threading
+import time
+
+IDLE = "idle"
+COMMANDED = "commanded"
+OPENING = "opening"
+OPEN = "open"
+CLOSING = "closing"
+
+# Position in the servo cycle: a late or repeated message never moves a bin backwards
+LIFECYCLE = (IDLE, COMMANDED, OPENING, OPEN, CLOSING)
+ORDER = {state: i for i, state in enumerate(LIFECYCLE)}
+
+# Where a bin goes when its state times out without word from the device. A lost
+# command frees the bin; a cycle whose messages were lost still runs to the end
+NEXT_STATE = {COMMANDED: IDLE, OPENING: OPEN, OPEN: CLOSING, CLOSING: IDLE}
+
+# servo/status words. Older firmware only sends busy while moving and OK or available once done
+DEVICE_STATES = {
+    "busy": OPENING,
+    "moving": OPENING,
+    "opening": OPENING,
+    "open": OPEN,
+    "opened": OPEN,
+    "closing": CLOSING,
+    "closed": IDLE,
+    "done": IDLE,
+    "idle": IDLE,
+    "ok": IDLE,
+    "available": IDLE,
+    "ready": IDLE,
+}
+
+class BinState:
+    """Where one bin is in its cycle, and since when (time.monotonic)"""
+    __slots__ = ("state", "since", "commanded_at", "command_id")
+
+    def __init__(self):
+        self.state = IDLE
+        self.since = 0.0
+        self.commanded_at = None
+        self.command_id = None
+
+class BinStateMachine:
+    """Per-bin servo lifecycle: idle -> commanded -> opening -> open -> closing -> idle.
+
+    `command` starts a cycle when a command is published and `on_status`
+    moves a bin along as the device reports progress. Every state except idle
+    has a timeout in seconds, checked whenever a state is read, so a bin is
+    never held busy by a message that did not arrive.
+
+    A status that cannot be attributed to a bin (plain payload, nothing
+    commanded by this process, e.g. another worker's command) holds the whole
+    device instead, so concurrent publishers never collide.
+    """
+
+    def __init__(self, timeouts, on_cycle=None):
+        self.timeouts = timeouts
+        # Called with (bin_index, seconds) when a commanded bin is reported idle again
+        self.on_cycle = on_cycle
+        self.bins = {}
+        self.device = BinState()
+        self._lock = threading.Lock()
+
+    def _bin(self, bin_index):
+        state = self.bins.get(bin_index)
+        if state is None:
+            state = self.bins[bin_index] = BinState()
+        return state
+
+    def _advance(self, state, now):
+        while state.state != IDLE and now - state.since > self.timeouts[state.state]:
+            self._enter(state, NEXT_STATE[state.state], state.since + self.timeouts[state.state])
+
+    @staticmethod
+    def _enter(state, new_state, now):
+        state.state = new_state
+        state.since = now
+        if new_state == IDLE:
+            state.commanded_at = None
+            state.command_id = None
+
+    def command(self, bin_index, command_id=None, now=None):
+        """Start a cycle for a command that is about to be published"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._bin(bin_index)
+            self._enter(state, COMMANDED, now)
+            state.commanded_at = now
+            state.command_id = command_id
+
+    def cancel(self, bin_index):
+        """Return a bin to idle, e.g. when its command could not be published"""
+        with self._lock:
+            self._enter(self._bin(bin_index), IDLE, time.monotonic())
+
+    def on_status(self, status, bin_index=None, now=None):
+        """Apply a servo/status word; return the new state, or None when the word is not a lifecycle state"""
+        new_state = DEVICE_STATES.get(status.strip().lower())
+        if new_state is None:
+            return None
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if bin_index is None:
+                state = self._active(now)
+            else:
+                state = self._bin(bin_index)
+                self._advance(state, now)
+            if state.state == IDLE or new_state == IDLE or ORDER[new_state] >= ORDER[state.state]:
+                if new_state == IDLE and state.commanded_at is not None and self.on_cycle is not None:
+                    self.on_cycle(bin_index if bin_index is not None else self._index(state), now - state.commanded_at)
+                self._enter(state, new_state, now)
+            return state.state
+
+    def _active(self, now):
+        """The bin an unattributed status is about: the oldest one mid-cycle, else the whole device"""
+        self._advance(self.device, now)
+        active = None
+        for state in self.bins.values():
+            self._advance(state, now)
+            if state.state != IDLE and (active is None or state.commanded_at < active.commanded_at):
+                active = state
+        return active or self.device
+
+    def _index(self, state):
+        for bin_index, candidate in self.bins.items():
+            if candidate is state:
+                return bin_index
+        return None
+
+    def state(self, bin_index, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._bin(bin_index)
+            self._advance(state, now)
+            return state.state
+
+    def is_idle(self, bin_index=None, now=None):
+        """Whether `bin_index` (any bin when None) can take a command now"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._advance(self.device, now)
+            if self.device.state != IDLE:
+                return False
+            states = [self._bin(bin_index)] if bin_index is not None else list(self.bins.values())
+            for state in states:
+                self._advance(state, now)
+                if state.state != IDLE:
+                    return False
+            return True
+
+    def snapshot(self, now=None):
+        """State of every bin seen so far and the seconds it has been in it"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._advance(self.device, now)
+            bins = {}
+            for bin_index, state in sorted(self.bins.items(), key=lambda item: str(item[0])):
+                self._advance(state, now)
+                bins[str(bin_index)] = {
+                    "state": state.state,
+                    "seconds": round(now - state.since, 3) if state.state != IDLE else None,
+                    "command_id": state.command_id,
+                }
+            return {"device_state": self.device.state, "bins": bins}
@@ -0,0 +1,220 @@
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+from prometheus_client import Counter, Gauge
+import asyncio
+import os
+import time
+import uuid
+
+load_dotenv()
+
+QUEUE_DEPTH = Gauge(
+    "waste_classification_bin_queue_depth", "Bin commands waiting for their bin to become free", multiprocess_mode="livesum")
+QUEUED_COMMANDS = Counter(
+    "waste_classification_bin_queue_total", "Queued bin commands by outcome (sent, expired, failed, cancelled, rejected)", ["outcome"])
+
+# Finished tickets kept for polling
+TICKET_HISTORY = 256
+
+# How often the bin states are re-checked while commands wait. Bins also free up
+# through state timeouts, which send no message to wake the queue up
+POLL_INTERVAL = 0.1
+
+class CommandQueueFull(Exception):
+    """Raised when the device already has `max_depth` commands waiting"""
+
+class CommandExpired(Exception):
+    """Raised to a waiting caller when its command was still queued at its deadline"""
+
+class CommandTicket:
+    """One bin command submitted through the queue.
+
+    `status` is queued, then sent once published, or expired / failed /
+    cancelled. `future` resolves with the MQTT command id when it is sent.
+    """
+    __slots__ = ("id", "bin_index", "status", "created_at", "deadline", "command_id", "error", "future", "queued")
+
+    def __init__(self, bin_index, deadline, future):
+        self.id = uuid.uuid4().hex[:12]
+        self.bin_index = bin_index
+        self.status = "queued"
+        self.created_at = time.time()
+        self.deadline = deadline
+        self.command_id = None
+        self.error = None
+        self.future = future
+        # Whether it had to wait, only those count towards the queue metrics
+        self.queued = False
+
+    @property
+    def sent(self):
+        return self.status == "sent"
+
+    def to_dict(self):
+        return {
+            "ticket": self.id,
+            "bin_index": self.bin_index,
+            "status": self.status,
+            "created_at": self.created_at,
+            "expires_in": round(max(0.0, self.deadline - time.monotonic()), 3) if self.status == "queued" else None,
+            "command_id": self.command_id,
+            "error": self.error,
+        }
+
+class CommandQueue:
+    """Bounded queue of bin commands for one device (one MQTTClient).
+
+    `submit` publishes right away when the target bin is free and nothing is
+    queued for it, otherwise the command waits. The queue is drained on the
+    event loop whenever the MQTT client reports a status message, and every
+    POLL_INTERVAL while commands wait. Commands go out in submission order per
+    bin; a busy bin does not hold up commands for the other bins. A command
+    still waiting at its deadline expires.
+    """
+
+    def __init__(self, mqtt_client, max_depth=None, deadline=None):
+        self.mqtt_client = mqtt_client
+        self.max_depth = int(max_depth or os.getenv("MQTT_QUEUE_MAX_DEPTH", 8))
+        self.deadline = float(deadline or os.getenv("MQTT_QUEUE_DEADLINE", 10))
+        self.queue = deque()
+        self.tickets = OrderedDict()
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        mqtt_client.add_status_listener(self._on_status)
+
+    def start(self):
+        """Start the drain task on the running loop (again, when the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run(), name="bin-command-queue")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self.queue:
+            self._finish(self.queue.popleft(), "cancelled")
+        QUEUE_DEPTH.set(0)
+
+    def _on_status(self):
+        # Called on paho's network thread
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def has_queued(self, bin_index):
+        return any(ticket.bin_index == bin_index for ticket in self.queue)
+
+    def submit(self, bin_index):
+        """Publish `bin_index` now when its bin is free, else queue it. Returns the ticket.
+
+        Raises CommandQueueFull when the command would have to wait and the
+        queue is at max_depth, and ConnectionError when publishing right away fails.
+        """
+        self.start()
+        ticket = CommandTicket(bin_index, time.monotonic() + self.deadline, self._loop.create_future())
+        if not self.has_queued(bin_index) and self.mqtt_client.get_bin_status(bin_index) == "OK":
+            self._send(ticket, raise_errors=True)
+        else:
+            if len(self.queue) >= self.max_depth:
+                QUEUED_COMMANDS.labels("rejected").inc()
+                raise CommandQueueFull(f"{len(self.queue)} bin commands are already waiting")
+            ticket.queued = True
+            self.queue.append(ticket)
+            QUEUE_DEPTH.set(len(self.queue))
+            self._wake()
+        self._remember(ticket)
+        return ticket
+
+    async def wait(self, ticket):
+        """Wait until `ticket` is sent and return its command id; raises CommandExpired or the publish error"""
+        # Shielded: a caller that goes away must not cancel the ticket for everyone polling it
+        await asyncio.shield(ticket.future)
+        if ticket.status == "sent":
+            return ticket.command_id
+        if ticket.status == "expired":
+            raise CommandExpired(f"Bin {ticket.bin_index} stayed busy past the {self.deadline:g} s queue deadline")
+        raise ConnectionError(ticket.error or f"Command for bin {ticket.bin_index} was {ticket.status}")
+
+    def get_ticket(self, ticket_id):
+        return self.tickets.get(ticket_id)
+
+    def get_stats(self):
+        return {"depth": len(self.queue), "max_depth": self.max_depth, "deadline_s": self.deadline}
+
+    def drain(self):
+        """Send every queued command whose bin is free and expire the overdue ones.
+
+        Returns the seconds until the next check, None when nothing waits.
+        """
+        now = time.monotonic()
+        held = set()
+        for ticket in list(self.queue):
+            if now >= ticket.deadline:
+                self.queue.remove(ticket)
+                self._finish(ticket, "expired")
+                print(f"[WARN] Queued command for bin {ticket.bin_index} expired after {self.deadline:g} s")
+            elif ticket.bin_index in held:
+                continue
+            else:
+                # Whatever happens, later commands for this bin wait for the next pass
+                held.add(ticket.bin_index)
+                if self.mqtt_client.is_device_online() and self.mqtt_client.get_bin_status(ticket.bin_index) == "OK":
+                    self.queue.remove(ticket)
+                    self._send(ticket)
+        QUEUE_DEPTH.set(len(self.queue))
+        if not self.queue:
+            return None
+        return max(0.0, min(POLL_INTERVAL, min(ticket.deadline for ticket in self.queue) - now))
+
+    def _send(self, ticket, raise_errors=False):
+        try:
+            command_id = self.mqtt_client.publish(ticket.bin_index)
+        except Exception as e:
+            self._finish(ticket, "failed", error=str(e))
+            if raise_errors:
+                raise
+            print(f"[ERROR] Failed to send queued command for bin {ticket.bin_index}: {e}")
+            return
+        ticket.command_id = command_id
+        self._finish(ticket, "sent")
+
+    def _finish(self, ticket, status, error=None):
+        ticket.status = status
+        ticket.error = error
+        if not ticket.future.done():
+            ticket.future.set_result(ticket.command_id)
+        if ticket.queued:
+            QUEUED_COMMANDS.labels(status).inc()
+
+    def _remember(self, ticket):
+        self.tickets[ticket.id] = ticket
+        while len(self.tickets) > TICKET_HISTORY:
+            oldest = next(iter(self.tickets.values()))
+            if oldest.status == "queued":
+                break
+            self.tickets.popitem(last=False)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            timeout = self.drain()
+            # A timer rather than asyncio.wait_for, which can swallow the cancel from stop()
+            timer = self._loop.call_later(timeout, self._wakeup.set) if timeout is not None else None
+            try:
+                await self._wakeup.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
@@ -1,14 +1,58 @@
 
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
+from iot.bin_state import BinStateMachine, DEVICE_STATES, IDLE, COMMANDED, OPENING, OPEN, CLOSING
+from prometheus_client import Counter, Histogram
+from collections import OrderedDict, deque
+import json
 import os
+import threading
 import time
 import ssl
+import uuid
 
 load_dotenv()
 
+# Exported on /metrics. Handling a message or publishing takes microseconds, hence the small buckets
+MQTT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1)
+MESSAGES = Counter("waste_classification_mqtt_messages_total", "MQTT messages received by topic", ["topic"])
+ON_MESSAGE_SECONDS = Histogram(
+    "waste_classification_mqtt_on_message_seconds", "MQTTClient.on_message handling time", buckets=MQTT_BUCKETS)
+PUBLISH_SECONDS = Histogram(
+    "waste_classification_mqtt_publish_seconds", "Time to hand a bin command to the MQTT client", buckets=MQTT_BUCKETS)
+# From publishing a command to the device acknowledging it on servo/status: network round trip plus servo start-up
+ACTUATION_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+ACTUATION_SECONDS = Histogram(
+    "waste_classification_bin_actuation_seconds", "Time from publishing a bin command to the device acknowledging it",
+    ["device", "bin"], buckets=ACTUATION_BUCKETS)
+COMMAND_TIMEOUTS = Counter(
+    "waste_classification_bin_command_timeouts_total", "Bin commands the device did not acknowledge in time", ["device", "bin"])
+CYCLE_SECONDS = Histogram(
+    "waste_classification_bin_cycle_seconds", "Time from publishing a bin command until the device reports the bin idle again",
+    ["device", "bin"], buckets=(0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 30.0))
+
+class PendingCommand:
+    """A published bin command waiting for the device's acknowledgement"""
+    __slots__ = ("id", "bin_index", "sent", "published_at")
+
+    def __init__(self, command_id, bin_index):
+        self.id = command_id
+        self.bin_index = bin_index
+        self.sent = time.monotonic()
+        self.published_at = time.time()
+
+    def record(self, status, latency=None):
+        return {
+            "id": self.id,
+            "bin_index": self.bin_index,
+            "published_at": self.published_at,
+            "status": status,
+            "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "timed_out": latency is None,
+        }
+
 class MQTTClient:
-    def __init__(self):
+    def __init__(self, connect=True):
         self.broker = os.getenv("MQTT_BROKER")
         self.port = int(os.getenv("MQTT_PORT", 8883)) 
         self.username = os.getenv("MQTT_USERNAME")
@@ -21,6 +65,27 @@ class MQTTClient:
         # SSL/TLS Options
         self.use_ssl = os.getenv("MQTT_USE_SSL", "true").lower() == "true"
         self.verify_certs = os.getenv("MQTT_VERIFY_CERTS", "true").lower() == "true"
+
+        # Command payload: `plain` is the bare index today's firmware parses, `json` sends
+        # {"bin": i, "id": "..."} for firmware that echoes the id in its acknowledgement
+        self.command_format = os.getenv("MQTT_COMMAND_FORMAT", "plain").lower()
+        self.ack_timeout = float(os.getenv("MQTT_ACK_TIMEOUT", 5))
+        self.pending_commands = OrderedDict()
+        self.recent_commands = deque(maxlen=int(os.getenv("MQTT_LATENCY_HISTORY", 100)))
+        self.command_timeouts = 0
+        # publish runs on the event loop, acknowledgements arrive on paho's network thread
+        self._commands_lock = threading.Lock()
+
+        # Seconds each bin state may last without word from the device (see iot.bin_state)
+        self.state_timeouts = {
+            COMMANDED: self.ack_timeout,
+            OPENING: float(os.getenv("MQTT_OPENING_TIMEOUT", 3)),
+            OPEN: float(os.getenv("MQTT_OPEN_TIMEOUT", 5)),
+            CLOSING: float(os.getenv("MQTT_CLOSING_TIMEOUT", 3)),
+        }
+        self.bins = BinStateMachine(self.state_timeouts, on_cycle=self.observe_cycle)
+        # Called without arguments on the network thread after each device message (see iot.command_queue)
+        self.status_listeners = []
         
         # MQTT state
         self.bin_status = "unknown"
@@ -29,6 +94,12 @@ class MQTTClient:
         self.connected = False
         
         # Create MQTT client
+        self.create_client()
+        
+        if connect:
+            self.connect()
+
+    def create_client(self):
         self.client = mqtt.Client()
         self.client.username_pw_set(self.username, self.password)
         self.client.on_connect = self.on_connect
@@ -38,15 +109,49 @@ class MQTTClient:
         # Configure SSL/TLS if enabled
         if self.use_ssl:
             self.configure_ssl()
-        
+
+    def after_fork(self):
+        """Replace a client inherited through os.fork: each worker needs its own client id and network thread"""
+        self.create_client()
+        self.connected = False
+        self.bin_status = "unknown"
+        self.esp32_status = "unknown"
+        self.last_status_update = 0
+        # The parent's commands are acknowledged (or time out) in the parent
+        self._commands_lock = threading.Lock()
+        self.pending_commands.clear()
+        self.recent_commands.clear()
+        self.command_timeouts = 0
+        self.bins = BinStateMachine(self.state_timeouts, on_cycle=self.observe_cycle)
+
+    def connect(self):
+        """Connect to the broker, blocking until the TCP/TLS handshake is done"""
         try:
             self.client.connect(self.broker, self.port, 60)
             self.client.loop_start()
+            self.name_network_thread()
         except Exception as e:
             print(f"[ERROR] Failed to connect to MQTT broker: {e}")
             self.connected = False
             self.bin_status = "unknown"
 
+    def connect_async(self):
+        """Connect from the network thread without blocking the caller; on_connect reports the result"""
+        try:
+            self.client.connect_async(self.broker, self.port, 60)
+            self.client.loop_start()
+            self.name_network_thread()
+        except Exception as e:
+            print(f"[ERROR] Failed to start MQTT connection: {e}")
+            self.connected = False
+            self.bin_status = "unknown"
+
+    def name_network_thread(self):
+        """Give paho's loop_start thread a stable name for profiles and thread dumps (see app.profiler)"""
+        thread = getattr(self.client, "_thread", None)
+        if thread is not None:
+            thread.name = "mqtt-network"
+
     def configure_ssl(self):
         """Configure SSL/TLS for MQTT connection"""
         print("[INFO] Configuring SSL/TLS for MQTT connection...")
@@ -93,34 +198,173 @@ class MQTTClient:
         self.bin_status = "unknown"
 
     def on_message(self, client, userdata, msg):
+        start = time.perf_counter()
         topic = msg.topic
         payload = msg.payload.decode()
         print(f"[MQTT] Message received | Topic: {topic} | Payload: {payload}")
         
         if topic == f"{self.base_topic}/servo/status":
-            self.bin_status = payload
+            status, command_id, bin_index = self.parse_status(payload)
+            self.bin_status = status
             self.last_status_update = time.time()
+            command = self.acknowledge(status, command_id, bin_index)
+            if bin_index is None and command is not None:
+                bin_index = command.bin_index
+            self.bins.on_status(status, bin_index)
+            MESSAGES.labels("servo/status").inc()
         elif topic == f"{self.base_topic}/status":
             self.esp32_status = payload.lower()
+            MESSAGES.labels("status").inc()
+        else:
+            # Only the subscribed topics get their own series
+            MESSAGES.labels("other").inc()
+        for listener in self.status_listeners:
+            listener()
+        ON_MESSAGE_SECONDS.observe(time.perf_counter() - start)
+
+    def add_status_listener(self, listener):
+        self.status_listeners.append(listener)
+
+    @staticmethod
+    def parse_status(payload):
+        """Split a servo/status payload into (status, command id, bin index).
+
+        Firmware that echoes the correlation id sends {"status": "...", "id": "...", "bin": i},
+        with id and bin optional; a plain status string has neither.
+        """
+        if payload.startswith("{"):
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                return payload, None, None
+            if isinstance(data, dict):
+                command_id = data.get("id")
+                bin_index = data.get("bin")
+                return (
+                    str(data.get("status", "")),
+                    str(command_id) if command_id is not None else None,
+                    bin_index if isinstance(bin_index, int) else None,
+                )
+        return payload, None, None
+
+    def acknowledge(self, status, command_id=None, bin_index=None):
+        """Match a status message to its pending command, record the actuation latency and return the command.
+
+        A message carrying an id acknowledges that command, one carrying only a
+        bin the oldest pending command for that bin. A plain status can only be
+        matched because plain commands are sent one at a time (see
+        get_bin_status): only a word saying the servo started moving (busy,
+        opening, ...) takes the pending command. A plain completion word (OK,
+        closed, ...) finishes the cycle already under way, not a command that has
+        not moved yet, and is left to the bin state machine.
+        """
+        now = time.monotonic()
+        with self._commands_lock:
+            self.expire_commands(now)
+            if command_id is not None:
+                command = self.pending_commands.pop(command_id, None)
+            elif bin_index is not None:
+                command = next((c for c in self.pending_commands.values() if c.bin_index == bin_index), None)
+                if command is not None:
+                    del self.pending_commands[command.id]
+            elif self.pending_commands and DEVICE_STATES.get(status.strip().lower(), IDLE) != IDLE:
+                _, command = self.pending_commands.popitem(last=False)
+            else:
+                command = None
+            if command is None:
+                return None
+            latency = now - command.sent
+            self.recent_commands.append(command.record(status, latency))
+        ACTUATION_SECONDS.labels(self.base_topic, str(command.bin_index)).observe(latency)
+        print(f"[MQTT] Command {command.id} for bin {command.bin_index} acknowledged in {latency * 1000:.0f} ms: {status}")
+        return command
+
+    def observe_cycle(self, bin_index, seconds):
+        CYCLE_SECONDS.labels(self.base_topic, str(bin_index)).observe(seconds)
+
+    def expire_commands(self, now=None):
+        """Move commands older than ack_timeout to the history as timed out. Call with _commands_lock held"""
+        now = time.monotonic() if now is None else now
+        while self.pending_commands:
+            command = next(iter(self.pending_commands.values()))
+            if now - command.sent <= self.ack_timeout:
+                break
+            self.pending_commands.popitem(last=False)
+            self.command_timeouts += 1
+            self.recent_commands.append(command.record("timeout"))
+            COMMAND_TIMEOUTS.labels(self.base_topic, str(command.bin_index)).inc()
+            print(f"[WARN] Command {command.id} for bin {command.bin_index} not acknowledged within {self.ack_timeout:g} s")
+
+    def get_command_latencies(self):
+        """Recent commands with their actuation latency, plus a summary of the acknowledged ones"""
+        with self._commands_lock:
+            self.expire_commands()
+            recent = list(self.recent_commands)
+            pending = [
+                {"id": command.id, "bin_index": command.bin_index, "published_at": command.published_at}
+                for command in self.pending_commands.values()
+            ]
+            timeouts = self.command_timeouts
+        latencies = sorted(entry["latency_ms"] for entry in recent if entry["latency_ms"] is not None)
+        summary = {"acknowledged": len(latencies), "timeouts": timeouts}
+        if latencies:
+            summary.update({
+                "p50_ms": latencies[(len(latencies) - 1) // 2],
+                "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max_ms": latencies[-1],
+            })
+        return {
+            "device": self.base_topic,
+            "ack_timeout_s": self.ack_timeout,
+            "pending": pending,
+            "recent": recent,
+            "summary": summary,
+        }
 
     def is_device_online(self) -> bool:
         return self.esp32_status == "online"
 
-    def get_bin_status(self):
-        if not self.connected:
+    def get_bin_status(self, bin_index=None):
+        """OK when `bin_index` (every bin when None) can take a command, busy mid-cycle, unknown before the device reported.
+
+        Bins are only gated separately with the json command format. Plain
+        commands carry no id, so their acknowledgements can only be matched
+        while a single command is in flight: any busy bin holds the device.
+        """
+        if not self.connected or self.bin_status == "unknown":
             return "unknown"
-        if time.time() - self.last_status_update <= 1.5:
-            return "busy"
-        return self.bin_status
+        if self.command_format != "json":
+            bin_index = None
+        return "OK" if self.bins.is_idle(bin_index) else "busy"
+
+    def get_bin_states(self):
+        """Lifecycle state of every bin, see iot.bin_state"""
+        return self.bins.snapshot()
 
     def publish(self, bin_index: int):
+        """Send a bin command and return its correlation id"""
         if not self.connected:
             raise ConnectionError("MQTT client not connected to broker")
         topic = f"{self.base_topic}/{bin_index}"
-        result = self.client.publish(topic, str(bin_index))
+        command = PendingCommand(uuid.uuid4().hex[:12], bin_index)
+        if self.command_format == "json":
+            payload = json.dumps({"bin": bin_index, "id": command.id})
+        else:
+            payload = str(bin_index)
+        # Registered before sending: the acknowledgement can arrive before publish() returns
+        with self._commands_lock:
+            self.pending_commands[command.id] = command
+        self.bins.command(bin_index, command.id, command.sent)
+        start = time.perf_counter()
+        result = self.client.publish(topic, payload)
+        PUBLISH_SECONDS.observe(time.perf_counter() - start)
         if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            with self._commands_lock:
+                self.pending_commands.pop(command.id, None)
+            self.bins.cancel(bin_index)
             raise ConnectionError(f"Failed to publish to {topic}")
-        print(f"[MQTT] Published to {topic}: {bin_index}")
+        print(f"[MQTT] Published to {topic}: {payload}")
+        return command.id
 
     def get_connection_info(self):
         """Get connection status and SSL information"""
@@ -0,0 +1,300 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from ml.model import is_raw_tensor, raw_tensor_array
+from PIL import Image
+import numpy as np
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+
+load_dotenv()
+
+class PredictionCache:
+    """Bounded LRU + TTL cache of prediction results keyed by raw image bytes.
+
+    Keys are a 128-bit BLAKE2b digest of the model version and the upload,
+    which hashes at memory speed and is collision-safe for our volumes. The cache evicts least recently
+    used entries once the estimated size exceeds `max_bytes`, and treats entries
+    older than `ttl` seconds as misses.
+    """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        self.max_bytes = int(max_bytes or os.getenv("PREDICTION_CACHE_MAX_BYTES", 4 * 1024 * 1024))
+        self.ttl = float(ttl or os.getenv("PREDICTION_CACHE_TTL", 300))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(image_data, model_version=None):
+        digest = hashlib.blake2b(digest_size=16)
+        if model_version is not None:
+            # Entries of an older model are never looked up again and age out
+            digest.update(str(model_version).encode() + b"\0")
+        digest.update(image_data)
+        return digest.digest()
+
+    @staticmethod
+    def _estimate_size(key, value):
+        predicted_class, probabilities = value
+        size = sys.getsizeof(key) + sys.getsizeof(value) + sys.getsizeof(predicted_class) + sys.getsizeof(probabilities)
+        return size + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in probabilities.items())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.size_bytes -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._estimate_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every cached prediction, e.g. after the model has changed"""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+def average_hash(image_data):
+    """64-bit aHash: 8x8 grayscale thumbnail, one bit per pixel above the mean"""
+    pixels = _thumbnail(image_data, (8, 8))
+    return _pack_bits(pixels > pixels.mean())
+
+def difference_hash(image_data):
+    """64-bit dHash: 9x8 grayscale thumbnail, one bit per horizontal gradient sign"""
+    pixels = _thumbnail(image_data, (9, 8))
+    return _pack_bits(pixels[:, 1:] > pixels[:, :-1])
+
+def _thumbnail(image_data, size):
+    if is_raw_tensor(image_data):
+        img = Image.fromarray(raw_tensor_array(image_data))
+    else:
+        img = Image.open(io.BytesIO(image_data))
+        # JPEG draft mode decodes at 1/8 scale directly from the DCT coefficients
+        img.draft("L", (size[0] * 8, size[1] * 8))
+    return np.asarray(img.convert("L").resize(size, Image.BILINEAR), dtype=np.int16)
+
+def _pack_bits(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+PERCEPTUAL_HASHES = {"ahash": average_hash, "dhash": difference_hash}
+
+def perceptual_hash(hash_fn, image_data):
+    """`hash_fn(image_data)`, or None if the upload cannot be decoded (module level so process workers can run it)"""
+    try:
+        return hash_fn(image_data)
+    except Exception:
+        return None
+
+class PerceptualIndex:
+    """Find earlier predictions for near-duplicate frames by perceptual-hash distance.
+
+    Hashes live in a fixed-size uint64 ring buffer so a lookup is one vectorized
+    XOR + popcount over at most `capacity` entries. A frame within
+    `max_distance` differing bits of a live entry reuses that entry's result.
+    Entries only match lookups for the model version they were added with.
+    """
+
+    def __init__(self, max_distance=None, capacity=None, ttl=None, method=None):
+        self.max_distance = int(max_distance if max_distance is not None else os.getenv("PERCEPTUAL_CACHE_MAX_DISTANCE", 4))
+        self.capacity = int(capacity or os.getenv("PERCEPTUAL_CACHE_SIZE", 1024))
+        self.ttl = float(ttl or os.getenv("PERCEPTUAL_CACHE_TTL", 30))
+        method = (method or os.getenv("PERCEPTUAL_HASH", "dhash")).lower()
+        if method not in PERCEPTUAL_HASHES:
+            raise ValueError(f"Unknown perceptual hash '{method}', expected one of {sorted(PERCEPTUAL_HASHES)}")
+        self.hash_fn = PERCEPTUAL_HASHES[method]
+        self.hits = 0
+        self.misses = 0
+
+        self._hashes = np.zeros(self.capacity, dtype=np.uint64)
+        self._expires = np.zeros(self.capacity, dtype=np.float64)  # 0 marks an empty slot
+        self._results = [None] * self.capacity
+        self._versions = np.zeros(self.capacity, dtype=np.int64)
+        self._version_ids = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _version_id(self, model_version):
+        # Small integers keep the version check vectorized
+        return self._version_ids.setdefault(model_version, len(self._version_ids) + 1)
+
+    def hash(self, image_data):
+        """Perceptual hash of an upload, or None if it cannot be decoded"""
+        return perceptual_hash(self.hash_fn, image_data)
+
+    def lookup(self, phash, model_version=None):
+        with self._lock:
+            distances = np.bitwise_count(self._hashes ^ np.uint64(phash))
+            distances[(self._expires < time.monotonic()) | (self._versions != self._version_id(model_version))] = 64 + 1
+            i = int(np.argmin(distances))
+            if distances[i] <= self.max_distance:
+                self.hits += 1
+                return self._results[i]
+            self.misses += 1
+            return None
+
+    def add(self, phash, result, model_version=None):
+        with self._lock:
+            i = self._next
+            self._hashes[i] = phash
+            self._versions[i] = self._version_id(model_version)
+            self._expires[i] = time.monotonic() + self.ttl
+            self._results[i] = result
+            self._next = (i + 1) % self.capacity
+
+    def invalidate(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._results = [None] * self.capacity
+
+    def get_stats(self):
+        return {
+            "entries": int(np.count_nonzero(self._expires >= time.monotonic())),
+            "capacity": self.capacity,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class CachedClassifier:
+    """Wrap a WasteClassifier so repeated uploads of the same bytes skip decode and inference.
+
+    Any attribute not defined here (model, class_names, executor, ...) is read
+    from the wrapped classifier. Entries are keyed by the wrapped classifier's
+    `model_version`, so a new model never serves results of the old one, even
+    for a prediction that was running while the model changed. With a
+    PerceptualIndex, single-image exact misses are also matched against recent
+    near-duplicates.
+    """
+
+    def __init__(self, classifier, cache=None, perceptual=None):
+        self.classifier = classifier
+        self.cache = cache or PredictionCache()
+        # Optional near-duplicate layer for single-image predictions
+        self.perceptual = perceptual
+
+    def __getattr__(self, name):
+        return getattr(self.classifier, name)
+
+    def _model_version(self):
+        return getattr(self.classifier, "model_version", None)
+
+    def _lookup(self, image_data, model_version):
+        key = self.cache.key_for(image_data, model_version)
+        return key, self.cache.get(key)
+
+    @staticmethod
+    def _copy(result):
+        predicted_class, probabilities = result
+        return predicted_class, dict(probabilities)
+
+    def _lookup_near_duplicate(self, key, phash, model_version):
+        if phash is None:
+            return None
+        result = self.perceptual.lookup(phash, model_version)
+        if result is not None:
+            self.cache.put(key, result)
+        return result
+
+    def _store(self, key, phash, model_version, result):
+        self.cache.put(key, result)
+        if phash is not None:
+            self.perceptual.add(phash, result, model_version)
+
+    def predict(self, image_data):
+        model_version = self._model_version()
+        key, result = self._lookup(image_data, model_version)
+        if result is not None:
+            return self._copy(result)
+        phash = self.perceptual.hash(image_data) if self.perceptual else None
+        result = self._lookup_near_duplicate(key, phash, model_version)
+        if result is None:
+            result = self.classifier.predict(image_data)
+            self._store(key, phash, model_version, result)
+        return self._copy(result)
+
+    async def predict_async(self, image_data):
+        model_version = self._model_version()
+        key, result = self._lookup(image_data, model_version)
+        if result is not None:
+            return self._copy(result)
+        # The thumbnail decode is cheap but still a decode: run it on the bounded
+        # inference executor like the full decode, not on the loop's default pool
+        phash = await self.classifier.executor.run(perceptual_hash, self.perceptual.hash_fn, image_data) if self.perceptual else None
+        result = self._lookup_near_duplicate(key, phash, model_version)
+        if result is None:
+            result = await self.classifier.predict_async(image_data)
+            self._store(key, phash, model_version, result)
+        return self._copy(result)
+
+    def _split_batch(self, images):
+        model_version = self._model_version()
+        lookups = [self._lookup(image_data, model_version) for image_data in images]
+        missing = [i for i, (_, result) in enumerate(lookups) if result is None]
+        return lookups, missing
+
+    def _merge_batch(self, lookups, missing, fresh_results):
+        results = [result for _, result in lookups]
+        for i, result in zip(missing, fresh_results):
+            self.cache.put(lookups[i][0], result)
+            results[i] = result
+        return [self._copy(result) for result in results]
+
+    def predict_batch(self, images):
+        lookups, missing = self._split_batch(images)
+        fresh_results = self.classifier.predict_batch([images[i] for i in missing]) if missing else []
+        return self._merge_batch(lookups, missing, fresh_results)
+
+    async def predict_batch_async(self, images):
+        lookups, missing = self._split_batch(images)
+        fresh_results = await self.classifier.predict_batch_async([images[i] for i in missing]) if missing else []
+        return self._merge_batch(lookups, missing, fresh_results)
+
+    def invalidate(self):
+        self.cache.invalidate()
+        if self.perceptual is not None:
+            self.perceptual.invalidate()
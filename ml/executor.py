@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dotenv import load_dotenv
+from prometheus_client import Gauge
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+
+load_dotenv()
+
+# Exported on /metrics; livesum adds up the workers of app.serve in multiprocess mode
+QUEUE_DEPTH = Gauge(
+    "waste_classification_inference_queue_depth", "Inference jobs waiting for a free worker", multiprocess_mode="livesum")
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference executor already holds `max_queue` pending jobs"""
+
+class InferenceExecutor:
+    """Run blocking inference work off the asyncio event loop.
+
+    Jobs go to a dedicated thread pool (default) or a spawn-based process pool.
+    At most `max_queue` jobs may be pending (running or waiting) at once; beyond
+    that `run` fails fast with InferenceQueueFull instead of piling up requests.
+    """
+
+    def __init__(self, kind=None, max_workers=None, max_queue=None, initializer=None, initargs=()):
+        self.kind = (kind or os.getenv("INFERENCE_EXECUTOR", "thread")).lower()
+        if self.kind not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor '{self.kind}', expected 'thread' or 'process'")
+        self.max_workers = int(max_workers or os.getenv("INFERENCE_WORKERS", min(4, os.cpu_count() or 1)))
+        self.max_queue = int(max_queue or os.getenv("INFERENCE_MAX_QUEUE", 64))
+        self.initializer = initializer
+        self.initargs = initargs
+
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def pool(self):
+        # Created on first use so importing the app does not spawn workers
+        if self._pool is None:
+            if self.kind == "process":
+                # TensorFlow is not fork-safe, so process workers always start fresh
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                    initargs=self.initargs,
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        return self._pool
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for a free worker"""
+        return max(0, self.pending - self.max_workers)
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise InferenceQueueFull(f"Inference queue is full ({self.max_queue} pending jobs)")
+            self.pending += 1
+            QUEUE_DEPTH.set(self.queue_depth)
+        try:
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                # run_in_executor does not carry context variables over, the request trace needs them
+                return await loop.run_in_executor(self.pool, contextvars.copy_context().run, fn, *args)
+            return await loop.run_in_executor(self.pool, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                QUEUE_DEPTH.set(self.queue_depth)
+
+    def get_stats(self):
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "queue_depth": self.queue_depth,
+            "rejected": self.rejected,
+        }
+
+    def after_fork(self):
+        """Forget the pool inherited through fork, its worker threads do not exist in the child"""
+        self._pool = None
+        self.pending = 0
+        self._lock = threading.Lock()
+        QUEUE_DEPTH.set(0)
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
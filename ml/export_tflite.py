@@ -0,0 +1,39 @@
+"""Convert the Keras model to a TensorFlow Lite flatbuffer for the tflite backend.
+
+Usage:
+    python -m ml.export_tflite --model ml/model/model.keras --output ml/model/model.tflite
+"""
+import argparse
+import os
+import time
+
+def convert_to_tflite(model_path, output_path, configure=None):
+    """Convert a saved Keras model to .tflite and return the output size in bytes.
+
+    `configure(converter)` can set optimizations before conversion (see ml.quantize).
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if configure is not None:
+        configure(converter)
+    tflite_model = converter.convert()
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    return len(tflite_model)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="ml/model/model.keras")
+    parser.add_argument("--output", default="ml/model/model.tflite")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    size = convert_to_tflite(args.model, args.output)
+    print(f"[INFO] Exported {args.output} ({size / 1024 / 1024:.1f} MB) in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
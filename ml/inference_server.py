@@ -0,0 +1,228 @@
+"""Standalone inference server shared by every web worker on the node.
+
+The server owns the model and a shared memory ring of tensor slots. Web
+workers run with MODEL_BACKEND=remote: they decode and preprocess uploads
+themselves, write the tensors into their slots and send only slot indices
+over a Unix socket. Requests from all workers go through one BatchingEngine,
+so HTTP workers and inference capacity scale independently.
+
+Usage:
+    python -m ml.inference_server --model ml/model/model.tflite --socket /tmp/waste-classification-inference.sock
+"""
+from multiprocessing import shared_memory
+from dotenv import load_dotenv
+from ml.model import BatchingEngine, load_backend, TARGET_SIZE
+from ml.shm_ring import SlotRing, send_message, read_exact, REQUEST, REPLY, STATUS_OK, STATUS_ERROR
+import numpy as np
+import argparse
+import functools
+import os
+import signal
+import socket
+import threading
+
+load_dotenv()
+
+INPUT_SHAPE = (TARGET_SIZE[1], TARGET_SIZE[0], 3)
+
+class ClientRange:
+    """A connected client's slot range and its requests still in the batcher"""
+    __slots__ = ("first_slot", "in_flight", "closed")
+
+    def __init__(self, first_slot):
+        self.first_slot = first_slot
+        self.in_flight = 0
+        self.closed = False
+
+class InferenceServer:
+    """Serve one model to many client processes through a shared memory slot ring.
+
+    Every connection gets its own contiguous range of `slots_per_client`
+    slots, so clients never coordinate with each other. A request is one slot
+    index; the reply is the same index plus a status once the probabilities
+    have been written back into the slot.
+    """
+
+    def __init__(self, model_path=None, backend=None, address=None, slots=None, slots_per_client=None):
+        backend = backend or os.getenv("INFERENCE_SERVER_BACKEND")
+        if (backend or os.getenv("MODEL_BACKEND", "")).lower() == "remote":
+            # The web workers' MODEL_BACKEND=remote must not make the server connect to itself
+            backend = "tflite" if str(model_path or os.getenv("MODEL_PATH")).endswith(".tflite") else "keras"
+        self.backend, self.model_path = load_backend(model_path, backend)
+        self.address = address or os.getenv("INFERENCE_SERVER_SOCKET", "/tmp/waste-classification-inference.sock")
+        self.slots_per_client = int(slots_per_client or os.getenv("INFERENCE_SERVER_SLOTS_PER_CLIENT", 16))
+        self.slots = int(slots or os.getenv("INFERENCE_SERVER_SLOTS", 8 * self.slots_per_client))
+
+        # One dummy batch warms the model up and tells us the output width
+        num_classes = self.backend.predict(np.zeros((1, *INPUT_SHAPE), dtype=np.float32)).shape[1]
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * SlotRing.slot_size(INPUT_SHAPE, num_classes))
+        self.ring = SlotRing(self.shm.buf, self.slots, INPUT_SHAPE, num_classes)
+        self.batcher = BatchingEngine(
+            self.backend.predict,
+            max_batch_size=int(os.getenv("MODEL_BATCH_MAX_SIZE", 16)),
+            max_wait_ms=float(os.getenv("MODEL_BATCH_MAX_WAIT_MS", 10)),
+            target_latency_ms=float(os.getenv("MODEL_BATCH_TARGET_LATENCY_MS", 150)),
+        )
+
+        self.clients = 0
+        self.refused = 0
+        self._free_ranges = list(range(0, self.slots - self.slots_per_client + 1, self.slots_per_client))
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sock = None
+        self._connections = {}  # conn -> handler thread
+
+    def listen(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.address)
+        self._sock.listen(128)
+
+    def serve_forever(self):
+        if self._sock is None:
+            self.listen()
+        print(f"[INFO] Inference server for {self.model_path} listening on {self.address} "
+              f"({self.slots} slots, {self.slots_per_client} per client)")
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self._handle_client, args=(conn,), name="inference-server-client", daemon=True)
+            with self._lock:
+                if self._stopped.is_set():
+                    conn.close()
+                    break
+                self._connections[conn] = thread
+            thread.start()
+
+    def _handle_client(self, conn):
+        with self._lock:
+            first_slot = self._free_ranges.pop(0) if self._free_ranges else None
+            if first_slot is None:
+                self.refused += 1
+            else:
+                self.clients += 1
+        if first_slot is None:
+            try:
+                send_message(conn, {"error": f"all {self.slots} slots are in use"})
+            except OSError:
+                pass
+            finally:
+                conn.close()
+                with self._lock:
+                    self._connections.pop(conn, None)
+            return
+
+        client = ClientRange(first_slot)
+        send_lock = threading.Lock()
+        try:
+            send_message(conn, {
+                "shm": self.shm.name,
+                "slots": self.slots,
+                "first_slot": first_slot,
+                "slot_count": self.slots_per_client,
+                "input_shape": list(INPUT_SHAPE),
+                "num_classes": self.ring.num_classes,
+                "model_path": self.model_path,
+                "backend": self.backend.name,
+            })
+            stream = conn.makefile("rb")
+            while True:
+                (slot,) = REQUEST.unpack(read_exact(stream, REQUEST.size))
+                if not first_slot <= slot < first_slot + self.slots_per_client:
+                    print(f"[WARN] Client sent slot {slot} outside its range, ignoring")
+                    continue
+                future = self.batcher.submit(self.ring.inputs[slot])
+                with self._lock:
+                    client.in_flight += 1
+                future.add_done_callback(functools.partial(self._reply, conn, send_lock, client, slot))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+            with self._lock:
+                self._connections.pop(conn, None)
+                client.closed = True
+                self.clients -= 1
+                self._release_range(client)
+
+    def _release_range(self, client):
+        # Called with the lock held. A request still in the batcher would write its
+        # result into the range after the next client got it, so wait for it to settle
+        if client.closed and client.in_flight == 0:
+            self._free_ranges.append(client.first_slot)
+
+    def _reply(self, conn, send_lock, client, slot, future):
+        try:
+            try:
+                self.ring.outputs[slot] = future.result()
+                status = STATUS_OK
+            except Exception as e:
+                print(f"[ERROR] Inference failed: {e}")
+                status = STATUS_ERROR
+            try:
+                with send_lock:
+                    conn.sendall(REPLY.pack(slot, status))
+            except OSError:
+                pass  # The client went away
+        finally:
+            with self._lock:
+                client.in_flight -= 1
+                self._release_range(client)
+
+    def get_stats(self):
+        return {"clients": self.clients, "refused": self.refused, "slots": self.slots, **self.batcher.get_stats()}
+
+    def stop(self):
+        self._stopped.set()
+        if self._sock is not None:
+            try:
+                # Wakes up the accept() in serve_forever, close() alone does not
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        # Wake every handler out of its read and wait for it, they index into the ring
+        with self._lock:
+            connections = list(self._connections.items())
+        for conn, _ in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for _, thread in connections:
+            thread.join(timeout=5)
+        self.batcher.stop()
+        self.backend.close()
+        # Release our numpy views before closing the mapping they point into
+        self.ring = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Requests still queued in the batcher hold views into the block
+        self.shm.unlink()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=None, help="Model file (default: MODEL_PATH)")
+    parser.add_argument("--backend", default=None, help="keras or tflite (default: INFERENCE_SERVER_BACKEND or from the file extension)")
+    parser.add_argument("--socket", default=None, help="Unix socket path (default: INFERENCE_SERVER_SOCKET)")
+    parser.add_argument("--slots", type=int, default=None)
+    parser.add_argument("--slots-per-client", type=int, default=None)
+    args = parser.parse_args()
+
+    server = InferenceServer(args.model, args.backend, args.socket, args.slots, args.slots_per_client)
+    server.listen()
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    print(f"[INFO] Inference server stopped: {server.get_stats()}")
+
+if __name__ == "__main__":
+    main()
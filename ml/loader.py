@@ -0,0 +1,76 @@
+import threading
+import time
+
+class ModelNotReady(Exception):
+    """Raised when the classifier is used before its background load has finished"""
+
+class BackgroundClassifier:
+    """Build a classifier on a background thread and expose it once it is ready.
+
+    Importing the app only creates this placeholder; `start` runs `factory`
+    (TensorFlow import, model deserialization, warm-up) off the event loop so
+    the server can bind its port right away. Until the load has finished,
+    `model` is None and every other attribute raises ModelNotReady.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.status = "idle"  # idle -> loading -> ready | failed
+        self.error = None
+        self.load_time = None
+        self._classifier = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Begin loading in a daemon thread, returns immediately"""
+        with self._lock:
+            if self.status != "idle":
+                return
+            self.status = "loading"
+            self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+        self._thread.start()
+
+    def load(self):
+        """Load synchronously, e.g. for scripts that need the model straight away"""
+        self.start()
+        self.wait()
+        return self._classifier
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            self._classifier = self.factory()
+            self.status = "ready"
+            self.load_time = time.perf_counter() - start
+            print(f"[INFO] Model ready in {self.load_time:.1f}s")
+        except Exception as e:
+            self.error = e
+            self.status = "failed"
+            print(f"[ERROR] Failed to load model: {e}")
+        finally:
+            self._ready.set()
+
+    @property
+    def model(self):
+        return self._classifier.model if self._classifier is not None else None
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined on the placeholder itself
+        classifier = self.__dict__.get("_classifier")
+        if classifier is None:
+            if name.startswith("_"):
+                # Keep introspection (copy, pickle, mock.patch) working while loading
+                raise AttributeError(name)
+            if self.__dict__.get("status") == "failed":
+                raise ModelNotReady(f"Model failed to load: {self.error}")
+            raise ModelNotReady("Model is still loading. Please retry later.")
+        return getattr(classifier, name)
+
+    def close(self):
+        if self._classifier is not None:
+            self._classifier.close()
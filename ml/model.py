@@ -1,26 +1,986 @@
 import numpy as np
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.resnet50 import preprocess_input
-from tensorflow.keras.models import load_model
+from ml.executor import InferenceExecutor
+from ml import tracing
+from ml.weights import is_mapped_model, load_mapped_model
+from ml.shm_ring import SlotRing, attach_shared_memory, recv_message, read_exact, REQUEST, REPLY, STATUS_OK
+from concurrent.futures import Future
+from dotenv import load_dotenv
+from PIL import Image
+from prometheus_client import Histogram
 import io
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+# Optional faster decoders, used when installed
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+except ImportError:
+    TurboJPEG = None
+
+load_dotenv()
+
+# Input size of the ResNet50 classifier (width, height)
+TARGET_SIZE = (224, 224)
+
+# Per-stage latency exported on /metrics, buckets from 100 us to 5 s
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DECODE_SECONDS = Histogram(
+    "waste_classification_decode_seconds", "Image decode and resize time per image", buckets=STAGE_BUCKETS)
+PREPROCESS_SECONDS = Histogram(
+    "waste_classification_preprocess_seconds", "preprocess_input time per image", buckets=STAGE_BUCKETS)
+INFERENCE_SECONDS = Histogram(
+    "waste_classification_inference_seconds", "Forward pass time per batch", buckets=STAGE_BUCKETS)
+
+def decode_image(image_data, target_size=TARGET_SIZE):
+    """Decode an upload straight to a (height, width, 3) uint8 RGB array of `target_size`.
+
+    Images already at `target_size` (resized on the camera) are only decoded
+    and converted, with no resampling step. For larger JPEGs, draft mode lets
+    libjpeg scale by 1/2, 1/4 or 1/8 during the DCT so a 12 MP photo is
+    decoded at roughly 500 px instead of full resolution. Any remaining
+    integer factor is removed with reduce() (box filter) and the final resize
+    uses nearest-neighbour, like keras load_img. Other formats (PNG, WebP, ...)
+    skip the draft step and go through reduce() and resize.
+    """
+    img = Image.open(io.BytesIO(image_data))
+    if img.size == target_size:
+        return _to_rgb_array(img)
+    if img.format == "JPEG":
+        img.draft("RGB", target_size)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    factor = min(img.width // target_size[0], img.height // target_size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != target_size:
+        img = img.resize(target_size, Image.NEAREST)
+    return np.asarray(img, dtype=np.uint8)
+
+def _to_rgb_array(img):
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img, dtype=np.uint8)
+
+# Raw tensor uploads skip image decoding: a 12-byte header (magic, height,
+# width, channels) followed by height * width * 3 uint8 RGB bytes in HWC order
+RAW_TENSOR_MAGIC = b"WCT1"
+RAW_TENSOR_HEADER = struct.Struct("<4sHHB3x")
+
+def is_raw_tensor(image_data):
+    return image_data[:4] == RAW_TENSOR_MAGIC
+
+def encode_raw_tensor(img_array):
+    """Pack a uint8 (height, width, 3) RGB array in the raw tensor upload format"""
+    img_array = np.ascontiguousarray(img_array, dtype=np.uint8)
+    if img_array.ndim != 3 or img_array.shape[2] != 3:
+        raise ValueError(f"Raw tensor must be (height, width, 3), got {img_array.shape}")
+    height, width, channels = img_array.shape
+    return RAW_TENSOR_HEADER.pack(RAW_TENSOR_MAGIC, height, width, channels) + img_array.tobytes()
+
+def raw_tensor_array(image_data):
+    """Read-only (height, width, 3) uint8 view over the pixels of a raw tensor upload"""
+    if len(image_data) < RAW_TENSOR_HEADER.size:
+        raise ValueError(f"Raw tensor header must be {RAW_TENSOR_HEADER.size} bytes, got {len(image_data)}")
+    magic, height, width, channels = RAW_TENSOR_HEADER.unpack_from(image_data)
+    if magic != RAW_TENSOR_MAGIC:
+        raise ValueError("Not a raw tensor upload")
+    if channels != 3:
+        raise ValueError(f"Raw tensor must have 3 (RGB) channels, got {channels}")
+    if height == 0 or width == 0:
+        raise ValueError(f"Raw tensor must have a positive size, got {height}x{width}")
+    expected = RAW_TENSOR_HEADER.size + height * width * channels
+    if len(image_data) != expected:
+        raise ValueError(f"Raw tensor of {height}x{width}x{channels} must be {expected} bytes, got {len(image_data)}")
+    return np.frombuffer(image_data, dtype=np.uint8, offset=RAW_TENSOR_HEADER.size).reshape(height, width, channels)
+
+def decode_raw_tensor(image_data, target_size=TARGET_SIZE):
+    """Raw tensor upload to a uint8 RGB array of `target_size`, resampled only when needed"""
+    return _resize_array(raw_tensor_array(image_data), target_size)
+
+# keras resnet50.preprocess_input ("caffe" mode): RGB -> BGR, then subtract the ImageNet means in BGR order
+IMAGENET_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+def preprocess_into(img_array, out):
+    """Write a uint8 (224, 224, 3) RGB array into float32 `out` with preprocess_input semantics.
+
+    Each output channel is written by one ufunc that casts, flips and subtracts
+    the mean in a single pass, so no intermediate full-size array is allocated.
+    """
+    for channel in range(3):
+        np.subtract(img_array[..., 2 - channel], IMAGENET_MEAN_BGR[channel], out=out[..., channel], casting="unsafe")
+    return out
+
+def _resize_array(img_array, target_size):
+    """Nearest-neighbour resize of a uint8 HWC array, reducing integer factors first"""
+    if (img_array.shape[1], img_array.shape[0]) == target_size:
+        return np.ascontiguousarray(img_array)
+    img = Image.fromarray(img_array)
+    factor = min(img.width // target_size[0], img.height // target_size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != target_size:
+        img = img.resize(target_size, Image.NEAREST)
+    return np.asarray(img, dtype=np.uint8)
+
+def _is_jpeg(image_data):
+    return image_data[:3] == b"\xff\xd8\xff"
+
+class ImageDecoder:
+    """Decoder backend interface.
+
+    `decode` must return a C-contiguous (height, width, 3) uint8 RGB array of
+    `target_size` so preprocessing is identical whichever backend is used.
+    """
+    name = None
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def decode(self, image_data, target_size=TARGET_SIZE):
+        raise NotImplementedError
+
+class PillowDecoder(ImageDecoder):
+    """Baseline backend, always available"""
+    name = "pillow"
+
+    def decode(self, image_data, target_size=TARGET_SIZE):
+        return decode_image(image_data, target_size)
+
+class OpenCVDecoder(ImageDecoder):
+    """libjpeg(-turbo) through cv2.imdecode, with IMREAD_REDUCED_* DCT scaling for JPEG"""
+    name = "opencv"
+
+    @classmethod
+    def available(cls):
+        return cv2 is not None
+
+    def decode(self, image_data, target_size=TARGET_SIZE):
+        flags = cv2.IMREAD_COLOR
+        if _is_jpeg(image_data):
+            # Header only, no pixel decode
+            width, height = Image.open(io.BytesIO(image_data)).size
+            for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if width // factor >= target_size[0] and height // factor >= target_size[1]:
+                    flags = reduced
+                    break
+        # Pillow and TurboJPEG return the stored pixels, OpenCV would apply the EXIF rotation
+        img_array = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img_array is None:
+            raise ValueError("Cannot identify image file")
+        img_array = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
+        return _resize_array(img_array, target_size)
+
+class TurboJPEGDecoder(ImageDecoder):
+    """libjpeg-turbo through PyTurboJPEG for JPEG with scaled decoding, Pillow for other formats"""
+    name = "turbojpeg"
+
+    def __init__(self):
+        self.jpeg = TurboJPEG()
+        self.fallback = PillowDecoder()
+
+    @classmethod
+    def available(cls):
+        if TurboJPEG is None:
+            return False
+        try:
+            TurboJPEG()
+        except Exception:  # the shared libturbojpeg library is missing
+            return False
+        return True
+
+    def decode(self, image_data, target_size=TARGET_SIZE):
+        if not _is_jpeg(image_data):
+            return self.fallback.decode(image_data, target_size)
+        width, height, _, _ = self.jpeg.decode_header(image_data)
+        # Smallest supported scale that still covers the target size
+        scaling_factor = None
+        for num, denom in sorted(self.jpeg.scaling_factors, key=lambda f: f[0] / f[1]):
+            if width * num // denom >= target_size[0] and height * num // denom >= target_size[1]:
+                scaling_factor = (num, denom)
+                break
+        img_array = self.jpeg.decode(image_data, pixel_format=TJPF_RGB, scaling_factor=scaling_factor)
+        return _resize_array(img_array, target_size)
+
+DECODERS = {decoder.name: decoder for decoder in (PillowDecoder, OpenCVDecoder, TurboJPEGDecoder)}
+
+def _benchmark_sample():
+    x = np.linspace(0, 255, 1280, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, 960, dtype=np.float32)[:, None, None]
+    pixels = np.concatenate([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def select_decoder(preference=None, runs=5):
+    """Pick the image decoder backend (IMAGE_DECODER=auto|pillow|opencv|turbojpeg).
+
+    With `auto`, every installed backend decodes a 1280x960 JPEG a few times
+    and the one with the lowest median time wins. Pillow is the fallback.
+    """
+    preference = (preference or os.getenv("IMAGE_DECODER", "auto")).lower()
+    if preference != "auto":
+        if preference not in DECODERS:
+            raise ValueError(f"Unknown image decoder '{preference}', expected 'auto' or one of {sorted(DECODERS)}")
+        if not DECODERS[preference].available():
+            raise RuntimeError(f"Image decoder '{preference}' is not installed")
+        return DECODERS[preference]()
+
+    candidates = [decoder() for decoder in DECODERS.values() if decoder.available()]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    sample = _benchmark_sample()
+    timings = {}
+    for decoder in candidates:
+        try:
+            decoder.decode(sample)  # warm-up
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                decoder.decode(sample)
+                samples.append(time.perf_counter() - start)
+            timings[decoder.name] = (float(np.median(samples)), decoder)
+        except Exception as e:
+            print(f"[WARN] Image decoder {decoder.name} failed self-benchmark: {e}")
+    if not timings:
+        return PillowDecoder()
+    name, (elapsed, decoder) = min(timings.items(), key=lambda item: item[1][0])
+    print(f"[INFO] Selected image decoder: {name} ({elapsed * 1000:.1f} ms per 1280x960 JPEG)")
+    return decoder
+
+class BatchingEngine:
+    """Collect concurrent single-image requests and run them as one stacked forward pass.
+
+    Callers submit one preprocessed (224, 224, 3) array and get back its own
+    probability vector. A background thread waits up to `window` seconds (or
+    until `max_batch_size` requests are queued), stacks the inputs into a single
+    batch and calls `infer_fn` once. The window adapts so that queueing time plus
+    the observed forward-pass time stays within `target_latency_ms`.
+    """
+
+    def __init__(self, infer_fn, max_batch_size=16, max_wait_ms=10.0, target_latency_ms=150.0):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000)
+        self.target_latency = target_latency_ms / 1000
+        self.window = self.max_wait
+        self.infer_time = 0.0  # exponential moving average of one forward pass (seconds)
+        self.batches_run = 0
+        self.requests_served = 0
+
+        self._buffer = None
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        # Orders submit() against stop() so nothing is queued behind the stop sentinel
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="batching-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, img_array) -> Future:
+        """Queue a single (224, 224, 3) array and return a future for its prediction
+
+        Once the engine is stopped the returned future fails with RuntimeError.
+        """
+        future = Future()
+        with self._submit_lock:
+            if self._stopped.is_set():
+                future.set_exception(RuntimeError("Batching engine is stopped"))
+            else:
+                self._queue.put((img_array, future))
+        return future
+
+    def infer(self, img_array):
+        """Blocking helper: submit one array and wait for its prediction vector"""
+        return self.submit(img_array).result()
+
+    def after_fork(self):
+        """Restart the collector thread in a forked child, fork only copies the calling thread"""
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="batching-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._submit_lock:
+            self._stopped.set()
+            self._queue.put(None)
+        self._thread.join(timeout=5)
+        # Fail anything the collector left queued when it saw the stop flag
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("Batching engine is stopped"))
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Always drain what is already queued, only block while the window is open
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _stack(self, arrays):
+        # Only the batching thread touches this buffer, reuse it for every batch
+        if self._buffer is None or self._buffer.shape[1:] != arrays[0].shape:
+            self._buffer = np.empty((self.max_batch_size, *arrays[0].shape), dtype=arrays[0].dtype)
+        return np.stack(arrays, out=self._buffer[:len(arrays)])
+
+    def _adapt(self, elapsed):
+        # Keep (window + forward pass) within the latency target, never above max_wait
+        self.infer_time = elapsed if self.batches_run == 0 else 0.8 * self.infer_time + 0.2 * elapsed
+        self.window = min(self.max_wait, max(0.0, self.target_latency - self.infer_time))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if batch is None:
+                break
+            futures = [future for _, future in batch]
+            try:
+                inputs = self._stack([img_array for img_array, _ in batch])
+                start = time.monotonic()
+                outputs = self.infer_fn(inputs)
+                self._adapt(time.monotonic() - start)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.requests_served += len(batch)
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+
+    def get_stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "infer_time_ms": self.infer_time * 1000,
+            "batches_run": self.batches_run,
+            "requests_served": self.requests_served,
+            "queue_size": self._queue.qsize(),
+        }
+
+def model_fingerprint(model_path):
+    """Identify a model file by path, size and modification time (used to invalidate caches)"""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return model_path
+    return f"{model_path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+class InferenceBackend:
+    """Inference backend interface.
+
+    `predict` takes a preprocessed float32 (N, 224, 224, 3) batch and returns
+    an (N, 4) array of class probabilities. `model` is the loaded runtime
+    object (None until loaded), which /healthcheck reports on.
+    """
+    name = None
+    model = None
+    # Whether a loaded backend keeps working in a child created by os.fork (see app.serve)
+    fork_safe = False
+
+    def predict(self, img_batch):
+        raise NotImplementedError
+
+    def after_fork(self):
+        pass
+
+    def close(self):
+        pass
+
+class KerasBackend(InferenceBackend):
+    """Full TensorFlow/Keras model, optionally served through a compiled tf.function"""
+    name = "keras"
+    # TensorFlow starts its runtime thread pools while loading and they do not survive fork
+    fork_safe = False
+
+    def __init__(self, model_path, compiled=None, jit_compile=None):
+        if is_mapped_model(model_path):
+            # Weights exported by ml.weights: mapped and copied in, no unzip or parsing
+            self.model = load_mapped_model(model_path)
+        else:
+            # Imported here so the TFLite backend never pays for loading TensorFlow
+            from tensorflow.keras.models import load_model
+            self.model = load_model(model_path)
+
+        # Compiled tf.function path (MODEL_COMPILED) with optional XLA (MODEL_XLA)
+        if compiled is None:
+            compiled = os.getenv("MODEL_COMPILED", "true").lower() == "true"
+        if jit_compile is None:
+            jit_compile = os.getenv("MODEL_XLA", "false").lower() == "true"
+        self.compiled = compiled
+        self.jit_compile = jit_compile
+        self._infer_fn = self._build_infer_fn()
+
+    def _build_infer_fn(self):
+        if not self.compiled:
+            return self.model.predict
+
+        import tensorflow as tf
+        # Fixed input signature, the batch dimension stays dynamic
+        input_signature = [tf.TensorSpec(shape=[None, TARGET_SIZE[1], TARGET_SIZE[0], 3], dtype=tf.float32)]
+
+        # Calling the model directly inside a tf.function skips the data adapter and
+        # callback machinery that keras Model.predict sets up on every call
+        @tf.function(input_signature=input_signature, jit_compile=self.jit_compile)
+        def serve(img_batch):
+            return self.model(img_batch, training=False)
+
+        def infer(img_batch):
+            return serve(tf.convert_to_tensor(img_batch, dtype=tf.float32)).numpy()
+
+        return infer
+
+    def predict(self, img_batch):
+        return self._infer_fn(img_batch)
+
+def _tflite_interpreter_class():
+    # Prefer the standalone runtimes, they do not import TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+class TFLiteBackend(InferenceBackend):
+    """TensorFlow Lite flatbuffer run by the TFLite interpreter (XNNPACK on CPU).
+
+    Float, dynamic-range and full-int8 models are supported; integer inputs
+    and outputs are (de)quantized with the tensor's scale and zero point.
+    The interpreter is not thread-safe, so every inference thread gets its own
+    one. They all map the same model file, so the weights are not duplicated.
+    """
+    name = "tflite"
+    fork_safe = True
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.num_threads = int(num_threads or os.getenv("TFLITE_NUM_THREADS", 0)) or None
+        self._interpreter_class = _tflite_interpreter_class()
+        self._local = threading.local()
+        self.model = self._interpreter()
+
+    def _interpreter(self):
+        interpreter = getattr(self._local, "interpreter", None)
+        if interpreter is None:
+            interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+        return interpreter
+
+    def after_fork(self):
+        # Interpreters created before the fork own thread pools that did not survive it
+        self._local = threading.local()
+
+    def predict(self, img_batch):
+        interpreter = self._interpreter()
+        input_detail = interpreter.get_input_details()[0]
+        output_detail = interpreter.get_output_details()[0]
+        if input_detail["shape"][0] != len(img_batch):
+            # Batch size changed, re-plan the tensors for the new shape
+            interpreter.resize_tensor_input(input_detail["index"], [len(img_batch), *input_detail["shape"][1:]])
+            interpreter.allocate_tensors()
+        interpreter.set_tensor(input_detail["index"], self._quantize(img_batch, input_detail))
+        interpreter.invoke()
+        # get_tensor returns a copy, safe to keep after the next invoke
+        return self._dequantize(interpreter.get_tensor(output_detail["index"]), output_detail)
+
+    @staticmethod
+    def _quantize(img_batch, detail):
+        # Full-integer models (see ml.quantize) take int8/uint8 inputs: q = x / scale + zero_point
+        dtype = np.dtype(detail["dtype"])
+        if dtype.kind not in "iu":
+            return np.ascontiguousarray(img_batch, dtype=dtype)
+        scale, zero_point = detail["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(img_batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    @staticmethod
+    def _dequantize(output, detail):
+        if np.dtype(detail["dtype"]).kind not in "iu":
+            return output
+        scale, zero_point = detail["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
+
+class InferenceConnection:
+    """One connection to the inference server and the slot range it handed out.
+
+    A reader thread resolves the pending futures as replies arrive. Once the
+    connection is lost, `lost` holds the error and every pending or later
+    request fails with ConnectionError; RemoteBackend then opens a new one.
+    """
+
+    def __init__(self, address):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+            stream = sock.makefile("rb")
+            hello = recv_message(stream)
+        except BaseException:
+            sock.close()
+            raise
+        if "error" in hello:
+            sock.close()
+            raise ConnectionError(f"Inference server refused the connection: {hello['error']}")
+        self.sock = sock
+        self.stream = stream
+        self.hello = hello
+        self.shm = attach_shared_memory(hello["shm"])
+        self.ring = SlotRing(self.shm.buf, hello["slots"], hello["input_shape"], hello["num_classes"])
+        self.free = list(range(hello["first_slot"], hello["first_slot"] + hello["slot_count"]))
+        self.slot_count = hello["slot_count"]
+        self.lost = None
+        self.slots_available = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.pending = {}  # slot -> Future
+        self.reader = threading.Thread(target=self._read_replies, name="inference-client", daemon=True)
+        self.reader.start()
+
+    def _read_replies(self):
+        try:
+            while True:
+                slot, status = REPLY.unpack(read_exact(self.stream, REPLY.size))
+                future = self.pending.pop(slot, None)
+                if future is None:
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(slot)
+                else:
+                    future.set_exception(RuntimeError("Inference server failed to run the batch"))
+        except (ConnectionError, OSError, ValueError) as e:
+            with self.slots_available:
+                self.lost = e
+                # Wake callers waiting for slots, they fail instead
+                self.slots_available.notify_all()
+            for slot in list(self.pending):
+                self.pending.pop(slot).set_exception(ConnectionError(f"Lost inference server: {e}"))
+
+    def _acquire(self, count):
+        with self.slots_available:
+            # All-or-nothing so concurrent callers cannot each hold half of what they need
+            while len(self.free) < count and self.lost is None:
+                self.slots_available.wait()
+            if self.lost is not None:
+                raise ConnectionError(f"Lost inference server: {self.lost}")
+            slots, self.free = self.free[:count], self.free[count:]
+            return slots
+
+    def _release(self, slots):
+        with self.slots_available:
+            self.free.extend(slots)
+            self.slots_available.notify_all()
+
+    def predict(self, img_batch, timeout):
+        results = []
+        for start in range(0, len(img_batch), self.slot_count):
+            chunk = img_batch[start:start + self.slot_count]
+            slots = self._acquire(len(chunk))
+            futures = {}
+            try:
+                ring = self.ring
+                if ring is None:
+                    raise ConnectionError("Connection to the inference server is closed")
+                for img_array, slot in zip(chunk, slots):
+                    ring.inputs[slot] = img_array
+                for slot in slots:
+                    futures[slot] = self.pending[slot] = Future()
+                with self.send_lock:
+                    self.sock.sendall(b"".join(REQUEST.pack(slot) for slot in slots))
+                for future in futures.values():
+                    future.result(timeout=timeout)
+                # Fancy indexing copies the rows out before the slots are reused
+                results.append(ring.outputs[slots])
+            finally:
+                self._release_settled(slots, futures)
+        return np.concatenate(results)
+
+    def _release_settled(self, slots, futures):
+        """Free the slots whose reply arrived; the rest are freed by their late reply.
+
+        After a timeout the server may still be writing a slot, reusing it
+        right away would let that late result land in the next request.
+        """
+        settled = []
+        for slot in slots:
+            future = futures.get(slot)
+            if future is None or future.done():
+                settled.append(slot)
+            else:
+                future.add_done_callback(lambda _, slot=slot: self._release([slot]))
+        self._release(settled)
+
+    def detach(self):
+        """Drop a connection inherited through fork without touching the parent's.
+
+        Only our copy of the descriptor is closed: shutting the socket down would
+        cut the parent off too, and the stream's buffer lock may still be held by
+        the parent's reader thread.
+        """
+        os.close(self.sock.detach())
+        self._close_ring()
+
+    def close(self):
+        try:
+            # Shut down explicitly, the reader's file object keeps the socket open otherwise
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._close_ring()
+
+    def _close_ring(self):
+        # Drop our views first, the mapping cannot be closed while they exist
+        self.ring = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A caller still holds a view, the mapping goes away with the process
+
+class RemoteBackend(InferenceBackend):
+    """Forward batches to a separate inference server process (see ml.inference_server).
+
+    The server hands every client its own range of slots in a shared memory
+    ring. `predict` copies the preprocessed images into free slots, sends the
+    slot indices over a Unix socket and reads the probabilities back from the
+    same slots, so tensors are never pickled. The server batches requests
+    from all connected web workers together.
+
+    A worker that starts before the server waits up to `connect_timeout`
+    seconds for it. When the connection is lost (e.g. the server restarted)
+    the failing call raises ConnectionError and a later call reconnects,
+    trying at most once per backoff interval (doubling up to `retry_max`).
+    """
+    name = "remote"
+    # A forked child opens its own connection and slot range in after_fork. app.serve
+    # still does not preload it: the master would hold a slot range for the whole run
+    fork_safe = True
+
+    def __init__(self, address=None, timeout=None, connect_timeout=None, retry_max=None):
+        self.address = address or os.getenv("INFERENCE_SERVER_SOCKET", "/tmp/waste-classification-inference.sock")
+        self.timeout = float(timeout or os.getenv("INFERENCE_SERVER_TIMEOUT", 30))
+        if connect_timeout is None:
+            connect_timeout = os.getenv("INFERENCE_SERVER_CONNECT_TIMEOUT", 60)
+        self.connect_timeout = float(connect_timeout)
+        self.retry_max = float(retry_max or os.getenv("INFERENCE_SERVER_RETRY_MAX", 5))
+        self._connection = None
+        self._lock = threading.Lock()
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._connect_at_start()
+
+    def _connect_at_start(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                self._connect()
+                return
+            except (ConnectionError, OSError) as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise
+                if self._backoff == 0:
+                    print(f"[WARN] Inference server at {self.address} is not available ({e}), "
+                          f"waiting up to {self.connect_timeout:g} s")
+                time.sleep(min(self._next_backoff(), remaining))
+
+    def _connect(self):
+        connection = InferenceConnection(self.address)
+        self._connection = connection
+        self.model = connection.hello
+        self.model_path = connection.hello["model_path"]
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        return connection
+
+    def _next_backoff(self):
+        self._backoff = min(self.retry_max, max(0.1, self._backoff * 2))
+        return self._backoff
+
+    def _current_connection(self):
+        """The live connection, reconnecting when the last one was lost"""
+        with self._lock:
+            connection = self._connection
+            if connection is not None and connection.lost is None:
+                return connection
+            if connection is not None:
+                connection.close()
+                self._connection = None
+            now = time.monotonic()
+            if now < self._retry_at:
+                raise ConnectionError(f"Inference server unavailable, next retry in {self._retry_at - now:.1f} s")
+            try:
+                connection = self._connect()
+            except (ConnectionError, OSError) as e:
+                self._retry_at = now + self._next_backoff()
+                raise ConnectionError(f"Cannot reach the inference server: {e}") from e
+            print(f"[INFO] Reconnected to the inference server at {self.address}")
+            return connection
+
+    def _drop(self, connection):
+        with self._lock:
+            if self._connection is connection:
+                connection.close()
+                self._connection = None
+
+    def predict(self, img_batch):
+        connection = self._current_connection()
+        try:
+            return connection.predict(img_batch, self.timeout)
+        except TimeoutError:
+            # The server is slow, not gone: keep the connection and its held slots
+            raise
+        except (ConnectionError, OSError):
+            # BrokenPipeError included: the next call reconnects
+            self._drop(connection)
+            raise
+
+    def after_fork(self):
+        # The parent's connection and reader thread belong to the parent
+        self._lock = threading.Lock()
+        if self._connection is not None:
+            self._connection.detach()
+            self._connection = None
+        self._connect()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend, TFLiteBackend, RemoteBackend)}
+
+# Default model file of each backend
+DEFAULT_MODEL_PATHS = {"keras": "ml/model/model.keras", "tflite": "ml/model/model.tflite"}
+
+def resolve_backend(model_path=None, backend=None):
+    """Name and model path of the backend selected by MODEL_BACKEND (keras|tflite), without loading it.
+
+    When no backend is configured it is inferred from the model file extension.
+    """
+    model_path = model_path or os.getenv("MODEL_PATH")
+    backend = (backend or os.getenv("MODEL_BACKEND") or
+               ("tflite" if str(model_path).endswith(".tflite") else "keras")).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {sorted(BACKENDS)}")
+    return backend, model_path or DEFAULT_MODEL_PATHS.get(backend)
+
+def load_backend(model_path=None, backend=None, **keras_options):
+    """Create the inference backend selected by MODEL_BACKEND, see resolve_backend.
+
+    Returns the backend and the resolved model path.
+    """
+    backend, model_path = resolve_backend(model_path, backend)
+    if backend == "keras":
+        return KerasBackend(model_path, **keras_options), model_path
+    if backend == "remote":
+        # The model lives in the inference server, report the file it serves
+        remote = RemoteBackend()
+        return remote, remote.model_path
+    return TFLiteBackend(model_path), model_path
 
 class WasteClassifier:
-    def __init__(self, model_path='ml/model/model.keras'):
-        self.model = load_model(model_path)
+    def __init__(self, model_path=None, batching=None, executor=None,
+                 compiled=None, jit_compile=None, warmup=None, decoder=None, backend=None):
+        self.backend, model_path = load_backend(model_path, backend, compiled=compiled, jit_compile=jit_compile)
+        self.model = self.backend.model
+        self.model_path = model_path
+        self.model_version = model_fingerprint(model_path)
         self.class_names = ['hazardous', 'organic', 'other', 'recycle']
+        self.decoder = decoder if isinstance(decoder, ImageDecoder) else select_decoder(decoder)
+
+        # Preallocated per-thread input buffers and their debug counters
+        self._buffers = threading.local()
+        self._stats_lock = threading.Lock()
+        self.buffer_allocations = 0
+        self.images_preprocessed = 0
+
+        # Executor used by predict_async (INFERENCE_EXECUTOR=thread|process)
+        self.executor = executor or InferenceExecutor(initializer=_init_process_worker,
+                                                      initargs=(model_path, self.backend.name))
+
+        # Optional micro-batching of concurrent requests (MODEL_BATCHING=true)
+        if batching is None:
+            batching = os.getenv("MODEL_BATCHING", "false").lower() == "true"
+        self.batcher = None
+        if batching:
+            self.batcher = BatchingEngine(
+                self._predict_batch,
+                max_batch_size=int(os.getenv("MODEL_BATCH_MAX_SIZE", 16)),
+                max_wait_ms=float(os.getenv("MODEL_BATCH_MAX_WAIT_MS", 10)),
+                target_latency_ms=float(os.getenv("MODEL_BATCH_TARGET_LATENCY_MS", 150)),
+            )
+
+        # Pay tracing (and XLA compilation) at load time instead of on the first request
+        if warmup is None:
+            warmup = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+        if warmup:
+            self.warmup()
+
+    def warmup(self):
+        """Run dummy batches through the inference function so graphs are traced before serving"""
+        start = time.perf_counter()
+        batch_sizes = [1]
+        if self.batcher is not None and self.batcher.max_batch_size > 1:
+            batch_sizes.append(self.batcher.max_batch_size)
+        for batch_size in batch_sizes:
+            self._predict_batch(np.zeros((batch_size, 224, 224, 3), dtype=np.float32))
+        print(f"[INFO] Model warm-up completed in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def _input_buffer(self, batch_size):
+        """Per-thread preallocated float32 input batch, grown only when a larger batch arrives"""
+        buffer = getattr(self._buffers, "batch", None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = np.empty((max(batch_size, 1), 224, 224, 3), dtype=np.float32)
+            self._buffers.batch = buffer
+            with self._stats_lock:
+                self.buffer_allocations += 1
+        return buffer[:batch_size]
+
+    def decode(self, image_data):
+        """Upload bytes to a uint8 (224, 224, 3) RGB array: raw tensors bypass the image decoder"""
+        if is_raw_tensor(image_data):
+            return decode_raw_tensor(image_data)
+        return self.decoder.decode(image_data)
+
+    def _preprocess_into(self, image_data, out):
+        start = time.perf_counter()
+        img_array = self.decode(image_data)
+        decoded = time.perf_counter()
+        preprocess_into(img_array, out)
+        done = time.perf_counter()
+        DECODE_SECONDS.observe(decoded - start)
+        PREPROCESS_SECONDS.observe(done - decoded)
+        tracing.record("decode", start, decoded - start)
+        tracing.record("preprocess", decoded, done - decoded)
 
     #Preprocessing step
     def preprocess_image(self, image_data):
-        img = image.load_img(io.BytesIO(image_data), target_size=(224, 224))
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = preprocess_input(img_array)
-        return img_array
+        """Return a (1, 224, 224, 3) batch backed by this thread's input buffer.
 
-    def predict(self, image_data):
-        img_array = self.preprocess_image(image_data)
-        prediction = self.model.predict(img_array)[0]  # Lấy vector xác suất
+        The array is reused by the next preprocess call on the same thread, so
+        copy it if it has to outlive the current prediction.
+        """
+        img_batch = self._input_buffer(1)
+        self._preprocess_into(image_data, img_batch[0])
+        with self._stats_lock:
+            self.images_preprocessed += 1
+        return img_batch
+
+    def preprocess_batch(self, images):
+        """Decode and preprocess several images into one contiguous (N, 224, 224, 3) batch"""
+        img_batch = self._input_buffer(len(images))
+        for i, image_data in enumerate(images):
+            self._preprocess_into(image_data, img_batch[i])
+        with self._stats_lock:
+            self.images_preprocessed += len(images)
+        return img_batch
+
+    def get_preprocess_stats(self):
+        """Debug counters: input buffers allocated vs images preprocessed"""
+        return {
+            "buffer_allocations": self.buffer_allocations,
+            "images_preprocessed": self.images_preprocessed,
+        }
+
+    def _predict_batch(self, img_batch):
+        start = time.perf_counter()
+        predictions = self.backend.predict(img_batch)
+        elapsed = time.perf_counter() - start
+        INFERENCE_SECONDS.observe(elapsed)
+        tracing.record("inference", start, elapsed)
+        return predictions
+
+    def _to_result(self, prediction):
         predicted_class = self.class_names[np.argmax(prediction)]
         # Tạo dictionary chứa xác suất cho từng lớp (chuyển sang phần trăm)
         probabilities = {class_name: float(prob * 100) for class_name, prob in zip(self.class_names, prediction)}
-        return predicted_class, probabilities
\ No newline at end of file
+        return predicted_class, probabilities
+
+    def predict(self, image_data):
+        img_array = self.preprocess_image(image_data)
+        if self.batcher is not None:
+            # The forward pass runs on the batching thread, trace the wait for it here
+            with tracing.stage("inference"):
+                prediction = self.batcher.infer(img_array[0])
+        else:
+            prediction = self._predict_batch(img_array)[0]  # Lấy vector xác suất
+        return self._to_result(prediction)
+
+    def predict_batch(self, images):
+        """Classify several images with a single forward pass"""
+        if not images:
+            return []
+        predictions = self._predict_batch(self.preprocess_batch(images))
+        return [self._to_result(prediction) for prediction in predictions]
+
+    async def predict_async(self, image_data):
+        """Awaitable predict that runs decode and inference on the inference executor"""
+        if self.executor.kind == "process":
+            return await self.executor.run(_process_predict, image_data)
+        return await self.executor.run(self.predict, image_data)
+
+    async def predict_batch_async(self, images):
+        if self.executor.kind == "process":
+            return await self.executor.run(_process_predict_batch, images)
+        return await self.executor.run(self.predict_batch, images)
+
+    def after_fork(self):
+        """Recreate the threads and pools of a classifier inherited through os.fork.
+
+        The model weights stay shared with the parent copy-on-write, only the
+        executor, the batching thread and backend thread state are rebuilt.
+        """
+        self.backend.after_fork()
+        self.executor.after_fork()
+        if self.batcher is not None:
+            self.batcher.after_fork()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self.batcher is not None:
+            self.batcher.stop()
+            self.batcher = None
+        self.backend.close()
+
+# Process-pool workers load their own classifier once and reuse it for every job
+_process_classifier = None
+
+def _init_process_worker(model_path, backend):
+    global _process_classifier
+    _process_classifier = WasteClassifier(model_path, backend=backend)
+
+def _process_predict(image_data):
+    return _process_classifier.predict(image_data)
+
+def _process_predict_batch(images):
+    return _process_classifier.predict_batch(images)
@@ -0,0 +1,129 @@
+"""Post-training quantization of the Keras model with an accuracy/latency/size report.
+
+Produces a dynamic-range quantized model (int8 weights, float activations) and
+a full-int8 model calibrated on a folder of representative images, then
+compares both against the float model.
+
+Usage:
+    python -m ml.quantize --model ml/model/model.keras --calibration data/calibration \
+        --output-dir ml/model --report ml/model/quantization_report.json
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from ml.export_tflite import convert_to_tflite
+from ml.model import WasteClassifier, PillowDecoder, preprocess_into, TARGET_SIZE
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+def load_calibration_images(folder, limit=None):
+    """Preprocess every image under `folder` exactly like serving does, as one float32 batch"""
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(folder)
+        for name in names
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    if not paths:
+        raise ValueError(f"No calibration images found in {folder}")
+    decoder = PillowDecoder()
+    batch = np.empty((len(paths), TARGET_SIZE[1], TARGET_SIZE[0], 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            preprocess_into(decoder.decode(f.read()), batch[i])
+    return batch
+
+def representative_dataset(batch):
+    def generator():
+        for img_array in batch:
+            yield [img_array[np.newaxis]]
+    return generator
+
+def configure_dynamic_range(converter):
+    import tensorflow as tf
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+def configure_full_int8(batch):
+    def configure(converter):
+        import tensorflow as tf
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(batch)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return configure
+
+def top1_agreement(reference, candidate):
+    return float(np.mean(np.argmax(reference, axis=1) == np.argmax(candidate, axis=1)))
+
+def evaluate(classifier, batch, runs):
+    """Return per-image predictions and batch-1 latency percentiles of a loaded classifier"""
+    predictions = np.concatenate([classifier._predict_batch(batch[i:i + 1]) for i in range(len(batch))])
+    samples = []
+    for i in range(runs):
+        img_batch = batch[i % len(batch)][np.newaxis]
+        start = time.perf_counter()
+        classifier._predict_batch(img_batch)
+        samples.append(time.perf_counter() - start)
+    latency = {"p50_ms": float(np.percentile(samples, 50) * 1000), "p95_ms": float(np.percentile(samples, 95) * 1000)}
+    return predictions, latency
+
+def build_report(variants, batch, runs):
+    """Load every variant through WasteClassifier and compare it with the float model"""
+    report = {"calibration_images": len(batch), "latency_runs": runs, "models": {}}
+    reference = None
+    for name, (path, backend) in variants.items():
+        classifier = WasteClassifier(model_path=path, backend=backend, batching=False, warmup=True)
+        predictions, latency = evaluate(classifier, batch, runs)
+        classifier.close()
+        if reference is None:
+            reference = predictions
+        report["models"][name] = {
+            "path": path,
+            "size_bytes": os.path.getsize(path),
+            "top1_agreement": top1_agreement(reference, predictions),
+            **latency,
+        }
+    return report
+
+def print_report(report):
+    print(f"{'model':<14}{'size MB':>10}{'top-1 agree':>13}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, r in report["models"].items():
+        print(f"{name:<14}{r['size_bytes'] / 1024 / 1024:>10.1f}{r['top1_agreement'] * 100:>12.1f}%"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="ml/model/model.keras")
+    parser.add_argument("--calibration", required=True, help="Folder of representative .jpg/.png images")
+    parser.add_argument("--limit", type=int, default=200, help="Maximum calibration images to use")
+    parser.add_argument("--output-dir", default="ml/model")
+    parser.add_argument("--report", default="ml/model/quantization_report.json")
+    parser.add_argument("--runs", type=int, default=50, help="Batch-1 latency samples per model")
+    args = parser.parse_args()
+
+    batch = load_calibration_images(args.calibration, args.limit)
+    print(f"[INFO] Loaded {len(batch)} calibration images")
+
+    dynamic_path = os.path.join(args.output_dir, "model_dynamic.tflite")
+    int8_path = os.path.join(args.output_dir, "model_int8.tflite")
+    convert_to_tflite(args.model, dynamic_path, configure_dynamic_range)
+    print(f"[INFO] Wrote {dynamic_path}")
+    convert_to_tflite(args.model, int8_path, configure_full_int8(batch))
+    print(f"[INFO] Wrote {int8_path}")
+
+    variants = {
+        "float": (args.model, "keras"),
+        "dynamic_range": (dynamic_path, "tflite"),
+        "full_int8": (int8_path, "tflite"),
+    }
+    report = build_report(variants, batch, args.runs)
+    print_report(report)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
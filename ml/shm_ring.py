@@ -0,0 +1,66 @@
+from multiprocessing import shared_memory
+import numpy as np
+import json
+import struct
+
+# Client -> server: slot index to run. Server -> client: slot index and status
+REQUEST = struct.Struct("<I")
+REPLY = struct.Struct("<II")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+ALIGNMENT = 64
+
+class SlotRing:
+    """Fixed-size tensor slots laid out in one shared memory block.
+
+    Slot i holds one float32 (224, 224, 3) input followed by its float32
+    probability vector, padded to a 64-byte boundary. `inputs` and `outputs`
+    are numpy views straight into the shared block, so the web workers and
+    the inference server exchange tensors without pickling or copying them
+    through a pipe; only slot indices travel over the socket.
+    """
+
+    def __init__(self, buf, slots, input_shape, num_classes):
+        self.slots = slots
+        self.input_shape = tuple(input_shape)
+        self.num_classes = num_classes
+        self.slot_bytes = self.slot_size(input_shape, num_classes)
+        input_bytes = int(np.prod(input_shape)) * 4
+        # C-order strides of one input, with the slot size as the outer stride
+        input_strides = tuple(int(np.prod(input_shape[i + 1:])) * 4 for i in range(len(input_shape)))
+        self.inputs = np.ndarray((slots, *input_shape), dtype=np.float32, buffer=buf,
+                                 strides=(self.slot_bytes, *input_strides))
+        self.outputs = np.ndarray((slots, num_classes), dtype=np.float32, buffer=buf,
+                                  offset=input_bytes, strides=(self.slot_bytes, 4))
+
+    @staticmethod
+    def slot_size(input_shape, num_classes):
+        size = (int(np.prod(input_shape)) + num_classes) * 4
+        return size + (-size % ALIGNMENT)
+
+def attach_shared_memory(name):
+    """Attach to a block created by another process without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach is registered with the resource tracker,
+        # which would unlink the server's block when this process exits
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+def send_message(sock, message):
+    data = json.dumps(message).encode()
+    sock.sendall(REQUEST.pack(len(data)) + data)
+
+def recv_message(stream):
+    (length,) = REQUEST.unpack(read_exact(stream, REQUEST.size))
+    return json.loads(read_exact(stream, length))
+
+def read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError("Inference server connection closed")
+    return data
@@ -0,0 +1,71 @@
+"""Per-request stage tracing.
+
+A RequestTrace is bound to the current request through a context variable
+(app.tracing starts one per HTTP request). Code on the request path, including
+inference executor threads, records named stages into it with `stage()` or
+`record()`; outside a request both are a context-variable lookup and nothing
+else, so the calls can stay in hot paths.
+"""
+from contextvars import ContextVar
+import time
+
+_current_trace = ContextVar("request_trace", default=None)
+
+class RequestTrace:
+    """Monotonic start offsets and durations of the stages of one request"""
+    __slots__ = ("start", "stages")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+
+    def add(self, name, started, seconds):
+        self.stages.append((name, started - self.start, seconds))
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def durations(self):
+        """Total seconds per stage name, in first-seen order (a batch decodes several images)"""
+        totals = {}
+        for name, _, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+def start_trace():
+    """Bind a new trace to the current context, return it and the token for end_trace"""
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+def current_trace():
+    return _current_trace.get()
+
+def record(name, started, seconds):
+    """Add a stage measured elsewhere (e.g. next to a metrics observation)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, started, seconds)
+
+class stage:
+    """Context manager recording the enclosed block as stage `name` of the current trace.
+
+    A small class rather than @contextmanager, which costs a generator per use.
+    """
+    __slots__ = ("name", "trace", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.trace is not None:
+            self.trace.add(self.name, self.started, time.perf_counter() - self.started)
+        return False
@@ -0,0 +1,104 @@
+"""Export the Keras model to a memory-mappable weight format for fast cold starts.
+
+The export is a JSON manifest (architecture + tensor index) and one flat
+binary file holding every weight tensor at a 64-byte aligned offset. Loading
+maps the binary file with np.memmap: nothing is unzipped or parsed, and every
+tensor is copied once, straight from the mapping into the model variables.
+This is a load-format change only: the variables are still private to each
+process, so it speeds up loading but does not share the weights' memory
+between workers.
+
+Serve it with `MODEL_PATH=ml/model/model.json` (keras backend).
+
+Usage:
+    python -m ml.weights --model ml/model/model.keras --output ml/model/model.json
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+FORMAT = "waste-classification-mmap"
+VERSION = 1
+ALIGNMENT = 64
+
+def is_mapped_model(model_path):
+    return str(model_path).endswith(".json")
+
+def weights_path_for(manifest_path):
+    return os.path.splitext(manifest_path)[0] + ".bin"
+
+def write_mapped_weights(model, manifest_path):
+    """Write `model`'s architecture and weights as manifest + flat binary, return the binary size"""
+    weights_path = weights_path_for(manifest_path)
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tensors = []
+    offset = 0
+    with open(weights_path, "wb") as f:
+        for variable, array in zip(model.weights, model.get_weights()):
+            array = np.ascontiguousarray(array)
+            padding = -offset % ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+            tensors.append({
+                "name": getattr(variable, "path", variable.name),
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            })
+            f.write(array.tobytes())
+            offset += array.nbytes
+
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "weights": os.path.basename(weights_path),
+        "architecture": model.to_json(),
+        "tensors": tensors,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return offset
+
+def map_weights(manifest_path):
+    """Read the manifest and return (architecture JSON, list of read-only memmap views)"""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT or manifest.get("version") != VERSION:
+        raise ValueError(f"{manifest_path} is not a {FORMAT} v{VERSION} manifest")
+
+    weights_path = os.path.join(os.path.dirname(manifest_path), manifest["weights"])
+    if not manifest["tensors"]:
+        return manifest["architecture"], []
+    mapped = np.memmap(weights_path, dtype=np.uint8, mode="r")
+    arrays = []
+    for tensor in manifest["tensors"]:
+        dtype = np.dtype(tensor["dtype"])
+        count = int(np.prod(tensor["shape"], dtype=np.int64))
+        # A view into the mapping, no bytes are read until the array is used
+        arrays.append(np.frombuffer(mapped, dtype=dtype, count=count, offset=tensor["offset"]).reshape(tensor["shape"]))
+    return manifest["architecture"], arrays
+
+def load_mapped_model(manifest_path):
+    """Rebuild the Keras model from its architecture and copy the mapped weights into it"""
+    from tensorflow.keras.models import model_from_json
+    architecture, arrays = map_weights(manifest_path)
+    model = model_from_json(architecture)
+    model.set_weights(arrays)
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="ml/model/model.keras")
+    parser.add_argument("--output", default="ml/model/model.json")
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+    start = time.perf_counter()
+    size = write_mapped_weights(load_model(args.model), args.output)
+    print(f"[INFO] Exported {args.output} + {weights_path_for(args.output)} "
+          f"({size / 1024 / 1024:.1f} MB) in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,12 @@ def app():
 def client(app):
     return TestClient(app)
 
+BIN_STATES = {"device_state": "idle", "bins": {"1": {"state": "open", "seconds": 0.8, "command_id": "abc"}}}
+
 @pytest.fixture
 def mock_mqtt_client():
     with patch("app.routers.bin_status.mqtt_client") as mock_client:
+        mock_client.get_bin_states.return_value = BIN_STATES
         yield mock_client
 
 def test_get_bin_status_available(client, mock_mqtt_client):
@@ -23,7 +26,7 @@ def test_get_bin_status_available(client, mock_mqtt_client):
     response = client.get("/bin_status")
     
     assert response.status_code == 200
-    assert response.json() == {"bin_status": "OK"}
+    assert response.json() == {"bin_status": "OK", **BIN_STATES}
     mock_mqtt_client.get_bin_status.assert_called_once()
 
 def test_get_bin_status_busy(client, mock_mqtt_client):
@@ -33,7 +36,7 @@ def test_get_bin_status_busy(client, mock_mqtt_client):
     response = client.get("/bin_status")
     
     assert response.status_code == 200
-    assert response.json() == {"bin_status": "busy"}
+    assert response.json() == {"bin_status": "busy", **BIN_STATES}
     mock_mqtt_client.get_bin_status.assert_called_once()
 
 def test_get_bin_status_unknown(client, mock_mqtt_client):
@@ -43,7 +46,7 @@ def test_get_bin_status_unknown(client, mock_mqtt_client):
     response = client.get("/bin_status")
     
     assert response.status_code == 200
-    assert response.json() == {"bin_status": "unknown"}
+    assert response.json() == {"bin_status": "unknown", **BIN_STATES}
     mock_mqtt_client.get_bin_status.assert_called_once()
 
 def test_get_bin_status_error(client, mock_mqtt_client):
@@ -54,4 +57,20 @@ def test_get_bin_status_error(client, mock_mqtt_client):
     # this would raise a 500 error in a real application
     # In a real test, you might want to add error handling in the router
     with pytest.raises(Exception, match="MQTT Error"):
-        client.get("/bin_status")
\ No newline at end of file
+        client.get("/bin_status")
+
+def test_get_bin_latency(client, mock_mqtt_client):
+    """Test that the actuation latency report is returned as is"""
+    report = {
+        "device": "waste/bin",
+        "ack_timeout_s": 5.0,
+        "pending": [],
+        "recent": [{"id": "abc", "bin_index": 1, "published_at": 1.0, "status": "busy", "latency_ms": 120.0, "timed_out": False}],
+        "summary": {"acknowledged": 1, "timeouts": 0, "p50_ms": 120.0, "p95_ms": 120.0, "max_ms": 120.0},
+    }
+    mock_mqtt_client.get_command_latencies.return_value = report
+
+    response = client.get("/bin_latency")
+
+    assert response.status_code == 200
+    assert response.json() == report
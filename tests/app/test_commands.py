@@ -0,0 +1,38 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch, MagicMock
+
+@pytest.fixture
+def client():
+    from app.main import app
+    return TestClient(app)
+
+def test_get_command(client):
+    """Test polling a queued command ticket"""
+    ticket = MagicMock()
+    ticket.to_dict.return_value = {"ticket": "abc", "bin_index": 1, "status": "queued", "created_at": 1.0,
+                                   "expires_in": 4.5, "command_id": None, "error": None}
+    queue = MagicMock()
+    queue.get_ticket.return_value = ticket
+    with patch("app.routers.commands.command_queue", queue):
+        response = client.get("/commands/abc")
+
+    assert response.status_code == 200
+    assert response.json() == ticket.to_dict.return_value
+    queue.get_ticket.assert_called_once_with("abc")
+
+def test_get_command_unknown(client):
+    """Test polling a ticket the queue does not know"""
+    queue = MagicMock()
+    queue.get_ticket.return_value = None
+    with patch("app.routers.commands.command_queue", queue):
+        response = client.get("/commands/missing")
+
+    assert response.status_code == 404
+
+def test_get_command_queue_disabled(client):
+    """Test that tickets are unknown when queued mode is off"""
+    with patch("app.routers.commands.command_queue", None):
+        response = client.get("/commands/abc")
+
+    assert response.status_code == 404
@@ -1,6 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
+from iot.command_queue import CommandQueue
 
 @pytest.fixture
 def app():
@@ -33,7 +34,7 @@ def test_control_bin_success(client, mock_dependencies):
     
     # Verify mocks were called correctly
     mock_dependencies.is_device_online.assert_called_once()
-    mock_dependencies.get_bin_status.assert_called_once()
+    mock_dependencies.get_bin_status.assert_called_once_with(1)
     mock_dependencies.publish.assert_called_once_with(1)
 
 def test_control_bin_invalid_index(client, mock_dependencies):
@@ -120,4 +121,57 @@ def test_control_bin_mqtt_error(client, mock_dependencies):
     # Verify mocks were called correctly
     mock_dependencies.is_device_online.assert_called_once()
     mock_dependencies.get_bin_status.assert_called_once()
-    mock_dependencies.publish.assert_called_once_with(3)
\ No newline at end of file
+    mock_dependencies.publish.assert_called_once_with(3)
+
+@pytest.fixture
+def command_queue(mock_dependencies):
+    """Queued mode with a real queue in front of the mocked MQTT client"""
+    mock_dependencies.is_device_online.return_value = True
+    queue = CommandQueue(mock_dependencies, max_depth=1, deadline=0.2)
+    with patch("app.routers.control_bin.command_queue", queue):
+        yield queue
+
+def test_control_bin_queued_free_bin(client, mock_dependencies, command_queue):
+    """Test that queued mode sends a command for a free bin at once"""
+    mock_dependencies.get_bin_status.return_value = "OK"
+    mock_dependencies.publish.return_value = "abc"
+
+    response = client.post("/control_bin", json={"bin_index": 1})
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "Opened bin recycle", "bin_status": "OK"}
+    mock_dependencies.publish.assert_called_once_with(1)
+
+def test_control_bin_queued_busy_bin(client, mock_dependencies, command_queue):
+    """Test that queued mode answers 202 with a ticket instead of 409 for a busy bin"""
+    mock_dependencies.get_bin_status.return_value = "busy"
+
+    response = client.post("/control_bin", json={"bin_index": 2})
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["message"] == "Queued bin hazardous"
+    assert body["status"] == "queued"
+    assert body["bin_index"] == 2
+    assert command_queue.get_ticket(body["ticket"]) is not None
+    mock_dependencies.publish.assert_not_called()
+
+def test_control_bin_queue_full(client, mock_dependencies, command_queue):
+    """Test that queued mode answers 503 once the queue is at its depth limit"""
+    mock_dependencies.get_bin_status.return_value = "busy"
+
+    assert client.post("/control_bin", json={"bin_index": 2}).status_code == 202
+    response = client.post("/control_bin", json={"bin_index": 2})
+
+    assert response.status_code == 503
+    assert "Bin command queue is full" in response.json()["detail"]
+
+def test_control_bin_queued_wait_expires(client, mock_dependencies, command_queue):
+    """Test that a caller waiting on a bin that stays busy past the deadline gets 504"""
+    mock_dependencies.get_bin_status.return_value = "busy"
+
+    response = client.post("/control_bin?wait=true", json={"bin_index": 0})
+
+    assert response.status_code == 504
+    assert "stayed busy" in response.json()["detail"]
+    mock_dependencies.publish.assert_not_called()
@@ -20,6 +20,7 @@ def mock_dependencies():
          patch("app.routers.healthcheck.mqtt_client") as mock_mqtt_client:
         # Set up mocks
         mock_classifier.model = MagicMock()
+        mock_classifier.status = "ready"
         mock_mqtt_client.connected = True
         mock_mqtt_client.esp32_status = "online"
         
@@ -35,6 +36,7 @@ def test_healthcheck_all_systems_ok(client, mock_dependencies):
     assert response.status_code == 200
     assert response.json() == {
         "model_loaded": True,
+        "model_status": "ready",
         "mqtt_connected": True,
         "device_status": "online"
     }
@@ -42,12 +44,14 @@ def test_healthcheck_all_systems_ok(client, mock_dependencies):
 def test_healthcheck_model_not_loaded(client, mock_dependencies):
     """Test healthcheck when model is not loaded"""
     mock_dependencies["classifier"].model = None
+    mock_dependencies["classifier"].status = "failed"
     
     response = client.get("/healthcheck")
     
     assert response.status_code == 200
     assert response.json() == {
         "model_loaded": False,
+        "model_status": "failed",
         "mqtt_connected": True,
         "device_status": "online"
     }
@@ -61,6 +65,7 @@ def test_healthcheck_mqtt_disconnected(client, mock_dependencies):
     assert response.status_code == 200
     assert response.json() == {
         "model_loaded": True,
+        "model_status": "ready",
         "mqtt_connected": False,
         "device_status": "online"
     }
@@ -74,6 +79,7 @@ def test_healthcheck_device_offline(client, mock_dependencies):
     assert response.status_code == 200
     assert response.json() == {
         "model_loaded": True,
+        "model_status": "ready",
         "mqtt_connected": True,
         "device_status": "offline"
     }
@@ -81,6 +87,7 @@ def test_healthcheck_device_offline(client, mock_dependencies):
 def test_healthcheck_all_systems_down(client, mock_dependencies):
     """Test healthcheck when all systems are down"""
     mock_dependencies["classifier"].model = None
+    mock_dependencies["classifier"].status = "failed"
     mock_dependencies["mqtt_client"].connected = False
     mock_dependencies["mqtt_client"].esp32_status = "unknown"
     
@@ -89,6 +96,22 @@ def test_healthcheck_all_systems_down(client, mock_dependencies):
     assert response.status_code == 200
     assert response.json() == {
         "model_loaded": False,
+        "model_status": "failed",
         "mqtt_connected": False,
         "device_status": "unknown"
-    }
\ No newline at end of file
+    }
+
+def test_healthcheck_model_loading(client, mock_dependencies):
+    """Test healthcheck while the model is still loading in the background"""
+    mock_dependencies["classifier"].model = None
+    mock_dependencies["classifier"].status = "loading"
+
+    response = client.get("/healthcheck")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "model_loaded": False,
+        "model_status": "loading",
+        "mqtt_connected": True,
+        "device_status": "online"
+    }
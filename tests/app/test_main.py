@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+def test_lifespan_starts_and_stops_dependencies():
+    """Test that the model loader and MQTT connection are started by the lifespan, not at import"""
+    from app.main import app
+    with patch("app.main.classifier") as mock_classifier, \
+         patch("app.main.mqtt_client") as mock_mqtt_client:
+        with TestClient(app):
+            mock_classifier.start.assert_called_once()
+            mock_mqtt_client.connect_async.assert_called_once()
+            mock_mqtt_client.connect.assert_not_called()
+            mock_classifier.close.assert_not_called()
+
+        mock_mqtt_client.disconnect.assert_called_once()
+        mock_classifier.close.assert_called_once()
@@ -0,0 +1,62 @@
+import pytest
+import io
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+from prometheus_client import REGISTRY
+from app.main import app
+
+client = TestClient(app)
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+@pytest.fixture
+def mock_classifier():
+    with patch("app.routers.predict.classifier") as mock_clf:
+        mock_clf.predict_async = AsyncMock(return_value=("organic", {"organic": 90.0, "recycle": 5.0, "hazardous": 3.0, "other": 2.0}))
+        yield mock_clf
+
+def test_metrics_endpoint_format():
+    """Test that /metrics serves the Prometheus text format with the stage histograms"""
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in ("upload_read", "decode", "preprocess", "inference", "mqtt_publish", "mqtt_on_message"):
+        assert f"# TYPE waste_classification_{name}_seconds histogram" in response.text
+    assert "# TYPE waste_classification_inference_queue_depth gauge" in response.text
+
+def test_predict_updates_request_class_and_upload_metrics(mock_classifier):
+    """Test that a prediction is counted by route, status and class and its upload read is timed"""
+    ok = {"method": "POST", "route": "/predict", "status": "200"}
+    bad = {"method": "POST", "route": "/predict", "status": "400"}
+    before = (
+        sample("waste_classification_requests_total", ok),
+        sample("waste_classification_requests_total", bad),
+        sample("waste_classification_predictions_total", {"class": "organic"}),
+        sample("waste_classification_upload_read_seconds_count"),
+    )
+
+    files = {"file": ("frame.jpg", io.BytesIO(b"\xff\xd8\xff\xe0fake image content"), "image/jpeg")}
+    assert client.post("/predict", files=files).status_code == 200
+    files = {"file": ("notes.txt", io.BytesIO(b"fake text content"), "text/plain")}
+    assert client.post("/predict", files=files).status_code == 400
+
+    after = (
+        sample("waste_classification_requests_total", ok),
+        sample("waste_classification_requests_total", bad),
+        sample("waste_classification_predictions_total", {"class": "organic"}),
+        sample("waste_classification_upload_read_seconds_count"),
+    )
+    assert [b - a for a, b in zip(before, after)] == [1, 1, 1, 1]
+
+def test_unknown_paths_share_one_series():
+    """Test that unmatched URLs are counted under one route label instead of their raw path"""
+    labels = {"method": "GET", "route": "unmatched", "status": "404"}
+    before = sample("waste_classification_requests_total", labels)
+
+    client.get("/no-such-page-1")
+    client.get("/no-such-page-2")
+
+    assert sample("waste_classification_requests_total", labels) == before + 2
+    assert "/no-such-page-1" not in client.get("/metrics").text
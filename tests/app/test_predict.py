@@ -1,7 +1,10 @@
 import pytest
 import io
+import numpy as np
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+from ml.executor import InferenceQueueFull
+from ml.loader import BackgroundClassifier
 
 @pytest.fixture
 def app():
@@ -15,12 +18,14 @@ def client(app):
 @pytest.fixture
 def mock_classifier():
     with patch("app.routers.predict.classifier") as mock_clf:
+        mock_clf.predict_async = AsyncMock(side_effect=lambda image_data: mock_clf.predict(image_data))
+        mock_clf.predict_batch_async = AsyncMock(side_effect=lambda images: mock_clf.predict_batch(images))
         yield mock_clf
 
 @pytest.fixture
 def image_file():
-    # Create a mock image file
-    file_content = b"fake image content"
+    # Create a mock image file (JPEG magic bytes, the classifier is mocked)
+    file_content = b"\xff\xd8\xff\xe0fake image content"
     return ("test_image.jpg", file_content, "image/jpeg")
 
 @pytest.fixture
@@ -65,8 +70,8 @@ def test_predict_non_image_file(client, mock_classifier, non_image_file):
     # Make request
     response = client.post("/predict", files=files)
     
-    # Check response
-    assert response.status_code == 500
+    # Check response - rejected from its magic bytes before prediction
+    assert response.status_code == 400
     assert "Uploaded file must be image" in response.json()["detail"]
     
     # Verify mock was not called
@@ -88,6 +93,15 @@ def test_predict_model_error(client, mock_classifier, image_file):
     assert response.status_code == 500
     assert "Error: Model prediction error" in response.json()["detail"]
 
+def test_predict_raw_malformed_tensor(client, mock_classifier):
+    """Test that a raw tensor the decoder rejects is a 400, not a server error"""
+    mock_classifier.predict.side_effect = ValueError("Raw tensor header must be 12 bytes, got 6")
+
+    response = client.post("/predict/raw", content=b"WCT1\x00\x01", headers={"Content-Type": "application/octet-stream"})
+
+    assert response.status_code == 400
+    assert "Raw tensor header" in response.json()["detail"]
+
 def test_predict_missing_file(client):
     """Test prediction without providing a file"""
     # Make request with no files
@@ -95,4 +109,180 @@ def test_predict_missing_file(client):
     
     # Check response - should be a validation error
     assert response.status_code == 422  # Unprocessable Entity
-    assert "Field required" in response.json()["detail"][0]["msg"]
\ No newline at end of file
+    assert "Field required" in response.json()["detail"][0]["msg"]
+
+def test_predict_queue_full(client, mock_classifier, image_file):
+    """Test prediction when the inference queue is saturated"""
+    mock_classifier.predict_async.side_effect = InferenceQueueFull("Inference queue is full")
+
+    filename, file_content, content_type = image_file
+    files = {"file": (filename, io.BytesIO(file_content), content_type)}
+
+    response = client.post("/predict", files=files)
+
+    assert response.status_code == 503
+    assert "Inference queue is full" in response.json()["detail"]
+
+def test_predict_model_loading(client, image_file):
+    """Test prediction while the model is still loading in the background"""
+    with patch("app.routers.predict.classifier", BackgroundClassifier(MagicMock())):
+        filename, file_content, content_type = image_file
+        files = {"file": (filename, io.BytesIO(file_content), content_type)}
+
+        response = client.post("/predict", files=files)
+
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Model is still loading. Please retry later."
+
+def test_predict_file_too_large(client, mock_classifier, image_file):
+    """Test prediction rejects uploads over the size cap"""
+    filename, file_content, content_type = image_file
+    files = {"file": (filename, io.BytesIO(file_content + b"\x00" * 2048), content_type)}
+
+    with patch("app.uploads.MAX_UPLOAD_BYTES", 1024):
+        response = client.post("/predict", files=files)
+
+    assert response.status_code == 413
+    assert "too large" in response.json()["detail"]
+    mock_classifier.predict.assert_not_called()
+
+def test_predict_sniffs_content_not_content_type(client, mock_classifier):
+    """Test that the image check uses the magic bytes, not the client-supplied content type"""
+    mock_classifier.predict.return_value = ("organic", {"organic": 90.0, "recycle": 5.0, "hazardous": 3.0, "other": 2.0})
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+    files = {"file": ("frame.bin", io.BytesIO(png), "application/octet-stream")}
+
+    response = client.post("/predict", files=files)
+
+    assert response.status_code == 200
+    mock_classifier.predict.assert_called_once_with(png)
+
+def test_predict_raw_success(client, mock_classifier, image_file):
+    """Test raw-body prediction returns the same response as the multipart route"""
+    mock_classifier.predict.return_value = ("recycle", {"organic": 5.2, "recycle": 85.1, "hazardous": 4.3, "other": 5.4})
+    _, file_content, content_type = image_file
+
+    response = client.post("/predict/raw", content=file_content, headers={"Content-Type": content_type})
+
+    assert response.status_code == 200
+    assert response.json() == {"class": "recycle"}
+    mock_classifier.predict.assert_called_once_with(file_content)
+
+def test_predict_raw_octet_stream(client, mock_classifier):
+    """Test raw-body prediction accepts application/octet-stream and sniffs the bytes"""
+    mock_classifier.predict.return_value = ("organic", {"organic": 90.0, "recycle": 5.0, "hazardous": 3.0, "other": 2.0})
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+    response = client.post("/predict/raw", content=png, headers={"Content-Type": "application/octet-stream"})
+
+    assert response.status_code == 200
+    assert response.json() == {"class": "organic"}
+
+def test_predict_raw_tensor_upload(client, mock_classifier):
+    """Test that a pre-decoded raw tensor passes the upload checks untouched"""
+    from ml.model import encode_raw_tensor
+    mock_classifier.predict.return_value = ("other", {"organic": 5.0, "recycle": 5.0, "hazardous": 5.0, "other": 85.0})
+    tensor = encode_raw_tensor(np.zeros((224, 224, 3), dtype=np.uint8))
+
+    response = client.post("/predict/raw", content=tensor, headers={"Content-Type": "application/octet-stream"})
+
+    assert response.status_code == 200
+    mock_classifier.predict.assert_called_once_with(tensor)
+
+def test_predict_raw_non_image(client, mock_classifier, non_image_file):
+    """Test raw-body prediction rejects bytes that are not an image"""
+    _, file_content, _ = non_image_file
+
+    response = client.post("/predict/raw", content=file_content, headers={"Content-Type": "application/octet-stream"})
+
+    assert response.status_code == 400
+    mock_classifier.predict.assert_not_called()
+
+def test_predict_raw_rejects_multipart(client, mock_classifier, image_file):
+    """Test raw-body prediction answers 415 to a multipart form"""
+    filename, file_content, content_type = image_file
+    files = {"file": (filename, io.BytesIO(file_content), content_type)}
+
+    response = client.post("/predict/raw", files=files)
+
+    assert response.status_code == 415
+    mock_classifier.predict.assert_not_called()
+
+def test_predict_raw_empty_body(client, mock_classifier):
+    """Test raw-body prediction with no body"""
+    response = client.post("/predict/raw", headers={"Content-Type": "image/jpeg"})
+
+    assert response.status_code == 422
+
+def test_predict_raw_too_large(client, mock_classifier, image_file):
+    """Test raw-body prediction rejects bodies over the size cap"""
+    _, file_content, content_type = image_file
+
+    with patch("app.uploads.MAX_UPLOAD_BYTES", 1024):
+        response = client.post("/predict/raw", content=file_content + b"\x00" * 2048, headers={"Content-Type": content_type})
+
+    assert response.status_code == 413
+    mock_classifier.predict.assert_not_called()
+
+def test_predict_batch_success(client, mock_classifier, image_file):
+    """Test batch prediction returns one result per uploaded image"""
+    mock_classifier.predict_batch.return_value = [
+        ("recycle", {"organic": 5.2, "recycle": 85.1, "hazardous": 4.3, "other": 5.4}),
+        ("organic", {"organic": 78.5, "recycle": 10.2, "hazardous": 5.3, "other": 6.0}),
+    ]
+    _, file_content, content_type = image_file
+    files = [
+        ("files", ("frame_1.jpg", io.BytesIO(file_content), content_type)),
+        ("files", ("frame_2.jpg", io.BytesIO(file_content), content_type)),
+    ]
+
+    response = client.post("/predict/batch", files=files)
+
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    assert [p["filename"] for p in predictions] == ["frame_1.jpg", "frame_2.jpg"]
+    assert [p["class"] for p in predictions] == ["recycle", "organic"]
+    assert predictions[0]["probabilities"]["recycle"] == 85.1
+
+    # All images go to the classifier in a single call
+    mock_classifier.predict_batch.assert_called_once()
+    args, _ = mock_classifier.predict_batch.call_args
+    assert args[0] == [file_content, file_content]
+
+def test_predict_batch_non_image_file(client, mock_classifier, image_file, non_image_file):
+    """Test batch prediction rejects the request if any file is not an image"""
+    files = [
+        ("files", (image_file[0], io.BytesIO(image_file[1]), image_file[2])),
+        ("files", (non_image_file[0], io.BytesIO(non_image_file[1]), non_image_file[2])),
+    ]
+
+    response = client.post("/predict/batch", files=files)
+
+    assert response.status_code == 400
+    assert "test_file.txt" in response.json()["detail"]
+    mock_classifier.predict_batch.assert_not_called()
+
+def test_predict_batch_empty_file(client, mock_classifier, image_file):
+    """Test batch prediction rejects an empty file part with 400"""
+    files = [
+        ("files", (image_file[0], io.BytesIO(image_file[1]), image_file[2])),
+        ("files", ("empty.jpg", io.BytesIO(b""), "image/jpeg")),
+    ]
+
+    response = client.post("/predict/batch", files=files)
+
+    assert response.status_code == 400
+    assert "must be image" in response.json()["detail"]
+    mock_classifier.predict_batch.assert_not_called()
+
+def test_predict_batch_too_many_files(client, mock_classifier, image_file):
+    """Test batch prediction enforces the maximum number of files"""
+    _, file_content, content_type = image_file
+    files = [("files", (f"frame_{i}.jpg", io.BytesIO(file_content), content_type)) for i in range(3)]
+
+    with patch("app.routers.predict.MAX_BATCH_FILES", 2):
+        response = client.post("/predict/batch", files=files)
+
+    assert response.status_code == 400
+    assert "Too many files" in response.json()["detail"]
+    mock_classifier.predict_batch.assert_not_called()
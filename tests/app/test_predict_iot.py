@@ -1,8 +1,10 @@
 import pytest
 import io
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from app.main import app
+from ml.loader import ModelNotReady
+from iot.command_queue import CommandQueue
 
 client = TestClient(app)
 
@@ -12,6 +14,7 @@ def mock_dependencies():
          patch("app.routers.predict_iot.mqtt_client") as mock_mqtt_client, \
          patch("app.routers.predict_iot.CLASS_TO_INDEX", {"organic": 0, "recycle": 1, "hazardous": 2, "other": 3}), \
          patch("app.routers.predict_iot.INDEX_TO_CLASS", {0: "organic", 1: "recycle", 2: "hazardous", 3: "other"}):
+        mock_classifier.predict_async = AsyncMock(side_effect=lambda image_data: mock_classifier.predict(image_data))
         
         yield {
             "classifier": mock_classifier,
@@ -20,8 +23,8 @@ def mock_dependencies():
 
 @pytest.fixture
 def image_file():
-    # Create a mock image file
-    file_content = b"fake image content"
+    # Create a mock image file (JPEG magic bytes, the classifier is mocked)
+    file_content = b"\xff\xd8\xff\xe0fake image content"
     return ("test_image.jpg", file_content, "image/jpeg")
 
 @pytest.fixture
@@ -62,7 +65,7 @@ def test_predict_iot_success(mock_dependencies, image_file):
     # Verify mocks were called correctly
     mock_dependencies["classifier"].predict.assert_called_once()
     mock_dependencies["mqtt_client"].is_device_online.assert_called_once()
-    mock_dependencies["mqtt_client"].get_bin_status.assert_called_once()
+    mock_dependencies["mqtt_client"].get_bin_status.assert_called_once_with(1)
     mock_dependencies["mqtt_client"].publish.assert_called_once_with(1)
 
 def test_predict_iot_non_image_file(mock_dependencies, non_image_file):
@@ -211,4 +214,71 @@ def test_predict_iot_mqtt_error(mock_dependencies, image_file):
     mock_dependencies["classifier"].predict.assert_called_once()
     mock_dependencies["mqtt_client"].is_device_online.assert_called_once()
     mock_dependencies["mqtt_client"].get_bin_status.assert_called_once()
-    mock_dependencies["mqtt_client"].publish.assert_called_once_with(1)
\ No newline at end of file
+    mock_dependencies["mqtt_client"].publish.assert_called_once_with(1)
+
+def test_predict_iot_model_loading(mock_dependencies, image_file):
+    """Test that no bin is opened while the model is still loading"""
+    mock_dependencies["classifier"].predict_async.side_effect = ModelNotReady("Model is still loading. Please retry later.")
+
+    filename, file_content, content_type = image_file
+    files = {"file": (filename, io.BytesIO(file_content), content_type)}
+
+    response = client.post("/predict_iot", files=files)
+
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Model is still loading. Please retry later."
+    mock_dependencies["mqtt_client"].publish.assert_not_called()
+
+def test_predict_iot_raw_success(mock_dependencies, image_file):
+    """Test raw-body prediction opens the bin and returns the multipart route's response"""
+    mock_dependencies["classifier"].predict.return_value = ("hazardous", {"organic": 5.0, "recycle": 5.0, "hazardous": 85.0, "other": 5.0})
+    mock_dependencies["mqtt_client"].is_device_online.return_value = True
+    mock_dependencies["mqtt_client"].get_bin_status.return_value = "available"
+    _, file_content, content_type = image_file
+
+    response = client.post("/predict_iot/raw", content=file_content, headers={"Content-Type": content_type})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "class": "hazardous",
+        "bin_index": 2,
+        "bin_opened": "hazardous",
+        "bin_status": "busy"
+    }
+    mock_dependencies["classifier"].predict.assert_called_once_with(file_content)
+    mock_dependencies["mqtt_client"].publish.assert_called_once_with(2)
+
+def test_predict_iot_raw_non_image(mock_dependencies, non_image_file):
+    """Test raw-body prediction rejects a non-image without touching the bin"""
+    _, file_content, _ = non_image_file
+
+    response = client.post("/predict_iot/raw", content=file_content, headers={"Content-Type": "application/octet-stream"})
+
+    assert response.status_code == 400
+    mock_dependencies["mqtt_client"].publish.assert_not_called()
+
+def test_predict_iot_queued_busy_bin(mock_dependencies, image_file):
+    """Test that queued mode answers 202 with a ticket when the predicted bin is busy"""
+    mock_dependencies["classifier"].predict.return_value = ("organic", {
+        "organic": 80.0,
+        "recycle": 10.0,
+        "hazardous": 5.0,
+        "other": 5.0
+    })
+    mock_dependencies["mqtt_client"].is_device_online.return_value = True
+    mock_dependencies["mqtt_client"].get_bin_status.return_value = "busy"
+    queue = CommandQueue(mock_dependencies["mqtt_client"], max_depth=4, deadline=5)
+
+    filename, file_content, content_type = image_file
+    with patch("app.routers.predict_iot.command_queue", queue):
+        response = client.post("/predict_iot", files={"file": (filename, io.BytesIO(file_content), content_type)})
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["class"] == "organic"
+    assert body["bin_index"] == 0
+    assert body["bin_queued"] == "organic"
+    assert body["status"] == "queued"
+    assert queue.get_ticket(body["ticket"]).bin_index == 0
+    mock_dependencies["mqtt_client"].get_bin_status.assert_called_with(0)
+    mock_dependencies["mqtt_client"].publish.assert_not_called()
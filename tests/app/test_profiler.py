@@ -0,0 +1,77 @@
+import pytest
+import threading
+import time
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from app.main import app
+from app.profiler import SamplingProfiler, sample_stacks, format_collapsed
+
+client = TestClient(app)
+
+def busy_wait(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_wait, args=(stop,), name="inference_0")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+def test_sample_stacks_collapses_threads(busy_thread):
+    """Test that other threads are sampled into collapsed stacks rooted at their thread name"""
+    stacks, samples = sample_stacks(0.2, interval=0.005)
+
+    assert samples >= 10
+    busy = [stack for stack in stacks if stack.startswith("inference_0;")]
+    assert busy and all("busy_wait (test_profiler.py:" in stack for stack in busy)
+    assert sum(stacks[stack] for stack in busy) >= samples - 2
+    assert not any(stack.startswith("profiler;") for stack in stacks)
+    line = format_collapsed(stacks).splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+def test_profiler_runs_one_profile_at_a_time():
+    """Test that a second profile is refused while one is running"""
+    profiler = SamplingProfiler()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(profiler.profile(0.2)))
+    thread.start()
+    time.sleep(0.05)
+
+    assert profiler.running
+    assert profiler.profile(0.1) is None
+    thread.join()
+    assert results[0] is not None and not profiler.running
+
+def test_profile_endpoint_disabled_without_token():
+    """Test that the profiler is not reachable when no admin token is configured"""
+    with patch("app.routers.admin.ADMIN_TOKEN", None):
+        response = client.get("/admin/profile", params={"seconds": 0.1})
+    assert response.status_code == 404
+
+def test_profile_endpoint_rejects_bad_token():
+    """Test that a wrong or missing bearer token is rejected"""
+    with patch("app.routers.admin.ADMIN_TOKEN", "secret"):
+        assert client.get("/admin/profile", params={"seconds": 0.1}).status_code == 401
+        response = client.get("/admin/profile", params={"seconds": 0.1}, headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+
+def test_profile_endpoint_returns_collapsed_stacks(busy_thread):
+    """Test that an admin gets a downloadable collapsed-stack profile"""
+    with patch("app.routers.admin.ADMIN_TOKEN", "secret"):
+        response = client.get("/admin/profile", params={"seconds": 0.2, "interval_ms": 5},
+                              headers={"Authorization": "Bearer secret"})
+
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].startswith("attachment; filename=\"profile-")
+    assert int(response.headers["x-profile-samples"]) >= 10
+    assert any(line.startswith("inference_0;") for line in response.text.splitlines())
+
+def test_profile_endpoint_caps_duration():
+    """Test that overly long profiles are refused"""
+    with patch("app.routers.admin.ADMIN_TOKEN", "secret"):
+        response = client.get("/admin/profile", params={"seconds": 3600}, headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 400
@@ -0,0 +1,53 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+from app.serve import memory_usage, preload, init_worker
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs Linux /proc/<pid>/smaps_rollup")
+def test_memory_usage_of_current_process():
+    """Test that memory usage is read from smaps_rollup and split into shared and private pages"""
+    usage = memory_usage(os.getpid())
+
+    assert set(usage) == {"rss", "pss", "shared", "private"}
+    assert usage["rss"] > 0
+    assert usage["rss"] == usage["shared"] + usage["private"]
+    assert usage["pss"] <= usage["rss"]
+
+def test_preload_fork_safe_backend():
+    """Test that the model is loaded in the master when its backend survives fork"""
+    classifier = MagicMock(status="ready")
+
+    assert preload(classifier, "tflite") is True
+    classifier.load.assert_called_once()
+
+def test_preload_skips_keras_backend():
+    """Test that the Keras backend is left for every worker to load after the fork"""
+    classifier = MagicMock()
+
+    assert preload(classifier, "keras") is False
+    classifier.load.assert_not_called()
+
+def test_preload_skips_remote_backend():
+    """Test that the master leaves the inference server's slot ranges to the workers"""
+    classifier = MagicMock()
+
+    assert preload(classifier, "remote") is False
+    classifier.load.assert_not_called()
+
+def test_preload_failure():
+    """Test that the master refuses to fork workers when the model failed to load"""
+    classifier = MagicMock(status="failed", error=OSError("model.tflite not found"))
+
+    with pytest.raises(RuntimeError, match="model.tflite not found"):
+        preload(classifier, "tflite")
+
+def test_init_worker():
+    """Test that each worker rebuilds the preloaded classifier and gets its own MQTT client"""
+    classifier, mqtt_client = MagicMock(status="ready"), MagicMock()
+    init_worker(classifier, mqtt_client)
+    classifier.after_fork.assert_called_once()
+    mqtt_client.after_fork.assert_called_once()
+
+    classifier = MagicMock(status="idle")
+    init_worker(classifier, mqtt_client)
+    classifier.after_fork.assert_not_called()
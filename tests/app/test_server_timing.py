@@ -0,0 +1,76 @@
+import pytest
+import asyncio
+import io
+import re
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+from app.main import app
+from app.tracing import TracingMiddleware
+from ml import tracing
+
+client = TestClient(app)
+
+def timing_entries(response):
+    """Parse a Server-Timing header into {name: duration ms}"""
+    entries = {}
+    for entry in response.headers["server-timing"].split(", "):
+        name, duration = entry.split(";dur=")
+        entries[name] = float(duration)
+    return entries
+
+@pytest.fixture
+def mock_dependencies():
+    with patch("app.routers.predict_iot.classifier") as mock_classifier, \
+         patch("app.routers.predict_iot.mqtt_client") as mock_mqtt_client:
+        mock_classifier.predict_async = AsyncMock(return_value=("recycle", {"organic": 5.0, "recycle": 85.0, "hazardous": 5.0, "other": 5.0}))
+        mock_mqtt_client.is_device_online.return_value = True
+        mock_mqtt_client.get_bin_status.return_value = "available"
+        yield mock_classifier, mock_mqtt_client
+
+def test_predict_iot_server_timing(mock_dependencies):
+    """Test that /predict_iot returns every stage of the request in Server-Timing"""
+    files = {"file": ("frame.jpg", io.BytesIO(b"\xff\xd8\xff\xe0fake image content"), "image/jpeg")}
+
+    response = client.post("/predict_iot", files=files)
+
+    assert response.status_code == 200
+    entries = timing_entries(response)
+    assert list(entries) == ["upload", "predict", "mqtt_status", "publish", "total"]
+    assert entries["total"] >= sum(duration for name, duration in entries.items() if name != "total") - 0.1
+
+def test_server_timing_on_error_response(mock_dependencies):
+    """Test that a rejected request still reports the stages it went through"""
+    mock_dependencies[1].is_device_online.return_value = False
+    files = {"file": ("frame.jpg", io.BytesIO(b"\xff\xd8\xff\xe0fake image content"), "image/jpeg")}
+
+    response = client.post("/predict_iot", files=files)
+
+    assert response.status_code == 503
+    assert list(timing_entries(response)) == ["upload", "predict", "mqtt_status", "total"]
+
+def make_app(**options):
+    test_app = FastAPI()
+    test_app.add_middleware(TracingMiddleware, **options)
+
+    @test_app.get("/slow")
+    async def slow():
+        with tracing.stage("inference"):
+            await asyncio.sleep(0.05)
+        return {}
+    return test_app
+
+def test_slow_request_logged_with_breakdown(capsys):
+    """Test that requests over the threshold are logged with their stage breakdown"""
+    response = TestClient(make_app(slow_request_ms=20)).get("/slow")
+
+    assert response.status_code == 200
+    output = capsys.readouterr().out
+    assert re.search(r"\[WARN\] Slow request GET /slow took [\d.]+ ms: inference \+[\d.]+ms [\d.]+ms", output)
+
+def test_server_timing_can_be_disabled(capsys):
+    """Test that the header and the slow log are both optional"""
+    response = TestClient(make_app(server_timing=False, slow_request_ms=0)).get("/slow")
+
+    assert "server-timing" not in response.headers
+    assert "Slow request" not in capsys.readouterr().out
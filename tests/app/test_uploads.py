@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from app.uploads import MultipartImageReader, read_image_uploads, is_image
+
+BOUNDARY = b"----boundary"
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 8
+
+def part(name, content, filename="frame.jpg", content_type="image/jpeg"):
+    return (b"--" + BOUNDARY + b"\r\n"
+            + f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode()
+            + f"Content-Type: {content_type}\r\n\r\n".encode()
+            + content + b"\r\n")
+
+def body(*parts):
+    return b"".join(parts) + b"--" + BOUNDARY + b"--\r\n"
+
+def make_request(chunks, headers, complete=False):
+    """Build a request whose body arrives in `chunks`, failing if more is read after them unless `complete`"""
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    if complete:
+        messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        if not messages:
+            raise AssertionError("Body was read past the rejected part")
+        return messages.pop(0)
+
+    scope = {"type": "http", "method": "POST", "path": "/predict", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]}
+    return Request(scope, receive)
+
+def test_is_image_signatures():
+    """Test magic-byte detection of the supported formats"""
+    assert is_image(b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01")
+    assert is_image(b"\x89PNG\r\n\x1a\n\x00\x00\x00\r")
+    assert is_image(b"RIFF\x24\x00\x00\x00WEBP")
+    assert is_image(b"BM6\x00\x0c\x00\x00\x00\x00\x00")
+    assert not is_image(b"RIFF\x24\x00\x00\x00WAVE")
+    assert not is_image(b"fake text content")
+
+def test_reader_collects_image_parts():
+    """Test that image parts of the field are reassembled across chunks and other fields are skipped"""
+    data = body(part("note", b"hello", filename="note.txt", content_type="text/plain"), part("file", JPEG))
+    reader = MultipartImageReader(BOUNDARY, "file")
+    for i in range(0, len(data), 100):
+        reader.feed(data[i:i + 100])
+    reader.finish()
+
+    assert len(reader.parts) == 1
+    assert reader.parts[0].filename == "frame.jpg"
+    assert reader.parts[0].data() == JPEG
+
+def test_reader_rejects_non_image_on_first_chunk():
+    """Test that a non-image part is rejected from its first bytes"""
+    data = body(part("file", b"#!/bin/sh\n" + b"x" * 10000, filename="run.sh"))
+    reader = MultipartImageReader(BOUNDARY, "file")
+
+    with pytest.raises(HTTPException) as error:
+        reader.feed(data[:256])
+    assert error.value.status_code == 400
+    assert "run.sh" in error.value.detail
+
+def test_reader_enforces_size_cap_while_streaming():
+    """Test that a part is rejected as soon as it grows past the cap"""
+    reader = MultipartImageReader(BOUNDARY, "file", max_bytes=1024)
+    data = body(part("file", JPEG))
+
+    with pytest.raises(HTTPException) as error:
+        for i in range(0, len(data), 512):
+            reader.feed(data[i:i + 512])
+    assert error.value.status_code == 413
+    assert i < len(data) - 512
+
+def test_declared_content_length_rejected_before_reading():
+    """Test that an oversized Content-Length is rejected without reading the body"""
+    request = make_request([], {
+        "content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}",
+        "content-length": str(50 * 1024 * 1024),
+    })
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_image_uploads(request, "file", max_bytes=1024 * 1024))
+    assert error.value.status_code == 413
+
+def test_non_image_rejected_without_reading_rest_of_body():
+    """Test that the remaining body is never received once the first chunk is rejected"""
+    data = body(part("file", b"fake text content" * 1000, filename="test_file.txt", content_type="text/plain"))
+    request = make_request([data[:300]], {"content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}"})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_image_uploads(request, "file"))
+    assert error.value.status_code == 400
+
+def test_reader_rejects_empty_part():
+    """Test that an empty file part is rejected as a non-image instead of failing on its missing data"""
+    reader = MultipartImageReader(BOUNDARY, "file")
+
+    with pytest.raises(HTTPException) as error:
+        reader.feed(body(part("file", b"", filename="empty.jpg")))
+    assert error.value.status_code == 400
+    assert "must be image" in error.value.detail
+
+def test_malformed_body_rejected():
+    """Test that a body the multipart parser cannot read is a 400, not a server error"""
+    request = make_request([b"--wrong-boundary\r\n"], {"content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}"})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_image_uploads(request, "file"))
+    assert error.value.status_code == 400
+    assert "Malformed multipart body" in error.value.detail
+
+def test_truncated_body_rejected():
+    """Test that a body cut off before its closing boundary is a 400 and never returns the partial file"""
+    data = body(part("file", JPEG))
+    request = make_request([data[:-len(BOUNDARY) - 10]], {"content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}"},
+                           complete=True)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_image_uploads(request, "file"))
+    assert error.value.status_code == 400
+    assert "closing boundary" in error.value.detail
+
+def test_short_part_without_end_is_checked():
+    """Test that a part under SNIFF_BYTES still gets the magic-byte check when its end never arrives"""
+    reader = MultipartImageReader(BOUNDARY, "file")
+    reader.feed(part("file", b"hi").rstrip(b"\r\n"))
+
+    with pytest.raises(HTTPException) as error:
+        reader.finish()
+    assert error.value.status_code == 400
+    assert "must be image" in error.value.detail
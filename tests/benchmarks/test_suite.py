@@ -0,0 +1,44 @@
+import json
+import pytest
+from types import SimpleNamespace
+from benchmarks.suite import compare, compare_results, loopback_mqtt_client
+
+def result(p50):
+    return {"p50_ms": p50, "p95_ms": p50 * 1.2, "mean_ms": p50, "runs": 10}
+
+def test_compare_flags_regressions():
+    """Test that only slowdowns over both the relative and absolute thresholds are flagged."""
+    baseline = {"a": result(10.0), "b": result(10.0), "c": result(0.1), "d": result(10.0), "gone": result(1.0)}
+    current = {"a": result(12.0), "b": result(10.5), "c": result(0.13), "d": result(5.0), "added": result(1.0)}
+
+    statuses = {name: status for name, _, _, _, status in compare_results(baseline, current, threshold=0.15, min_delta_ms=0.05)}
+
+    assert statuses == {"a": "REGRESSION", "b": "ok", "c": "ok", "d": "improved", "gone": "missing", "added": "new"}
+
+def test_compare_exit_code(tmp_path):
+    """Test that the compare command fails only when a benchmark regressed."""
+    meta = {"decoder": "pillow", "machine": "x86_64", "cpu_count": 4}
+    paths = {}
+    for name, p50 in (("baseline", 10.0), ("same", 10.2), ("slower", 20.0)):
+        paths[name] = tmp_path / f"{name}.json"
+        paths[name].write_text(json.dumps({"meta": meta, "results": {"endpoint/predict": result(p50)}}))
+
+    def run(current):
+        return compare(SimpleNamespace(baseline=paths["baseline"], current=paths[current],
+                                       metric="p50_ms", threshold=0.15, min_delta_ms=0.05))
+
+    assert run("same") == 0
+    assert run("slower") == 1
+
+def test_loopback_mqtt_client_ready_and_records_publishes():
+    """Test that the in-process MQTT stand-in reports an idle online device and records commands."""
+    client = loopback_mqtt_client()
+
+    assert client.connected
+    assert client.is_device_online()
+    assert client.get_bin_status() == "OK"
+    command_id = client.publish(2)
+    assert client.client.published == [("bench/2", json.dumps({"bin": 2, "id": command_id}))]
+    # The simulated device completes the command before publish returns
+    assert client.get_bin_status(2) == "OK"
+    assert client.get_command_latencies()["summary"]["acknowledged"] == 1
@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 # Mock modules before they're imported
 pytest_plugins = []
@@ -25,7 +25,7 @@ def mock_dependencies_for_app():
     It prevents the app from trying to load a real model or connect to a real MQTT broker during tests.
     """
     # Patch the WasteClassifier to avoid loading model
-    with patch("ml.model.load_model") as mock_load_model, \
+    with patch("tensorflow.keras.models.load_model") as mock_load_model, \
          patch("app.dependencies.WasteClassifier") as mock_classifier_class, \
          patch("app.dependencies.MQTTClient") as mock_mqtt_client_class, \
          patch("paho.mqtt.client.Client") as mock_paho_client:
@@ -37,6 +37,7 @@ def mock_dependencies_for_app():
         mock_classifier = mock_classifier_class.return_value
         mock_classifier.model = MagicMock()
         mock_classifier.predict.return_value = ("recycle", {"organic": 0.1, "recycle": 0.7, "hazardous": 0.1, "other": 0.1})
+        mock_classifier.predict_async = AsyncMock(return_value=mock_classifier.predict.return_value)
         
         # Configure mock MQTT client
         mock_mqtt = mock_mqtt_client_class.return_value
@@ -0,0 +1,82 @@
+from iot.bin_state import BinStateMachine, COMMANDED, OPENING, OPEN, CLOSING
+
+TIMEOUTS = {COMMANDED: 2.0, OPENING: 3.0, OPEN: 5.0, CLOSING: 3.0}
+
+def test_full_cycle_reports_cycle_time():
+    """Test the idle -> commanded -> opening -> open -> closing -> idle cycle and the cycle callback."""
+    cycles = []
+    bins = BinStateMachine(TIMEOUTS, on_cycle=lambda bin_index, seconds: cycles.append((bin_index, seconds)))
+
+    bins.command(1, "abc", now=10.0)
+    assert bins.state(1, now=10.0) == "commanded"
+    assert bins.on_status("opening", 1, now=10.2) == "opening"
+    assert bins.on_status("open", 1, now=11.0) == "open"
+    assert bins.on_status("closing", 1, now=12.0) == "closing"
+    assert not bins.is_idle(1, now=12.1)
+    assert bins.on_status("closed", 1, now=12.5) == "idle"
+    assert bins.is_idle(1, now=12.5)
+    assert cycles == [(1, 2.5)]
+
+def test_late_messages_never_move_a_bin_backwards():
+    """Test that a repeated or out-of-order status keeps the later state."""
+    bins = BinStateMachine(TIMEOUTS)
+    bins.command(0, now=0.0)
+    bins.on_status("open", 0, now=1.0)
+
+    assert bins.on_status("opening", 0, now=1.1) == "open"
+    assert bins.on_status("busy", 0, now=1.2) == "open"
+    assert bins.on_status("OK", 0, now=1.3) == "idle"
+
+def test_unknown_status_is_ignored():
+    """Test that words outside the lifecycle (e.g. error reports) leave the state alone."""
+    bins = BinStateMachine(TIMEOUTS)
+    bins.command(0, now=0.0)
+
+    assert bins.on_status("error", 0, now=0.5) is None
+    assert bins.state(0, now=0.5) == "commanded"
+
+def test_timeouts_advance_through_the_cycle():
+    """Test that each state ends after its timeout, measured from when it was entered."""
+    bins = BinStateMachine(TIMEOUTS)
+    bins.command(2, now=0.0)
+    bins.on_status("busy", 2, now=1.0)
+
+    assert bins.state(2, now=3.9) == "opening"
+    assert bins.state(2, now=4.1) == "open"
+    assert bins.state(2, now=9.1) == "closing"
+    assert bins.state(2, now=12.1) == "idle"
+
+def test_unattributed_status_goes_to_oldest_active_bin():
+    """Test that a status without a bin applies to the bin that was commanded first."""
+    bins = BinStateMachine(TIMEOUTS)
+    bins.command(3, now=0.0)
+    bins.command(1, now=0.5)
+
+    bins.on_status("opening", now=1.0)
+    assert bins.state(3, now=1.0) == "opening"
+    assert bins.state(1, now=1.0) == "commanded"
+
+def test_unattributed_status_holds_device():
+    """Test that a cycle nobody here commanded blocks every bin until it ends or times out."""
+    bins = BinStateMachine(TIMEOUTS)
+
+    bins.on_status("busy", now=0.0)
+    assert not bins.is_idle(0, now=1.0)
+    assert not bins.is_idle(now=1.0)
+    assert bins.snapshot(now=1.0)["device_state"] == "opening"
+    # opening (3 s), open (5 s) and closing (3 s) without another message
+    assert bins.is_idle(0, now=11.1)
+
+def test_snapshot():
+    """Test the snapshot of every bin seen so far."""
+    bins = BinStateMachine(TIMEOUTS)
+    bins.command(1, "abc", now=0.0)
+    bins.state(0, now=0.0)
+
+    assert bins.snapshot(now=0.5) == {
+        "device_state": "idle",
+        "bins": {
+            "0": {"state": "idle", "seconds": None, "command_id": None},
+            "1": {"state": "commanded", "seconds": 0.5, "command_id": "abc"},
+        },
+    }
@@ -0,0 +1,160 @@
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from iot.command_queue import CommandQueue, CommandQueueFull, CommandExpired
+
+class FakeDevice:
+    """MQTTClient stand-in: bins in `busy` report busy, publish records the bin index"""
+
+    def __init__(self):
+        self.busy = set()
+        self.published = []
+        self.listeners = []
+        self.fail = False
+
+    def add_status_listener(self, listener):
+        self.listeners.append(listener)
+
+    def is_device_online(self):
+        return True
+
+    def get_bin_status(self, bin_index=None):
+        return "busy" if bin_index in self.busy else "OK"
+
+    def publish(self, bin_index):
+        if self.fail:
+            raise ConnectionError("MQTT client not connected to broker")
+        self.published.append(bin_index)
+        # A published command holds its bin until the device reports it idle
+        self.busy.add(bin_index)
+        return f"cmd-{len(self.published)}"
+
+    def free(self, bin_index):
+        # The device reports the bin idle again, on the network thread in real life
+        self.busy.discard(bin_index)
+        for listener in self.listeners:
+            listener()
+
+def test_submit_sends_at_once_when_bin_is_free():
+    """Test that a command for a free bin is published right away."""
+    async def scenario():
+        device = FakeDevice()
+        queue = CommandQueue(device, max_depth=2, deadline=1)
+        ticket = queue.submit(1)
+        await queue.stop()
+        return device, ticket
+
+    device, ticket = asyncio.run(scenario())
+    assert device.published == [1]
+    assert ticket.sent
+    assert ticket.command_id == "cmd-1"
+
+def test_queued_command_sent_when_bin_becomes_free():
+    """Test that a command for a busy bin waits and goes out once the device frees the bin."""
+    async def scenario():
+        device = FakeDevice()
+        device.busy.add(1)
+        queue = CommandQueue(device, max_depth=2, deadline=5)
+        ticket = queue.submit(1)
+        assert ticket.status == "queued"
+        assert queue.get_ticket(ticket.id) is ticket
+        await asyncio.sleep(0.01)
+        assert device.published == []
+
+        asyncio.get_running_loop().call_later(0.02, device.free, 1)
+        command_id = await asyncio.wait_for(queue.wait(ticket), 1)
+        await queue.stop()
+        return device, ticket, command_id
+
+    device, ticket, command_id = asyncio.run(scenario())
+    assert device.published == [1]
+    assert command_id == "cmd-1"
+    assert ticket.to_dict()["status"] == "sent"
+    assert ticket.to_dict()["expires_in"] is None
+
+def test_busy_bin_does_not_hold_up_other_bins():
+    """Test per-bin ordering: a later command for a free bin overtakes one waiting for a busy bin."""
+    async def scenario():
+        device = FakeDevice()
+        device.busy.add(1)
+        queue = CommandQueue(device, max_depth=4, deadline=5)
+        first = queue.submit(1)
+        second = queue.submit(1)
+        other = queue.submit(2)
+        assert other.sent
+        assert first.status == second.status == "queued"
+
+        device.free(1)
+        await asyncio.wait_for(queue.wait(first), 1)
+        await asyncio.sleep(0.01)
+        # The second command for bin 1 waits for the first one's cycle to end
+        assert second.status == "queued"
+        device.free(1)
+        await asyncio.wait_for(queue.wait(second), 1)
+        await queue.stop()
+        return device
+
+    device = asyncio.run(scenario())
+    assert device.published == [2, 1, 1]
+
+def test_queue_depth_limit():
+    """Test that submitting past max_depth raises CommandQueueFull and is counted as rejected."""
+    rejected = REGISTRY.get_sample_value("waste_classification_bin_queue_total", {"outcome": "rejected"}) or 0
+
+    async def scenario():
+        device = FakeDevice()
+        device.busy.add(0)
+        queue = CommandQueue(device, max_depth=1, deadline=5)
+        queue.submit(0)
+        try:
+            with pytest.raises(CommandQueueFull):
+                queue.submit(0)
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+    assert REGISTRY.get_sample_value("waste_classification_bin_queue_total", {"outcome": "rejected"}) == rejected + 1
+
+def test_queued_command_expires_at_deadline():
+    """Test that a command still waiting at its deadline expires and its waiter gets CommandExpired."""
+    expired = REGISTRY.get_sample_value("waste_classification_bin_queue_total", {"outcome": "expired"}) or 0
+
+    async def scenario():
+        device = FakeDevice()
+        device.busy.add(3)
+        queue = CommandQueue(device, max_depth=2, deadline=0.05)
+        ticket = queue.submit(3)
+        try:
+            with pytest.raises(CommandExpired):
+                await asyncio.wait_for(queue.wait(ticket), 1)
+        finally:
+            await queue.stop()
+        return device, ticket
+
+    device, ticket = asyncio.run(scenario())
+    assert device.published == []
+    assert ticket.status == "expired"
+    assert REGISTRY.get_sample_value("waste_classification_bin_queue_total", {"outcome": "expired"}) == expired + 1
+
+def test_failed_publish():
+    """Test that a publish error reaches the caller directly, or the waiter of a queued command."""
+    async def scenario():
+        device = FakeDevice()
+        device.fail = True
+        queue = CommandQueue(device, max_depth=2, deadline=5)
+        with pytest.raises(ConnectionError):
+            queue.submit(0)
+
+        device.busy.add(1)
+        ticket = queue.submit(1)
+        device.free(1)
+        try:
+            with pytest.raises(ConnectionError, match="not connected"):
+                await asyncio.wait_for(queue.wait(ticket), 1)
+        finally:
+            await queue.stop()
+        return ticket
+
+    ticket = asyncio.run(scenario())
+    assert ticket.status == "failed"
+    assert ticket.error == "MQTT client not connected to broker"
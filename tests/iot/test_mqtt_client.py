@@ -1,9 +1,11 @@
 import pytest
+import json
 from unittest.mock import patch, MagicMock, mock_open
 import time
 import os
 import ssl
 import tempfile
+from prometheus_client import REGISTRY
 from iot.mqtt_client import MQTTClient
 
 @pytest.fixture
@@ -32,6 +34,12 @@ def mqtt_client(mock_env_vars):
         client.client = mock_mqtt_client.return_value
         return client
 
+def servo_status(mqtt_client, payload):
+    mock_message = MagicMock()
+    mock_message.topic = 'test/waste/servo/status'
+    mock_message.payload.decode.return_value = payload
+    mqtt_client.on_message(None, None, mock_message)
+
 def test_mqtt_client_init_success(mock_env_vars):
     """Test successful MQTTClient initialization."""
     with patch('paho.mqtt.client.Client') as mock_mqtt_client, \
@@ -54,6 +62,45 @@ def test_mqtt_client_init_success(mock_env_vars):
         mock_mqtt_client.return_value.connect.assert_called_with('test.broker.com', 8883, 60)
         mock_mqtt_client.return_value.loop_start.assert_called_once()
 
+def test_mqtt_client_connect_async(mock_env_vars):
+    """Test that a deferred client connects from the network thread without blocking."""
+    with patch('paho.mqtt.client.Client') as mock_mqtt_client, \
+         patch('iot.mqtt_client.MQTTClient.configure_ssl'):
+        client = MQTTClient(connect=False)
+        mock_mqtt_client.return_value.connect.assert_not_called()
+        mock_mqtt_client.return_value.loop_start.assert_not_called()
+
+        client.connect_async()
+
+        mock_mqtt_client.return_value.connect_async.assert_called_with('test.broker.com', 8883, 60)
+        mock_mqtt_client.return_value.connect.assert_not_called()
+        mock_mqtt_client.return_value.loop_start.assert_called_once()
+        assert client.connected == False
+
+def test_mqtt_client_after_fork(mock_env_vars):
+    """Test that after_fork replaces the inherited paho client and resets the device state."""
+    with patch('paho.mqtt.client.Client') as mock_mqtt_client, \
+         patch('iot.mqtt_client.MQTTClient.configure_ssl') as mock_configure_ssl:
+        inherited, fresh = MagicMock(), MagicMock()
+        mock_mqtt_client.side_effect = [inherited, fresh]
+        client = MQTTClient(connect=False)
+        client.connected = True
+        client.esp32_status = "online"
+        client.client = inherited
+        inherited.publish.return_value.rc = 0
+        client.publish(1)
+
+        client.after_fork()
+
+        assert client.client is fresh
+        assert client.connected == False
+        assert client.esp32_status == "unknown"
+        assert not client.pending_commands
+        fresh.username_pw_set.assert_called_with('test_user', 'test_pass')
+        assert fresh.on_message == client.on_message
+        assert mock_configure_ssl.call_count == 2
+        fresh.connect.assert_not_called()
+
 def test_mqtt_client_init_invalid_port(mock_env_vars):
     """Test initialization with invalid MQTT_PORT."""
     mock_env_vars.side_effect = lambda key, default=None: {
@@ -235,6 +282,23 @@ def test_on_message_invalid_topic(mqtt_client):
     assert mqtt_client.bin_status == 'OK'  # Should not change
     assert mqtt_client.esp32_status == 'online'  # Should not change
 
+def test_on_message_metrics(mqtt_client):
+    """Test that received messages are counted per topic and their handling is timed."""
+    def sample(name, labels=None):
+        return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+    before = {topic: sample('waste_classification_mqtt_messages_total', {'topic': topic}) for topic in ('status', 'other')}
+    handled = sample('waste_classification_mqtt_on_message_seconds_count')
+    for topic in ('test/waste/status', 'test/waste/status', 'test/waste/unexpected'):
+        mock_message = MagicMock()
+        mock_message.topic = topic
+        mock_message.payload.decode.return_value = 'online'
+        mqtt_client.on_message(None, None, mock_message)
+
+    assert sample('waste_classification_mqtt_messages_total', {'topic': 'status'}) == before['status'] + 2
+    assert sample('waste_classification_mqtt_messages_total', {'topic': 'other'}) == before['other'] + 1
+    assert sample('waste_classification_mqtt_on_message_seconds_count') == handled + 3
+
 def test_is_device_online(mqtt_client):
     """Test is_device_online method with various statuses."""
     mqtt_client.esp32_status = 'online'
@@ -249,39 +313,126 @@ def test_get_bin_status_not_connected(mqtt_client):
     mqtt_client.connected = False
     assert mqtt_client.get_bin_status() == 'unknown'
 
-def test_get_bin_status_busy(mqtt_client):
-    """Test get_bin_status when recently updated (busy)."""
+def test_get_bin_status_no_device_report(mqtt_client):
+    """Test get_bin_status before the device reported any servo status."""
     mqtt_client.connected = True
-    mqtt_client.last_status_update = time.time()
-    assert mqtt_client.get_bin_status() == 'busy'
+    assert mqtt_client.get_bin_status() == 'unknown'
 
 def test_get_bin_status_OK(mqtt_client):
-    """Test get_bin_status when update is old and bin is available."""
+    """Test get_bin_status when every bin is idle, however recent the last message."""
     mqtt_client.connected = True
-    mqtt_client.last_status_update = time.time() - 2
-    mqtt_client.bin_status = 'OK'
+    mqtt_client.last_status_update = time.time()
+    mqtt_client.bin_status = 'available'
     assert mqtt_client.get_bin_status() == 'OK'
+    assert mqtt_client.get_bin_status(1) == 'OK'
 
-def test_get_bin_status_edge_time(mqtt_client):
-    """Test get_bin_status at the edge of the 1.5-second threshold."""
+def test_get_bin_status_follows_device_cycle(mqtt_client):
+    """Test that a commanded bin is busy through its cycle until the device reports it closed, other bins stay free."""
     mqtt_client.connected = True
     mqtt_client.bin_status = 'OK'
-    
-    # Just within 1.5 seconds
-    mqtt_client.last_status_update = time.time() - 1.4
+    mqtt_client.command_format = 'json'
+    mqtt_client.client.publish.return_value.rc = 0
+
+    command_id = mqtt_client.publish(1)
+    assert mqtt_client.get_bin_status(1) == 'busy'
+    assert mqtt_client.get_bin_status(2) == 'OK'
     assert mqtt_client.get_bin_status() == 'busy'
-    
-    # Just beyond 1.5 seconds
-    mqtt_client.last_status_update = time.time() - 1.6
+
+    for status in ('opening', 'open', 'closing'):
+        servo_status(mqtt_client, json.dumps({'status': status, 'id': command_id}))
+        assert mqtt_client.get_bin_states()['bins']['1']['state'] == status
+        assert mqtt_client.get_bin_status(1) == 'busy'
+    servo_status(mqtt_client, 'closed')
+    assert mqtt_client.get_bin_status(1) == 'OK'
     assert mqtt_client.get_bin_status() == 'OK'
 
+def test_get_bin_status_legacy_firmware(mqtt_client):
+    """Test a device that only reports busy while moving and OK once done, with plain commands."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+    mqtt_client.client.publish.return_value.rc = 0
+    labels = {'device': 'test/waste', 'bin': '0'}
+    cycles = REGISTRY.get_sample_value('waste_classification_bin_cycle_seconds_count', labels) or 0
+
+    mqtt_client.publish(0)
+    servo_status(mqtt_client, 'busy')
+    assert mqtt_client.get_bin_status(0) == 'busy'
+    servo_status(mqtt_client, 'OK')
+    assert mqtt_client.get_bin_status(0) == 'OK'
+    assert REGISTRY.get_sample_value('waste_classification_bin_cycle_seconds_count', labels) == cycles + 1
+
+def test_get_bin_status_timeouts(mqtt_client):
+    """Test that a bin the device stops reporting on runs through the state timeouts back to idle."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+    mqtt_client.client.publish.return_value.rc = 0
+    timeouts = mqtt_client.state_timeouts
+
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0):
+        command_id = mqtt_client.publish(2)
+        servo_status(mqtt_client, json.dumps({'status': 'opening', 'id': command_id}))
+    # Opening, then open, then closing each last their full timeout
+    remaining = timeouts['opening'] + timeouts['open'] + timeouts['closing']
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0 + remaining - 0.1):
+        assert mqtt_client.get_bin_states()['bins']['2']['state'] == 'closing'
+        assert mqtt_client.get_bin_status(2) == 'busy'
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0 + remaining + 0.1):
+        assert mqtt_client.get_bin_status(2) == 'OK'
+
+def test_get_bin_status_unacknowledged_command(mqtt_client):
+    """Test that a command the device never acknowledges frees its bin after the ack timeout."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+    mqtt_client.client.publish.return_value.rc = 0
+
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0):
+        mqtt_client.publish(3)
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0 + mqtt_client.ack_timeout - 0.1):
+        assert mqtt_client.get_bin_status(3) == 'busy'
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0 + mqtt_client.ack_timeout + 0.1):
+        assert mqtt_client.get_bin_status(3) == 'OK'
+
+def test_get_bin_status_other_publisher(mqtt_client):
+    """Test that a cycle this process did not command (e.g. another worker's) holds the whole device."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+
+    servo_status(mqtt_client, 'busy')
+    assert mqtt_client.get_bin_status(0) == 'busy'
+    assert mqtt_client.get_bin_states()['device_state'] == 'opening'
+    servo_status(mqtt_client, 'available')
+    assert mqtt_client.get_bin_status(0) == 'OK'
+
+def test_publish_failure_frees_bin(mqtt_client):
+    """Test that a command that could not be published does not hold its bin."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+    mqtt_client.client.publish.return_value.rc = 1
+
+    with pytest.raises(ConnectionError):
+        mqtt_client.publish(1)
+    assert mqtt_client.get_bin_status(1) == 'OK'
+
 def test_publish_success(mqtt_client):
     """Test publish method with successful publication."""
     mqtt_client.connected = True
     mqtt_client.client.publish.return_value.rc = 0
     
-    mqtt_client.publish(1)
+    published = REGISTRY.get_sample_value('waste_classification_mqtt_publish_seconds_count') or 0
+    command_id = mqtt_client.publish(1)
     mqtt_client.client.publish.assert_called_with('test/waste/1', '1')
+    assert REGISTRY.get_sample_value('waste_classification_mqtt_publish_seconds_count') == published + 1
+    assert list(mqtt_client.pending_commands) == [command_id]
+
+def test_publish_json_format(mqtt_client):
+    """Test that the opt-in JSON command format carries the correlation id."""
+    mqtt_client.connected = True
+    mqtt_client.command_format = 'json'
+    mqtt_client.client.publish.return_value.rc = 0
+
+    command_id = mqtt_client.publish(2)
+    mqtt_client.client.publish.assert_called_with('test/waste/2', json.dumps({'bin': 2, 'id': command_id}))
+    assert command_id in mqtt_client.pending_commands
 
 def test_publish_not_connected(mqtt_client):
     """Test publish method when not connected."""
@@ -311,6 +462,166 @@ def test_publish_failure(mqtt_client):
     
     with pytest.raises(ConnectionError, match="Failed to publish to test/waste/1"):
         mqtt_client.publish(1)
+    assert not mqtt_client.pending_commands
+
+def test_acknowledge_by_correlation_id(mqtt_client):
+    """Test that a status message echoing a command id acknowledges that command and records its latency."""
+    mqtt_client.connected = True
+    mqtt_client.client.publish.return_value.rc = 0
+    labels = {'device': 'test/waste', 'bin': '3'}
+    observed = REGISTRY.get_sample_value('waste_classification_bin_actuation_seconds_count', labels) or 0
+
+    first = mqtt_client.publish(1)
+    second = mqtt_client.publish(3)
+    servo_status(mqtt_client, json.dumps({'status': 'busy', 'id': second}))
+
+    assert mqtt_client.bin_status == 'busy'
+    assert list(mqtt_client.pending_commands) == [first]
+    (entry,) = mqtt_client.recent_commands
+    assert entry['id'] == second
+    assert entry['bin_index'] == 3
+    assert entry['status'] == 'busy'
+    assert entry['latency_ms'] >= 0
+    assert entry['timed_out'] is False
+    assert REGISTRY.get_sample_value('waste_classification_bin_actuation_seconds_count', labels) == observed + 1
+
+def test_acknowledge_plain_status_takes_oldest_command(mqtt_client):
+    """Test that a status without an id acknowledges the oldest pending command."""
+    mqtt_client.connected = True
+    mqtt_client.client.publish.return_value.rc = 0
+
+    first = mqtt_client.publish(0)
+    second = mqtt_client.publish(2)
+    servo_status(mqtt_client, 'busy')
+
+    assert mqtt_client.recent_commands[-1]['id'] == first
+    assert list(mqtt_client.pending_commands) == [second]
+
+def test_plain_completion_finishes_the_moving_bin(mqtt_client):
+    """Test that a plain OK ends the cycle under way instead of acknowledging a command that has not moved yet."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+    mqtt_client.client.publish.return_value.rc = 0
+
+    first = mqtt_client.publish(1)
+    servo_status(mqtt_client, 'busy')
+    second = mqtt_client.publish(2)
+    servo_status(mqtt_client, 'OK')
+
+    assert [(record['id'], record['status']) for record in mqtt_client.recent_commands] == [(first, 'busy')]
+    assert list(mqtt_client.pending_commands) == [second]
+    assert mqtt_client.bins.state(1) == 'idle'
+    assert mqtt_client.bins.state(2) == 'commanded'
+    assert mqtt_client.get_bin_status(2) == 'busy'
+
+def test_plain_commands_hold_the_whole_device(mqtt_client):
+    """Test that with plain commands one command is in flight per device, so plain acknowledgements stay unambiguous."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+    mqtt_client.client.publish.return_value.rc = 0
+
+    mqtt_client.publish(1)
+    assert mqtt_client.get_bin_status(1) == 'busy'
+    assert mqtt_client.get_bin_status(2) == 'busy'
+    servo_status(mqtt_client, 'busy')
+    servo_status(mqtt_client, 'OK')
+    assert mqtt_client.get_bin_status(2) == 'OK'
+
+def test_acknowledge_by_bin_without_id(mqtt_client):
+    """Test that a status naming only its bin acknowledges that bin's command, not the oldest one."""
+    mqtt_client.connected = True
+    mqtt_client.bin_status = 'OK'
+    mqtt_client.command_format = 'json'
+    mqtt_client.client.publish.return_value.rc = 0
+
+    first = mqtt_client.publish(1)
+    second = mqtt_client.publish(2)
+    servo_status(mqtt_client, json.dumps({'status': 'busy', 'bin': 2}))
+
+    assert [(record['id'], record['bin_index']) for record in mqtt_client.recent_commands] == [(second, 2)]
+    assert list(mqtt_client.pending_commands) == [first]
+    assert mqtt_client.bins.state(2) == 'opening'
+    assert mqtt_client.bins.state(1) == 'commanded'
+
+def test_acknowledge_without_pending_command(mqtt_client):
+    """Test that status messages with no command outstanding or an unknown id are ignored."""
+    servo_status(mqtt_client, 'OK')
+    servo_status(mqtt_client, '{"status": "busy", "id": "unknown"}')
+
+    assert mqtt_client.bin_status == 'busy'
+    assert not mqtt_client.recent_commands
+
+def test_parse_status():
+    """Test parsing plain, JSON and malformed servo/status payloads."""
+    assert MQTTClient.parse_status('OK') == ('OK', None, None)
+    assert MQTTClient.parse_status('{"status": "open", "id": "abc"}') == ('open', 'abc', None)
+    assert MQTTClient.parse_status('{"status": "open", "bin": 2}') == ('open', None, 2)
+    assert MQTTClient.parse_status('{not json') == ('{not json', None, None)
+
+def test_command_timeout(mqtt_client):
+    """Test that a command not acknowledged within ack_timeout is counted and reported as timed out."""
+    mqtt_client.connected = True
+    mqtt_client.client.publish.return_value.rc = 0
+    labels = {'device': 'test/waste', 'bin': '1'}
+    timeouts = REGISTRY.get_sample_value('waste_classification_bin_command_timeouts_total', labels) or 0
+
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0):
+        command_id = mqtt_client.publish(1)
+    with patch('iot.mqtt_client.time.monotonic', return_value=100.0 + mqtt_client.ack_timeout + 0.1):
+        # The late acknowledgement no longer matches anything
+        servo_status(mqtt_client, json.dumps({'status': 'busy', 'id': command_id}))
+
+    assert not mqtt_client.pending_commands
+    assert mqtt_client.recent_commands[-1] == {
+        'id': command_id,
+        'bin_index': 1,
+        'published_at': mqtt_client.recent_commands[-1]['published_at'],
+        'status': 'timeout',
+        'latency_ms': None,
+        'timed_out': True,
+    }
+    assert mqtt_client.command_timeouts == 1
+    assert REGISTRY.get_sample_value('waste_classification_bin_command_timeouts_total', labels) == timeouts + 1
+
+def test_get_command_latencies(mqtt_client):
+    """Test the latency report: pending commands, recent history and percentiles."""
+    mqtt_client.connected = True
+    mqtt_client.client.publish.return_value.rc = 0
+
+    for i, latency in enumerate((0.1, 0.2, 0.4)):
+        with patch('iot.mqtt_client.time.monotonic', return_value=10.0 * i):
+            command_id = mqtt_client.publish(i)
+        with patch('iot.mqtt_client.time.monotonic', return_value=10.0 * i + latency):
+            servo_status(mqtt_client, json.dumps({'status': 'busy', 'id': command_id}))
+    pending = mqtt_client.publish(3)
+
+    report = mqtt_client.get_command_latencies()
+    assert report['device'] == 'test/waste'
+    assert [entry['id'] for entry in report['pending']] == [pending]
+    assert [entry['bin_index'] for entry in report['recent']] == [0, 1, 2]
+    assert report['summary'] == {'acknowledged': 3, 'timeouts': 0, 'p50_ms': 200.0, 'p95_ms': 400.0, 'max_ms': 400.0}
+
+def test_get_command_latencies_empty(mqtt_client):
+    """Test the latency report before any command was sent."""
+    report = mqtt_client.get_command_latencies()
+    assert report['pending'] == []
+    assert report['recent'] == []
+    assert report['summary'] == {'acknowledged': 0, 'timeouts': 0}
+
+def test_recent_commands_bounded(mock_env_vars):
+    """Test that MQTT_LATENCY_HISTORY bounds the latency history."""
+    overrides = {'MQTT_LATENCY_HISTORY': '2'}
+    getenv = mock_env_vars.side_effect
+    mock_env_vars.side_effect = lambda key, default=None: overrides.get(key, getenv(key, default))
+    with patch('paho.mqtt.client.Client'), patch('iot.mqtt_client.MQTTClient.configure_ssl'):
+        client = MQTTClient(connect=False)
+    client.connected = True
+    client.client.publish.return_value.rc = 0
+
+    for i in range(3):
+        client.publish(i)
+        servo_status(client, 'busy')
+    assert [entry['bin_index'] for entry in client.recent_commands] == [1, 2]
 
 def test_get_connection_info(mqtt_client):
     """Test get_connection_info method."""
@@ -0,0 +1,190 @@
+import pytest
+import asyncio
+import io
+import numpy as np
+from unittest.mock import patch, MagicMock, AsyncMock
+from PIL import Image
+from ml.cache import PredictionCache, CachedClassifier, PerceptualIndex, PERCEPTUAL_HASHES, perceptual_hash
+from ml.executor import InferenceExecutor
+from ml.model import encode_raw_tensor
+
+RESULT = ("recycle", {"hazardous": 4.3, "organic": 5.2, "other": 5.4, "recycle": 85.1})
+
+@pytest.fixture
+def mock_classifier():
+    """Fixture to create a mocked WasteClassifier."""
+    classifier = MagicMock()
+    classifier.model_version = "v1"
+    classifier.predict.return_value = RESULT
+    classifier.predict_async = AsyncMock(return_value=RESULT)
+    classifier.predict_batch.side_effect = lambda images: [RESULT for _ in images]
+    classifier.executor = InferenceExecutor(kind="thread", max_workers=1)
+    return classifier
+
+@pytest.fixture
+def cached_classifier(mock_classifier):
+    return CachedClassifier(mock_classifier, PredictionCache(max_bytes=1024 * 1024, ttl=60))
+
+def test_cache_hit_skips_inference(cached_classifier, mock_classifier):
+    """Test that resending the same bytes is served from the cache."""
+    assert cached_classifier.predict(b"frame") == RESULT
+    assert cached_classifier.predict(b"frame") == RESULT
+
+    mock_classifier.predict.assert_called_once_with(b"frame")
+    stats = cached_classifier.cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_cache_predict_async(cached_classifier, mock_classifier):
+    """Test that predict_async also reads through the cache."""
+    async def main():
+        await cached_classifier.predict_async(b"frame")
+        return await cached_classifier.predict_async(b"frame")
+
+    assert asyncio.run(main()) == RESULT
+    mock_classifier.predict_async.assert_awaited_once_with(b"frame")
+
+def test_cache_predict_batch_only_infers_misses(cached_classifier, mock_classifier):
+    """Test that a batch only sends uncached images to the model."""
+    cached_classifier.predict(b"a")
+    results = cached_classifier.predict_batch([b"a", b"b", b"c"])
+
+    assert results == [RESULT, RESULT, RESULT]
+    mock_classifier.predict_batch.assert_called_once_with([b"b", b"c"])
+
+def test_cache_ttl_expiry():
+    """Test that expired entries count as misses."""
+    cache = PredictionCache(max_bytes=1024 * 1024, ttl=10)
+    with patch("ml.cache.time.monotonic", return_value=100):
+        cache.put(b"key", RESULT)
+    with patch("ml.cache.time.monotonic", return_value=105):
+        assert cache.get(b"key") == RESULT
+    with patch("ml.cache.time.monotonic", return_value=111):
+        assert cache.get(b"key") is None
+    assert len(cache) == 0
+    assert cache.size_bytes == 0
+
+def test_cache_lru_eviction_respects_memory_budget():
+    """Test that least recently used entries are evicted to stay within budget."""
+    entry_size = PredictionCache._estimate_size(PredictionCache.key_for(b"a"), RESULT)
+    cache = PredictionCache(max_bytes=entry_size * 2, ttl=60)
+    keys = [cache.key_for(data) for data in (b"a", b"b", b"c")]
+
+    cache.put(keys[0], RESULT)
+    cache.put(keys[1], RESULT)
+    cache.get(keys[0])  # "a" becomes most recently used
+    cache.put(keys[2], RESULT)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == RESULT
+    assert cache.size_bytes <= cache.max_bytes
+    assert cache.evictions == 1
+
+def test_cache_invalidated_on_model_change(cached_classifier, mock_classifier):
+    """Test that a new model version drops cached predictions."""
+    cached_classifier.predict(b"frame")
+    mock_classifier.model_version = "v2"
+    cached_classifier.predict(b"frame")
+
+    assert mock_classifier.predict.call_count == 2
+
+def test_cache_model_swap_during_inference(cached_classifier, mock_classifier):
+    """Test that a result computed while the model changed is not served for the new model."""
+    async def swap_model(image_data):
+        mock_classifier.model_version = "v2"
+        return RESULT
+
+    mock_classifier.predict_async.side_effect = swap_model
+    asyncio.run(cached_classifier.predict_async(b"frame"))
+    cached_classifier.predict(b"frame")
+
+    mock_classifier.predict.assert_called_once_with(b"frame")
+
+def test_cached_classifier_delegates_attributes(cached_classifier, mock_classifier):
+    """Test that model and class_names come from the wrapped classifier."""
+    assert cached_classifier.model is mock_classifier.model
+    assert cached_classifier.class_names is mock_classifier.class_names
+
+def make_jpeg(pixels):
+    img = Image.fromarray(pixels.astype(np.uint8), "RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+@pytest.fixture
+def chute_frames():
+    """Two nearly identical frames of an empty chute and one with an object in it."""
+    rng = np.random.default_rng(0)
+    base = np.tile(np.linspace(0, 255, 320), (240, 1))[..., None].repeat(3, axis=2)
+    noisy = np.clip(base + rng.normal(0, 2, base.shape), 0, 255)
+    with_object = base.copy()
+    with_object[60:180, 100:220] = 255 - with_object[60:180, 100:220]
+    return make_jpeg(base), make_jpeg(noisy), make_jpeg(with_object)
+
+@pytest.mark.parametrize("method", ["ahash", "dhash"])
+def test_perceptual_hash_near_duplicates(chute_frames, method):
+    """Test that slightly different frames hash close together and changed frames do not."""
+    empty, empty_noisy, with_object = chute_frames
+    hash_fn = PERCEPTUAL_HASHES[method]
+    assert empty != empty_noisy
+    assert bin(hash_fn(empty) ^ hash_fn(empty_noisy)).count("1") <= 4
+    assert bin(hash_fn(empty) ^ hash_fn(with_object)).count("1") > 4
+
+@pytest.mark.parametrize("method", ["ahash", "dhash"])
+def test_perceptual_hash_raw_tensor_matches_png(method):
+    """Test that a raw tensor upload hashes like the same pixels sent as a lossless image."""
+    pixels = np.random.default_rng(1).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+
+    hash_fn = PERCEPTUAL_HASHES[method]
+    assert hash_fn(encode_raw_tensor(pixels)) == hash_fn(buffer.getvalue())
+
+def test_perceptual_index_lookup_and_ttl():
+    """Test Hamming-distance lookup and expiry in the array-backed index."""
+    index = PerceptualIndex(max_distance=2, capacity=4, ttl=10, method="dhash")
+    with patch("ml.cache.time.monotonic", return_value=100):
+        index.add(0b1111, RESULT)
+        assert index.lookup(0b1101) == RESULT  # distance 1
+        assert index.lookup(0b0000) is None  # distance 4
+    with patch("ml.cache.time.monotonic", return_value=111):
+        assert index.lookup(0b1111) is None
+    assert index.hits == 1
+    assert index.misses == 2
+
+def test_perceptual_index_ring_buffer_capacity():
+    """Test that the index overwrites the oldest entry once full."""
+    index = PerceptualIndex(max_distance=0, capacity=2, ttl=60)
+    index.add(1, ("organic", {}))
+    index.add(2, ("recycle", {}))
+    index.add(3, ("other", {}))
+    assert index.lookup(1) is None
+    assert index.lookup(3) == ("other", {})
+
+def test_perceptual_index_matches_model_version():
+    """Test that entries only match lookups for the model version they were added with."""
+    index = PerceptualIndex(max_distance=0, capacity=4, ttl=60)
+    index.add(1, RESULT, "v1")
+    assert index.lookup(1, "v1") == RESULT
+    assert index.lookup(1, "v2") is None
+
+def test_cached_classifier_reuses_near_duplicate(mock_classifier, chute_frames):
+    """Test that a near-duplicate frame reuses the earlier prediction."""
+    empty, empty_noisy, with_object = chute_frames
+    cached = CachedClassifier(mock_classifier, PredictionCache(ttl=60), PerceptualIndex(max_distance=4, ttl=60))
+
+    cached.predict(empty)
+    assert cached.predict(empty_noisy) == RESULT
+    mock_classifier.predict.assert_called_once_with(empty)
+
+    asyncio.run(cached.predict_async(with_object))
+    mock_classifier.predict_async.assert_awaited_once_with(with_object)
+
+def test_cached_classifier_hashes_on_inference_executor(mock_classifier, chute_frames):
+    """Test that predict_async computes the perceptual hash on the bounded inference executor."""
+    empty, _, _ = chute_frames
+    cached = CachedClassifier(mock_classifier, PredictionCache(ttl=60), PerceptualIndex(max_distance=4, ttl=60))
+
+    with patch.object(mock_classifier.executor, "run", wraps=mock_classifier.executor.run) as run:
+        asyncio.run(cached.predict_async(empty))
+    run.assert_called_once_with(perceptual_hash, cached.perceptual.hash_fn, empty)
@@ -0,0 +1,61 @@
+import pytest
+import asyncio
+import threading
+from prometheus_client import REGISTRY
+from ml.executor import InferenceExecutor, InferenceQueueFull
+
+@pytest.fixture
+def executor():
+    """Fixture to create a small thread-based inference executor."""
+    executor = InferenceExecutor(kind="thread", max_workers=1, max_queue=2)
+    yield executor
+    executor.shutdown()
+
+def test_executor_invalid_kind():
+    """Test that an unknown executor kind is rejected."""
+    with pytest.raises(ValueError, match="Unknown inference executor"):
+        InferenceExecutor(kind="gpu")
+
+def test_run_off_event_loop(executor):
+    """Test that jobs run on a worker thread, not the event loop thread."""
+    async def main():
+        loop_thread = threading.get_ident()
+        worker_thread = await executor.run(threading.get_ident)
+        return loop_thread, worker_thread
+
+    loop_thread, worker_thread = asyncio.run(main())
+    assert loop_thread != worker_thread
+    assert executor.pending == 0
+
+def test_queue_full_and_depth(executor):
+    """Test that the bounded queue rejects jobs and reports its depth."""
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(executor.run(release.wait))
+        second = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        assert executor.pending == 2
+        assert executor.queue_depth == 1
+        assert REGISTRY.get_sample_value("waste_classification_inference_queue_depth") == 1
+        with pytest.raises(InferenceQueueFull):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(main())
+    stats = executor.get_stats()
+    assert stats["pending"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["rejected"] == 1
+    assert REGISTRY.get_sample_value("waste_classification_inference_queue_depth") == 0
+
+def test_after_fork_forgets_pool(executor):
+    """Test that after_fork drops the inherited pool and pending count, and a new pool is created on use."""
+    pool = executor.pool
+    executor.pending = 3
+    executor.after_fork()
+
+    assert executor.pending == 0
+    assert executor.pool is not pool
+    pool.shutdown()
@@ -0,0 +1,19 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from ml.export_tflite import convert_to_tflite
+
+def test_convert_to_tflite(tmp_path):
+    """Test that the Keras model is converted and written to the output path."""
+    mock_tf = MagicMock()
+    mock_tf.lite.TFLiteConverter.from_keras_model.return_value.convert.return_value = b"TFL3" + b"\x00" * 12
+    configure = MagicMock()
+    output_path = tmp_path / "model" / "model.tflite"
+
+    with patch.dict("sys.modules", {"tensorflow": mock_tf}):
+        size = convert_to_tflite("ml/model/model.keras", str(output_path), configure=configure)
+
+    mock_tf.keras.models.load_model.assert_called_once_with("ml/model/model.keras")
+    converter = mock_tf.lite.TFLiteConverter.from_keras_model.return_value
+    configure.assert_called_once_with(converter)
+    assert size == 16
+    assert output_path.read_bytes().startswith(b"TFL3")
@@ -0,0 +1,242 @@
+import os
+import tempfile
+import threading
+import pytest
+import numpy as np
+from multiprocessing import shared_memory
+from unittest.mock import patch
+from ml.inference_server import InferenceServer
+from ml.model import RemoteBackend, InferenceBackend
+
+class MeanBackend(InferenceBackend):
+    """Fake local backend: the probability vector encodes the mean of each input"""
+    name = "keras"
+    model = object()
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, img_batch):
+        self.batch_sizes.append(len(img_batch))
+        means = img_batch.reshape(len(img_batch), -1).mean(axis=1)
+        return np.stack([means, means + 1, means + 2, means + 3], axis=1).astype(np.float32)
+
+def start_server(address):
+    """Run an inference server with a fake backend, returns it and its accept thread"""
+    backend = MeanBackend()
+    with patch("ml.inference_server.load_backend", return_value=(backend, "model.keras")), \
+         patch.dict(os.environ, {"MODEL_BATCH_MAX_WAIT_MS": "20"}):
+        server = InferenceServer(address=address, slots=8, slots_per_client=4)
+    server.listen()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+@pytest.fixture
+def address():
+    """Fixture for a temporary Unix socket path."""
+    # Server and clients share this process, so attach without the cross-process resource tracker workaround
+    with patch("ml.model.attach_shared_memory", side_effect=lambda name: shared_memory.SharedMemory(name=name)):
+        yield os.path.join(tempfile.mkdtemp(), "inference.sock")
+
+@pytest.fixture
+def server(address):
+    """Fixture to run an inference server with a fake backend on a temporary Unix socket."""
+    server, thread = start_server(address)
+    yield server
+    server.stop()
+    thread.join(timeout=5)
+
+def images(*values):
+    return np.stack([np.full((224, 224, 3), value, dtype=np.float32) for value in values])
+
+def test_remote_backend_round_trip(server):
+    """Test that probabilities come back for every image, including batches larger than the slot range."""
+    client = RemoteBackend(address=server.address)
+    try:
+        assert client.model_path == "model.keras"
+        result = client.predict(images(1, 2, 3, 4, 5, 6))
+        np.testing.assert_allclose(result[:, 0], [1, 2, 3, 4, 5, 6])
+        np.testing.assert_allclose(result[:, 3], [4, 5, 6, 7, 8, 9])
+    finally:
+        client.close()
+
+def test_server_batches_across_clients(server):
+    """Test that concurrent requests from different clients share forward passes."""
+    clients = [RemoteBackend(address=server.address) for _ in range(2)]
+    results = {}
+    barrier = threading.Barrier(4)
+
+    def run(client, value):
+        barrier.wait()
+        results[value] = client.predict(images(value))[0, 0]
+
+    threads = [threading.Thread(target=run, args=(clients[i % 2], i + 10)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    for client in clients:
+        client.close()
+
+    assert results == {10: 10, 11: 11, 12: 12, 13: 13}
+    assert server.batcher.requests_served == 4
+    assert server.batcher.batches_run < 4
+
+def test_server_refuses_clients_without_free_slots(server):
+    """Test that a client is refused once every slot range is taken, and the range is reused after close."""
+    clients = [RemoteBackend(address=server.address) for _ in range(2)]
+    with pytest.raises(ConnectionError, match="all 8 slots are in use"):
+        RemoteBackend(address=server.address, connect_timeout=0)
+
+    clients[0].close()
+    for _ in range(50):
+        if server.clients < 2:
+            break
+        threading.Event().wait(0.01)
+    replacement = RemoteBackend(address=server.address)
+    np.testing.assert_allclose(replacement.predict(images(7))[:, 0], [7])
+    replacement.close()
+    clients[1].close()
+
+def test_server_reports_inference_errors(server):
+    """Test that a failed forward pass is raised in the client instead of hanging."""
+    client = RemoteBackend(address=server.address)
+    try:
+        with patch.object(server.batcher, "infer_fn", side_effect=Exception("Model prediction error")):
+            with pytest.raises(RuntimeError, match="Inference server failed"):
+                client.predict(images(1))
+    finally:
+        client.close()
+
+def test_timed_out_slots_wait_for_their_late_reply(server):
+    """Test that slots of a timed-out request are only reused once the server's late reply arrived."""
+    client = RemoteBackend(address=server.address, timeout=0.1)
+    infer_fn = server.batcher.infer_fn
+    late_reply = threading.Event()
+
+    def slow_infer(img_batch):
+        late_reply.wait(5)
+        return infer_fn(img_batch)
+
+    try:
+        with patch.object(server.batcher, "infer_fn", side_effect=slow_infer):
+            with pytest.raises(TimeoutError):
+                client.predict(images(1))
+            assert len(client._connection.free) == 3
+            late_reply.set()
+            for _ in range(100):
+                if len(client._connection.free) == 4:
+                    break
+                threading.Event().wait(0.01)
+        assert len(client._connection.free) == 4
+        np.testing.assert_allclose(client.predict(images(5, 6, 7, 8))[:, 0], [5, 6, 7, 8])
+    finally:
+        client.close()
+
+def wait_for(condition, timeout=1):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        threading.Event().wait(0.01)
+    return condition()
+
+def test_server_keeps_range_until_its_requests_settle(server):
+    """Test that a disconnected client's range is only handed out again once its in-flight requests finished."""
+    client = RemoteBackend(address=server.address, timeout=0.1)
+    infer_fn = server.batcher.infer_fn
+    late_reply = threading.Event()
+
+    def slow_infer(img_batch):
+        late_reply.wait(5)
+        return infer_fn(img_batch)
+
+    with patch.object(server.batcher, "infer_fn", side_effect=slow_infer):
+        with pytest.raises(TimeoutError):
+            client.predict(images(1))
+        client.close()
+        assert wait_for(lambda: server.clients == 0)
+        assert len(server._free_ranges) == 1
+        late_reply.set()
+        assert wait_for(lambda: len(server._free_ranges) == 2)
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_after_fork_reconnects(server):
+    """Test that a forked child drops the inherited socket and gets its own connection and slot range."""
+    client = RemoteBackend(address=server.address)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                inherited = client._connection.sock
+                client.after_fork()
+                if inherited.fileno() == -1 and client.predict(images(3))[0, 0] == 3:
+                    exit_code = 0
+            finally:
+                os._exit(exit_code)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        # The parent's connection is untouched
+        np.testing.assert_allclose(client.predict(images(4))[:, 0], [4])
+    finally:
+        client.close()
+
+def test_stop_closes_client_connections(address):
+    """Test that stop() disconnects clients and waits for their handlers before releasing the ring."""
+    server, thread = start_server(address)
+    client = RemoteBackend(address=address)
+    try:
+        assert wait_for(lambda: server.clients == 1)
+        server.stop()
+        thread.join(timeout=5)
+
+        assert not server._connections
+        assert server.clients == 0
+        with pytest.raises(ConnectionError):
+            client.predict(images(1))
+    finally:
+        client.close()
+
+def test_remote_backend_reconnects_after_server_restart(address):
+    """Test that a lost server fails the call in flight and a later call reconnects to the restarted one."""
+    server, thread = start_server(address)
+    client = RemoteBackend(address=address, retry_max=0.05)
+    try:
+        np.testing.assert_allclose(client.predict(images(1))[:, 0], [1])
+        server.stop()
+        thread.join(timeout=5)
+        with pytest.raises(ConnectionError):
+            client.predict(images(2))
+
+        server, thread = start_server(address)
+        results = []
+
+        def reconnected():
+            try:
+                results.append(client.predict(images(3))[0, 0])
+            except ConnectionError:
+                pass
+            return bool(results)
+
+        assert wait_for(reconnected, timeout=2)
+        assert results == [3]
+    finally:
+        client.close()
+        server.stop()
+        thread.join(timeout=5)
+
+def test_remote_backend_waits_for_server_at_start(address):
+    """Test that a worker started before the server connects once it comes up."""
+    started = []
+    timer = threading.Timer(0.2, lambda: started.append(start_server(address)))
+    timer.start()
+    try:
+        client = RemoteBackend(address=address, connect_timeout=5)
+        np.testing.assert_allclose(client.predict(images(4))[:, 0], [4])
+        client.close()
+    finally:
+        timer.join()
+        for server, thread in started:
+            server.stop()
+            thread.join(timeout=5)
@@ -0,0 +1,60 @@
+import pytest
+import threading
+from unittest.mock import MagicMock
+from ml.loader import BackgroundClassifier, ModelNotReady
+
+def test_background_classifier_loads_in_background():
+    """Test that start returns immediately and the classifier is exposed once loaded."""
+    release = threading.Event()
+    classifier = MagicMock()
+
+    def factory():
+        release.wait(5)
+        return classifier
+
+    loader = BackgroundClassifier(factory)
+    assert loader.status == "idle"
+    loader.start()
+    assert loader.status == "loading"
+    assert loader.model is None
+    with pytest.raises(ModelNotReady, match="still loading"):
+        loader.predict_async
+
+    release.set()
+    assert loader.wait(5)
+    assert loader.status == "ready"
+    assert loader.model is classifier.model
+    assert loader.predict is classifier.predict
+    assert loader.load_time is not None
+
+def test_background_classifier_starts_once():
+    """Test that repeated start calls build the classifier only once."""
+    factory = MagicMock()
+    loader = BackgroundClassifier(factory)
+
+    assert loader.load() is factory.return_value
+    loader.start()
+    loader.load()
+
+    factory.assert_called_once()
+
+def test_background_classifier_load_failure():
+    """Test that a failed load is reported and every use raises ModelNotReady."""
+    loader = BackgroundClassifier(MagicMock(side_effect=OSError("model.keras not found")))
+    loader.load()
+
+    assert loader.status == "failed"
+    assert isinstance(loader.error, OSError)
+    assert loader.model is None
+    with pytest.raises(ModelNotReady, match="model.keras not found"):
+        loader.predict_async
+
+def test_background_classifier_close():
+    """Test that close releases the loaded classifier and is a no-op before loading."""
+    BackgroundClassifier(MagicMock()).close()
+
+    factory = MagicMock()
+    loader = BackgroundClassifier(factory)
+    loader.load()
+    loader.close()
+    factory.return_value.close.assert_called_once()
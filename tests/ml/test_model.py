@@ -2,10 +2,18 @@ import pytest
 import numpy as np
 from unittest.mock import patch, MagicMock
 import io
+import os
+import sys
+import time
+import threading
+import asyncio
 from PIL import Image
+from prometheus_client import REGISTRY
 
 # Import the WasteClassifier class (will use mocked dependencies from config)
-from ml.model import WasteClassifier
+from ml.model import (WasteClassifier, BatchingEngine, decode_image, select_decoder, DECODERS,
+                      PillowDecoder, OpenCVDecoder, TurboJPEGDecoder, KerasBackend, TFLiteBackend, load_backend,
+                      resolve_backend, encode_raw_tensor, decode_raw_tensor, RAW_TENSOR_HEADER)
 
 @pytest.fixture
 def waste_classifier():
@@ -23,34 +31,163 @@ def sample_image_data():
     img.save(img_byte_arr, format='JPEG')
     return img_byte_arr.getvalue()
 
+def keras_preprocess_reference(img_array):
+    """ResNet50 preprocess_input ("caffe" mode) as keras implements it: RGB -> BGR, minus ImageNet means."""
+    img_array = np.expand_dims(img_array.astype(np.float32), axis=0)[..., ::-1]
+    return img_array - np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
 def test_preprocess_image(waste_classifier, sample_image_data):
     """Test the preprocess_image method."""
-    with patch('ml.model.image.load_img') as mock_load_img, \
-         patch('ml.model.image.img_to_array') as mock_img_to_array, \
-         patch('ml.model.preprocess_input') as mock_preprocess_input:
-        
-        # Configure mocks
-        mock_img = MagicMock()
-        mock_load_img.return_value = mock_img
-        mock_array = np.zeros((224, 224, 3))
-        mock_img_to_array.return_value = mock_array
-        mock_processed = np.zeros((1, 224, 224, 3))
-        mock_preprocess_input.return_value = mock_processed
-
+    decoded = np.random.default_rng(0).integers(0, 256, (224, 224, 3), dtype=np.uint8)
+    with patch.object(waste_classifier.decoder, 'decode', return_value=decoded) as mock_decode_image:
         # Call the method
         result = waste_classifier.preprocess_image(sample_image_data)
 
-        # Assertions
-        mock_load_img.assert_called_once()
-        mock_img_to_array.assert_called_once_with(mock_img)
-        mock_preprocess_input.assert_called_once()
-        assert result.shape == (1, 224, 224, 3)
-        np.testing.assert_array_equal(result, mock_processed)
+    # Assertions
+    mock_decode_image.assert_called_once_with(sample_image_data)
+    assert result.shape == (1, 224, 224, 3)
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, keras_preprocess_reference(decoded), rtol=0, atol=1e-4)
+
+def test_preprocess_reuses_input_buffer(waste_classifier, sample_image_data):
+    """Test that repeated preprocessing writes into the same preallocated buffer."""
+    first = waste_classifier.preprocess_image(sample_image_data)
+    second = waste_classifier.preprocess_image(sample_image_data)
+    batch = waste_classifier.preprocess_batch([sample_image_data, sample_image_data])
+    again = waste_classifier.preprocess_batch([sample_image_data, sample_image_data])
+
+    assert np.shares_memory(first, second)
+    assert np.shares_memory(batch, again)
+    assert batch.flags['C_CONTIGUOUS']
+    # One buffer for batch 1, grown once for batch 2
+    assert waste_classifier.get_preprocess_stats() == {'buffer_allocations': 2, 'images_preprocessed': 6}
+
+def test_preprocess_buffers_are_per_thread(waste_classifier, sample_image_data):
+    """Test that concurrent workers never share an input buffer."""
+    results = {}
+
+    def worker(name):
+        results[name] = waste_classifier.preprocess_image(sample_image_data)
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not np.shares_memory(results['a'], results['b'])
+    assert waste_classifier.get_preprocess_stats()['buffer_allocations'] == 2
+
+def encode_image(img, format):
+    buffer = io.BytesIO()
+    img.save(buffer, format=format)
+    return buffer.getvalue()
+
+def smooth_image(width, height, mode='RGB'):
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    pixels = np.concatenate([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGB').convert(mode)
+
+def test_decode_image_large_jpeg_uses_draft():
+    """Test that large JPEGs are decoded at reduced resolution close to 224 px."""
+    image_data = encode_image(smooth_image(4000, 3000), 'JPEG')
+    with patch.object(Image.Image, 'resize', autospec=True, side_effect=Image.Image.resize) as mock_resize:
+        result = decode_image(image_data)
+
+    assert result.shape == (224, 224, 3)
+    assert result.dtype == np.uint8
+    # The final resize starts from the 1/8 scale DCT decode, not the 12 MP original
+    assert mock_resize.call_args[0][0].size == (500, 375)
+
+def test_decode_image_matches_full_decode():
+    """Test that the fast path stays close to a full-resolution decode and resize."""
+    image_data = encode_image(smooth_image(1600, 1200), 'JPEG')
+    reference = np.asarray(Image.open(io.BytesIO(image_data)).convert('RGB').resize((224, 224), Image.NEAREST))
+
+    result = decode_image(image_data)
+
+    assert np.abs(result.astype(np.int16) - reference).mean() < 3
+
+@pytest.mark.parametrize('mode', ['RGBA', 'L', 'P'])
+def test_decode_image_png_fallback(mode):
+    """Test that PNGs in other modes are converted to RGB and resized."""
+    image_data = encode_image(smooth_image(640, 480, mode), 'PNG')
+    result = decode_image(image_data)
+    assert result.shape == (224, 224, 3)
+    assert result.dtype == np.uint8
+
+def test_decode_image_invalid_data():
+    """Test that undecodable bytes raise an error."""
+    with pytest.raises(Exception):
+        decode_image(b'not an image')
+
+def load_img_reference(image_data):
+    """The original pipeline: keras load_img (full decode, nearest resize) then preprocess_input."""
+    img = Image.open(io.BytesIO(image_data)).convert('RGB').resize((224, 224), Image.NEAREST)
+    return keras_preprocess_reference(np.asarray(img))
+
+@pytest.mark.parametrize('format', ['JPEG', 'PNG'])
+def test_pre_resized_input_skips_resampling(waste_classifier, format):
+    """Test that 224x224 uploads are not resampled and match the load_img pipeline exactly."""
+    image_data = encode_image(smooth_image(224, 224), format)
+    with patch.object(Image.Image, 'resize') as mock_resize, \
+         patch.object(Image.Image, 'reduce') as mock_reduce, \
+         patch.object(Image.Image, 'draft') as mock_draft:
+        result = waste_classifier.preprocess_image(image_data)
+
+    mock_resize.assert_not_called()
+    mock_reduce.assert_not_called()
+    mock_draft.assert_not_called()
+    np.testing.assert_allclose(result, load_img_reference(image_data), rtol=0, atol=1e-4)
+
+def test_pre_resized_input_converts_mode(waste_classifier):
+    """Test that a 224x224 grayscale PNG still becomes RGB like load_img does."""
+    image_data = encode_image(smooth_image(224, 224, 'L'), 'PNG')
+    result = waste_classifier.preprocess_image(image_data)
+    np.testing.assert_allclose(result, load_img_reference(image_data), rtol=0, atol=1e-4)
+
+def test_raw_tensor_matches_image_path(waste_classifier):
+    """Test that a raw tensor upload preprocesses exactly like the same pixels as a PNG."""
+    pixels = np.random.default_rng(0).integers(0, 256, (224, 224, 3), dtype=np.uint8)
+    png = encode_image(Image.fromarray(pixels), 'PNG')
+    with patch.object(waste_classifier.decoder, 'decode', wraps=waste_classifier.decoder.decode) as mock_decode:
+        from_tensor = waste_classifier.preprocess_image(encode_raw_tensor(pixels)).copy()
+        mock_decode.assert_not_called()
+    from_png = waste_classifier.preprocess_image(png)
+
+    np.testing.assert_array_equal(from_tensor, from_png)
+    np.testing.assert_allclose(from_tensor, keras_preprocess_reference(pixels), rtol=0, atol=1e-4)
+
+def test_raw_tensor_other_size_is_resized_like_images():
+    """Test that a raw tensor of another size goes through the same nearest-neighbour resize."""
+    pixels = np.asarray(smooth_image(640, 480))
+    result = decode_raw_tensor(encode_raw_tensor(pixels))
+    np.testing.assert_array_equal(result, decode_image(encode_image(Image.fromarray(pixels), 'PNG')))
+
+def test_raw_tensor_batch(waste_classifier):
+    """Test that raw tensors and encoded images can be mixed in one batch."""
+    pixels = np.random.default_rng(0).integers(0, 256, (224, 224, 3), dtype=np.uint8)
+    png = encode_image(Image.fromarray(pixels), 'PNG')
+    batch = waste_classifier.preprocess_batch([encode_raw_tensor(pixels), png])
+    np.testing.assert_array_equal(batch[0], batch[1])
+
+@pytest.mark.parametrize('data', [
+    encode_raw_tensor(np.zeros((224, 224, 3), dtype=np.uint8))[:-1],
+    RAW_TENSOR_HEADER.pack(b'WCT1', 224, 224, 4) + bytes(224 * 224 * 4),
+    b'WCT1\x00\x01',
+    RAW_TENSOR_HEADER.pack(b'WCT1', 0, 224, 3),
+    RAW_TENSOR_HEADER.pack(b'WCT1', 224, 0, 3),
+], ids=['truncated', 'channels', 'short_header', 'zero_height', 'zero_width'])
+def test_raw_tensor_invalid(data):
+    """Test that truncated tensors, short headers, empty sizes or the wrong channel count are rejected."""
+    with pytest.raises(ValueError):
+        decode_raw_tensor(data)
 
 def test_predict(waste_classifier, sample_image_data):
     """Test the predict method."""
     with patch.object(waste_classifier, 'preprocess_image') as mock_preprocess, \
-         patch.object(waste_classifier.model, 'predict') as mock_predict:
+         patch.object(waste_classifier.backend, 'predict') as mock_predict:
         
         # Configure mocks
         mock_preprocess.return_value = np.zeros((1, 224, 224, 3))
@@ -71,6 +208,19 @@ def test_predict(waste_classifier, sample_image_data):
             'recycle': 10.0
         }
 
+def test_predict_records_stage_metrics(waste_classifier, sample_image_data):
+    """Test that decode, preprocess and inference are each observed once per prediction."""
+    waste_classifier.backend = MagicMock()
+    waste_classifier.backend.predict.return_value = np.array([[0.1, 0.2, 0.3, 0.4]], dtype=np.float32)
+    stages = ('decode', 'preprocess', 'inference')
+    before = {stage: REGISTRY.get_sample_value(f'waste_classification_{stage}_seconds_count') for stage in stages}
+
+    waste_classifier.predict(sample_image_data)
+    waste_classifier.predict_batch([sample_image_data, sample_image_data])
+
+    counts = {stage: REGISTRY.get_sample_value(f'waste_classification_{stage}_seconds_count') - before[stage] for stage in stages}
+    assert counts == {'decode': 3, 'preprocess': 3, 'inference': 2}
+
 def test_predict_invalid_image_data(waste_classifier):
     """Test predict method with invalid image data."""
     with patch.object(waste_classifier, 'preprocess_image') as mock_preprocess:
@@ -78,4 +228,300 @@ def test_predict_invalid_image_data(waste_classifier):
         
         # Test that exception is raised
         with pytest.raises(Exception, match="Invalid image data"):
-            waste_classifier.predict(b'invalid_data')
\ No newline at end of file
+            waste_classifier.predict(b'invalid_data')
+
+def test_batching_engine_stacks_concurrent_requests():
+    """Test that concurrent submissions are run as one stacked forward pass."""
+    infer_fn = MagicMock(side_effect=lambda batch: batch.reshape(len(batch), -1)[:, :4] + 1)
+    engine = BatchingEngine(infer_fn, max_batch_size=4, max_wait_ms=200, target_latency_ms=1000)
+    try:
+        inputs = [np.full((2, 2, 1), i, dtype=np.float32) for i in range(4)]
+        futures = [engine.submit(x) for x in inputs]
+        results = [f.result(timeout=5) for f in futures]
+
+        infer_fn.assert_called_once()
+        assert infer_fn.call_args[0][0].shape == (4, 2, 2, 1)
+        for i, result in enumerate(results):
+            np.testing.assert_array_equal(result, np.full(4, i + 1))
+        assert engine.get_stats()["requests_served"] == 4
+    finally:
+        engine.stop()
+
+def test_batching_engine_propagates_errors():
+    """Test that a failed forward pass is raised to every caller in the batch."""
+    engine = BatchingEngine(MagicMock(side_effect=Exception("Model prediction error")), max_wait_ms=0)
+    try:
+        with pytest.raises(Exception, match="Model prediction error"):
+            engine.infer(np.zeros((224, 224, 3)))
+    finally:
+        engine.stop()
+
+def test_batching_engine_submit_after_stop_fails_future():
+    """Test that submissions racing stop() get a failed future instead of being stranded in the queue."""
+    engine = BatchingEngine(MagicMock(), max_wait_ms=0)
+    engine.stop()
+
+    future = engine.submit(np.zeros((2, 2, 1)))
+    with pytest.raises(RuntimeError, match="stopped"):
+        future.result(timeout=1)
+    assert engine._queue.empty()
+
+def test_batching_engine_adapts_window_to_latency_target():
+    """Test that the batching window shrinks when inference eats the latency budget."""
+    engine = BatchingEngine(MagicMock(), max_wait_ms=20, target_latency_ms=50)
+    try:
+        engine._adapt(0.010)
+        assert engine.window == pytest.approx(0.020)
+        engine.batches_run = 1
+        for _ in range(50):
+            engine._adapt(0.060)
+        assert engine.window == 0.0
+    finally:
+        engine.stop()
+
+def test_batching_engine_after_fork():
+    """Test that after_fork starts a fresh collector thread that serves new requests."""
+    infer_fn = MagicMock(side_effect=lambda batch: batch.reshape(len(batch), -1)[:, :4])
+    engine = BatchingEngine(infer_fn, max_wait_ms=0)
+    old_thread, old_queue = engine._thread, engine._queue
+    try:
+        engine.after_fork()
+        assert engine._thread is not old_thread
+        assert engine._thread.is_alive()
+        np.testing.assert_array_equal(engine.infer(np.ones((2, 2, 1))), np.ones(4))
+    finally:
+        engine.stop()
+        old_queue.put(None)
+        old_thread.join(timeout=5)
+
+def test_predict_with_batching(sample_image_data):
+    """Test that predict routes through the batching engine when enabled."""
+    classifier = WasteClassifier(model_path='dummy_path', batching=True)
+    classifier.backend.predict = MagicMock(return_value=np.array([[0.1, 0.1, 0.1, 0.7]]))
+    try:
+        with patch.object(classifier, 'preprocess_image', return_value=np.zeros((1, 224, 224, 3))):
+            predicted_class, _ = classifier.predict(sample_image_data)
+        assert predicted_class == 'recycle'
+        assert classifier.backend.predict.call_args[0][0].shape == (1, 224, 224, 3)
+    finally:
+        classifier.close()
+
+def test_predict_async(waste_classifier, sample_image_data):
+    """Test that predict_async runs predict on the inference executor."""
+    with patch.object(waste_classifier, 'predict', return_value=('other', {})) as mock_predict:
+        result = asyncio.run(waste_classifier.predict_async(sample_image_data))
+
+    assert result == ('other', {})
+    mock_predict.assert_called_once_with(sample_image_data)
+
+def test_predict_batch(waste_classifier, sample_image_data):
+    """Test that predict_batch runs one forward pass over a contiguous batch."""
+    with patch.object(waste_classifier.decoder, 'decode', return_value=np.zeros((224, 224, 3), dtype=np.uint8)), \
+         patch.object(waste_classifier.backend, 'predict') as mock_predict:
+        mock_predict.return_value = np.array([[0.7, 0.1, 0.1, 0.1], [0.1, 0.1, 0.1, 0.7]])
+
+        results = waste_classifier.predict_batch([sample_image_data, sample_image_data])
+
+    mock_predict.assert_called_once()
+    batch = mock_predict.call_args[0][0]
+    assert batch.shape == (2, 224, 224, 3)
+    assert batch.dtype == np.float32
+    assert batch.flags['C_CONTIGUOUS']
+    assert [predicted_class for predicted_class, _ in results] == ['hazardous', 'recycle']
+    assert results[1][1]['recycle'] == pytest.approx(70.0)
+
+def test_compiled_infer_fn_uses_fixed_signature():
+    """Test that the compiled path wraps the model in a tf.function with a fixed input signature."""
+    mock_tf = MagicMock()
+    mock_tf.function.return_value = lambda fn: fn
+    with patch.dict(sys.modules, {'tensorflow': mock_tf}):
+        backend = KerasBackend('dummy_path', compiled=True, jit_compile=True)
+        backend.model = MagicMock(return_value=MagicMock(numpy=MagicMock(return_value=np.array([[0.1, 0.7, 0.1, 0.1]]))))
+
+        prediction = backend.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+
+    _, kwargs = mock_tf.function.call_args
+    assert kwargs['jit_compile'] is True
+    assert kwargs['input_signature'] is not None
+    backend.model.assert_called_once()
+    assert backend.model.call_args[1] == {'training': False}
+    np.testing.assert_array_equal(prediction, np.array([[0.1, 0.7, 0.1, 0.1]]))
+
+def test_uncompiled_infer_fn_uses_keras_predict():
+    """Test that disabling compilation falls back to keras Model.predict."""
+    backend = KerasBackend('dummy_path', compiled=False)
+    assert backend._infer_fn == backend.model.predict
+
+def test_warmup_runs_dummy_batch():
+    """Test that the model is warmed up with a batch-1 zero tensor at load time."""
+    with patch.object(KerasBackend, 'predict') as mock_infer:
+        WasteClassifier(model_path='dummy_path', warmup=True)
+
+    mock_infer.assert_called_once()
+    batch = mock_infer.call_args[0][0]
+    assert batch.shape == (1, 224, 224, 3)
+    assert not batch.any()
+
+def test_load_backend_selection():
+    """Test that the backend comes from the argument, MODEL_BACKEND or the file extension."""
+    with patch('ml.model.TFLiteBackend') as mock_tflite, patch.dict(os.environ, {}, clear=False):
+        os.environ.pop('MODEL_BACKEND', None)
+        os.environ.pop('MODEL_PATH', None)
+        backend, model_path = load_backend('model.tflite')
+        assert backend is mock_tflite.return_value
+        assert model_path == 'model.tflite'
+
+        backend, model_path = load_backend(backend='keras')
+        assert isinstance(backend, KerasBackend)
+        assert model_path == 'ml/model/model.keras'
+
+        os.environ['MODEL_BACKEND'] = 'tflite'
+        backend, model_path = load_backend()
+        mock_tflite.assert_called_with('ml/model/model.tflite')
+
+    with pytest.raises(ValueError, match="Unknown model backend"):
+        load_backend('dummy_path', backend='onnx')
+
+def test_keras_backend_loads_mapped_weights():
+    """Test that a .json manifest is loaded through the memory-mapped weight format."""
+    with patch('ml.model.load_mapped_model') as mock_load_mapped, \
+         patch('tensorflow.keras.models.load_model') as mock_load_model:
+        backend, model_path = load_backend('ml/model/model.json', compiled=False)
+
+    assert backend.name == 'keras'
+    mock_load_mapped.assert_called_once_with('ml/model/model.json')
+    mock_load_model.assert_not_called()
+    assert backend.model is mock_load_mapped.return_value
+
+def test_resolve_backend_does_not_load():
+    """Test that resolve_backend picks a backend and model path without loading the model."""
+    with patch('ml.model.TFLiteBackend') as mock_tflite, patch.dict(os.environ, {}, clear=False):
+        os.environ.pop('MODEL_BACKEND', None)
+        os.environ.pop('MODEL_PATH', None)
+        assert resolve_backend('model.tflite') == ('tflite', 'model.tflite')
+        assert resolve_backend() == ('keras', 'ml/model/model.keras')
+        mock_tflite.assert_not_called()
+
+def test_classifier_after_fork():
+    """Test that after_fork rebuilds the executor, batching thread and backend thread state."""
+    classifier = WasteClassifier(model_path='dummy_path', batching=True, warmup=False)
+    try:
+        with patch.object(classifier.backend, 'after_fork') as backend_after_fork, \
+             patch.object(classifier.executor, 'after_fork') as executor_after_fork, \
+             patch.object(classifier.batcher, 'after_fork') as batcher_after_fork:
+            classifier.after_fork()
+        backend_after_fork.assert_called_once()
+        executor_after_fork.assert_called_once()
+        batcher_after_fork.assert_called_once()
+    finally:
+        classifier.close()
+
+def test_tflite_backend_predict():
+    """Test that the TFLite backend resizes for new batch sizes and returns the output tensor."""
+    interpreter = MagicMock()
+    input_shape = np.array([1, 224, 224, 3])
+    interpreter.get_input_details.side_effect = lambda: [{'index': 0, 'shape': input_shape, 'dtype': np.float32}]
+    interpreter.get_output_details.return_value = [{'index': 7, 'dtype': np.float32}]
+    interpreter.get_tensor.return_value = np.array([[0.1, 0.7, 0.1, 0.1], [0.7, 0.1, 0.1, 0.1]])
+
+    with patch('ml.model._tflite_interpreter_class', return_value=MagicMock(return_value=interpreter)):
+        classifier = WasteClassifier(model_path='model.tflite', warmup=False)
+        assert classifier.backend.name == 'tflite'
+        assert classifier.model is interpreter
+
+        with patch.object(classifier.decoder, 'decode', return_value=np.zeros((224, 224, 3), dtype=np.uint8)):
+            results = classifier.predict_batch([b'a', b'b'])
+
+    interpreter.resize_tensor_input.assert_called_once_with(0, [2, 224, 224, 3])
+    interpreter.invoke.assert_called_once()
+    assert interpreter.set_tensor.call_args[0][1].shape == (2, 224, 224, 3)
+    interpreter.get_tensor.assert_called_once_with(7)
+    assert [predicted_class for predicted_class, _ in results] == ['organic', 'hazardous']
+
+def test_tflite_backend_after_fork():
+    """Test that interpreters created before a fork are not reused by the child."""
+    interpreters = [MagicMock(), MagicMock()]
+    with patch('ml.model._tflite_interpreter_class', return_value=MagicMock(side_effect=interpreters)):
+        backend = TFLiteBackend('model.tflite')
+        assert backend._interpreter() is interpreters[0]
+        backend.after_fork()
+        assert backend._interpreter() is interpreters[1]
+    assert TFLiteBackend.fork_safe and not KerasBackend.fork_safe
+
+def decoder_params():
+    return [
+        pytest.param(name, marks=pytest.mark.skipif(not decoder.available(), reason=f"{name} is not installed"))
+        for name, decoder in DECODERS.items()
+    ]
+
+@pytest.mark.parametrize('name', decoder_params())
+@pytest.mark.parametrize('size,format', [((4000, 3000), 'JPEG'), ((640, 480), 'JPEG'), ((224, 224), 'JPEG'), ((640, 480), 'PNG')])
+def test_decoder_backends_share_contract(name, size, format):
+    """Test that every installed backend returns the same uint8 HWC RGB contract as Pillow."""
+    image_data = encode_image(smooth_image(*size), format)
+    result = DECODERS[name]().decode(image_data)
+
+    assert result.shape == (224, 224, 3)
+    assert result.dtype == np.uint8
+    assert result.flags['C_CONTIGUOUS']
+    reference = PillowDecoder().decode(image_data)
+    assert np.abs(result.astype(np.int16) - reference).mean() < 4
+
+@pytest.mark.parametrize('name', decoder_params())
+@pytest.mark.parametrize('size', [(4000, 3000), (640, 480)])
+def test_decoder_backends_ignore_exif_orientation(name, size):
+    """Test that an EXIF-rotated JPEG (Orientation=6) decodes to the same stored pixels as Pillow."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    smooth_image(*size).save(buffer, format='JPEG', exif=exif)
+    image_data = buffer.getvalue()
+
+    result = DECODERS[name]().decode(image_data)
+    reference = PillowDecoder().decode(image_data)
+    assert np.abs(result.astype(np.int16) - reference).mean() < 4
+
+def test_select_decoder_explicit():
+    """Test selecting a backend by name."""
+    assert isinstance(select_decoder('pillow'), PillowDecoder)
+    with pytest.raises(ValueError, match="Unknown image decoder"):
+        select_decoder('gif2png')
+
+def test_select_decoder_unavailable():
+    """Test that asking for a backend that is not installed fails loudly."""
+    with patch.object(TurboJPEGDecoder, 'available', return_value=False):
+        with pytest.raises(RuntimeError, match="not installed"):
+            select_decoder('turbojpeg')
+
+def test_select_decoder_auto_picks_fastest():
+    """Test that auto-selection benchmarks installed backends and picks the fastest."""
+    class SlowDecoder(PillowDecoder):
+        name = 'slow'
+
+        def decode(self, image_data, target_size=(224, 224)):
+            time.sleep(0.005)
+            return super().decode(image_data, target_size)
+
+    with patch.dict('ml.model.DECODERS', {'slow': SlowDecoder, 'pillow': PillowDecoder}, clear=True):
+        assert type(select_decoder('auto', runs=2)) is PillowDecoder
+
+def test_select_decoder_auto_falls_back_to_pillow():
+    """Test that Pillow is used when every other backend is unavailable."""
+    with patch.object(OpenCVDecoder, 'available', return_value=False), \
+         patch.object(TurboJPEGDecoder, 'available', return_value=False):
+        assert isinstance(select_decoder('auto'), PillowDecoder)
+
+def test_tflite_backend_int8_quantization():
+    """Test that full-int8 models get quantized inputs and dequantized outputs."""
+    input_detail = {'dtype': np.int8, 'quantization': (0.5, -10)}
+    quantized = TFLiteBackend._quantize(np.array([[0.0, 5.0, 1000.0, -1000.0]], dtype=np.float32), input_detail)
+    assert quantized.dtype == np.int8
+    np.testing.assert_array_equal(quantized, [[-10, 0, 127, -128]])
+
+    output_detail = {'dtype': np.int8, 'quantization': (1 / 256, -128)}
+    dequantized = TFLiteBackend._dequantize(np.array([[-128, 127]], dtype=np.int8), output_detail)
+    np.testing.assert_allclose(dequantized, [[0.0, 255 / 256]])
+
+    float_detail = {'dtype': np.float32, 'quantization': (0.0, 0)}
+    output = np.array([[0.25, 0.75]], dtype=np.float32)
+    assert TFLiteBackend._dequantize(output, float_detail) is output
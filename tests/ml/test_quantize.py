@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+from unittest.mock import patch, MagicMock
+from PIL import Image
+from ml.quantize import load_calibration_images, representative_dataset, top1_agreement, build_report
+
+@pytest.fixture
+def calibration_folder(tmp_path):
+    """Fixture to create a calibration folder with a JPEG, a nested PNG and a non-image file."""
+    Image.new('RGB', (320, 240), color='red').save(tmp_path / 'a.jpg')
+    (tmp_path / 'nested').mkdir()
+    Image.new('RGB', (224, 224), color='blue').save(tmp_path / 'nested' / 'b.png')
+    (tmp_path / 'labels.txt').write_text('not an image')
+    return tmp_path
+
+def test_load_calibration_images(calibration_folder):
+    """Test that calibration images are preprocessed like serving inputs."""
+    batch = load_calibration_images(str(calibration_folder))
+
+    assert batch.shape == (2, 224, 224, 3)
+    assert batch.dtype == np.float32
+    # Pure red in BGR order minus the ImageNet means
+    np.testing.assert_allclose(batch[0, 0, 0], [0 - 103.939, 0 - 116.779, 254 - 123.68], atol=2)
+
+def test_load_calibration_images_empty(tmp_path):
+    """Test that an empty calibration folder is rejected."""
+    with pytest.raises(ValueError, match="No calibration images"):
+        load_calibration_images(str(tmp_path))
+
+def test_representative_dataset():
+    """Test that the representative dataset yields one batch-1 sample per image."""
+    batch = np.zeros((3, 224, 224, 3), dtype=np.float32)
+    samples = list(representative_dataset(batch)())
+    assert len(samples) == 3
+    assert samples[0][0].shape == (1, 224, 224, 3)
+
+def test_top1_agreement():
+    """Test top-1 agreement between two prediction sets."""
+    reference = np.array([[0.9, 0.1], [0.2, 0.8], [0.6, 0.4], [0.3, 0.7]])
+    candidate = np.array([[0.8, 0.2], [0.3, 0.7], [0.4, 0.6], [0.1, 0.9]])
+    assert top1_agreement(reference, candidate) == 0.75
+
+def test_build_report(tmp_path):
+    """Test that every variant is loaded through WasteClassifier and compared with the float model."""
+    for name in ('model.keras', 'model_int8.tflite'):
+        (tmp_path / name).write_bytes(b'\x00' * 1024)
+    batch = np.zeros((2, 224, 224, 3), dtype=np.float32)
+    outputs = {
+        'keras': [np.array([[0.9, 0.1, 0, 0]]), np.array([[0.1, 0.9, 0, 0]])],
+        'tflite': [np.array([[0.8, 0.2, 0, 0]]), np.array([[0.6, 0.4, 0, 0]])],
+    }
+
+    def make_classifier(model_path, backend, **kwargs):
+        classifier = MagicMock()
+        classifier._predict_batch.side_effect = lambda img_batch: outputs[backend][int(classifier._predict_batch.call_count > 1)]
+        return classifier
+
+    with patch('ml.quantize.WasteClassifier', side_effect=make_classifier):
+        report = build_report({
+            'float': (str(tmp_path / 'model.keras'), 'keras'),
+            'full_int8': (str(tmp_path / 'model_int8.tflite'), 'tflite'),
+        }, batch, runs=4)
+
+    assert report['calibration_images'] == 2
+    assert report['models']['float']['top1_agreement'] == 1.0
+    assert report['models']['full_int8']['top1_agreement'] == 0.5
+    assert report['models']['full_int8']['size_bytes'] == 1024
+    assert report['models']['full_int8']['p50_ms'] >= 0
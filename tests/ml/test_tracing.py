@@ -0,0 +1,50 @@
+import asyncio
+import time
+from ml import tracing
+from ml.executor import InferenceExecutor
+
+def test_stage_without_trace_is_noop():
+    """Test that stages outside a request record nothing and do not fail."""
+    assert tracing.current_trace() is None
+    with tracing.stage("decode"):
+        pass
+    tracing.record("inference", time.perf_counter(), 0.01)
+
+def test_stages_are_recorded_with_offsets_and_aggregated():
+    """Test that repeated stages are summed per name in first-seen order."""
+    trace, token = tracing.start_trace()
+    try:
+        with tracing.stage("upload"):
+            time.sleep(0.01)
+        tracing.record("decode", time.perf_counter(), 0.002)
+        tracing.record("decode", time.perf_counter(), 0.003)
+    finally:
+        tracing.end_trace(token)
+
+    assert [name for name, _, _ in trace.stages] == ["upload", "decode", "decode"]
+    assert trace.stages[0][2] >= 0.01
+    assert trace.stages[1][1] >= trace.stages[0][2]
+    durations = trace.durations()
+    assert list(durations) == ["upload", "decode"]
+    assert abs(durations["decode"] - 0.005) < 1e-9
+    assert tracing.current_trace() is None
+
+def test_trace_follows_jobs_onto_executor_threads():
+    """Test that stages recorded on an inference thread land in the request's trace."""
+    executor = InferenceExecutor(kind="thread", max_workers=1)
+
+    def job():
+        with tracing.stage("inference"):
+            pass
+
+    async def request():
+        trace, token = tracing.start_trace()
+        try:
+            await executor.run(job)
+        finally:
+            tracing.end_trace(token)
+        return trace
+
+    trace = asyncio.run(request())
+    executor.shutdown()
+    assert [name for name, _, _ in trace.stages] == ["inference"]
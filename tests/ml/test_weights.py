@@ -0,0 +1,62 @@
+import json
+import pytest
+import numpy as np
+from unittest.mock import patch, MagicMock
+from ml.weights import write_mapped_weights, map_weights, load_mapped_model, weights_path_for, ALIGNMENT
+
+@pytest.fixture
+def fake_model():
+    """Fixture to create a model-like object with a few odd-sized weight tensors."""
+    arrays = [
+        np.arange(7 * 3 * 3, dtype=np.float32).reshape(7, 3, 3),
+        np.arange(5, dtype=np.float32) / 10,
+        np.array(3, dtype=np.int64),
+    ]
+    model = MagicMock()
+    model.weights = [MagicMock(path=f"layer_{i}/kernel") for i in range(len(arrays))]
+    model.get_weights.return_value = arrays
+    model.to_json.return_value = '{"class_name": "Functional"}'
+    return model, arrays
+
+def test_mapped_weights_round_trip(tmp_path, fake_model):
+    """Test that exported weights come back bit-identical as read-only views of one mapping."""
+    model, arrays = fake_model
+    manifest_path = str(tmp_path / "model.json")
+
+    write_mapped_weights(model, manifest_path)
+    architecture, mapped = map_weights(manifest_path)
+
+    assert architecture == '{"class_name": "Functional"}'
+    assert len(mapped) == len(arrays)
+    for original, array in zip(arrays, mapped):
+        np.testing.assert_array_equal(array, original)
+        assert array.dtype == original.dtype
+        assert not array.flags['WRITEABLE']
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    assert manifest["weights"] == "model.bin"
+    assert all(tensor["offset"] % ALIGNMENT == 0 for tensor in manifest["tensors"])
+    assert weights_path_for(manifest_path) == str(tmp_path / "model.bin")
+
+def test_map_weights_rejects_other_json(tmp_path):
+    """Test that an unrelated JSON file is not mistaken for a weight manifest."""
+    manifest_path = tmp_path / "config.json"
+    manifest_path.write_text('{"class_name": "Functional"}')
+
+    with pytest.raises(ValueError, match="not a waste-classification-mmap"):
+        map_weights(str(manifest_path))
+
+def test_load_mapped_model(tmp_path, fake_model):
+    """Test that the model is rebuilt from its architecture and the mapped weights are bound to it."""
+    model, arrays = fake_model
+    manifest_path = str(tmp_path / "model.json")
+    write_mapped_weights(model, manifest_path)
+
+    with patch("tensorflow.keras.models.model_from_json", create=True) as model_from_json:
+        loaded = load_mapped_model(manifest_path)
+
+    model_from_json.assert_called_once_with('{"class_name": "Functional"}')
+    assert loaded is model_from_json.return_value
+    bound = loaded.set_weights.call_args[0][0]
+    for original, array in zip(arrays, bound):
+        np.testing.assert_array_equal(array, original)